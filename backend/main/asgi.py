@@ -10,11 +10,16 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 import os
 import logging
 
-from django.core.asgi import get_asgi_application
+import django
 
 logger = logging.getLogger(__name__)
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+django.setup(set_prefix=False)
+
+# Обработчик Django, отдающий тело запроса асинхронным представлениям
+# загрузки потоком (storage.asgi.streaming_body)
+from storage.asgi import StorageASGIHandler  # noqa: E402
 
 logger.info("Запуск ASGI приложения.")
-application = get_asgi_application()
+application = StorageASGIHandler()
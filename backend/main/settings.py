@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -83,6 +84,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'main.wsgi.application'
+ASGI_APPLICATION = 'main.asgi.application'
 
 
 # Database
@@ -162,7 +164,7 @@ if DEBUG:
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'storage.exceptions.custom_exception_handler',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'storage.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -174,13 +176,139 @@ REST_FRAMEWORK = {
     ),
     'SEARCH_PARAM': 'q',
     'ORDERING_PARAM': 'o',
-    # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    # 'PAGE_SIZE': 3
+    # Постраничный вывод задаётся во viewset-ах (storage.pagination)
 }
 
+# Размер страницы списков файлов и пользователей и его верхняя граница
+# для параметра page_size
+STORAGE_PAGE_SIZE = int(os.getenv('STORAGE_PAGE_SIZE', 100))
+STORAGE_MAX_PAGE_SIZE = int(os.getenv('STORAGE_MAX_PAGE_SIZE', 1000))
+
+# Кеш: общий для всех воркеров Redis (REDIS_URL), иначе память процесса.
+# С кешем в памяти процесса удаление токена в других воркерах вступает в силу
+# не позже чем через STORAGE_TOKEN_CACHE_TIMEOUT
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Время жизни кеша токен -> пользователь (секунды)
+STORAGE_TOKEN_CACHE_TIMEOUT = int(os.getenv('STORAGE_TOKEN_CACHE_TIMEOUT', 300))
+
 DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600
 FILE_UPLOAD_MAX_MEMORY_SIZE = 104857600  
 
+# Загрузка файлов по частям (api/files/uploads/)
+STORAGE_UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('STORAGE_UPLOAD_MAX_CHUNK_SIZE', 16 * 1024 * 1024))
+STORAGE_UPLOAD_MAX_FILE_SIZE = int(os.getenv('STORAGE_UPLOAD_MAX_FILE_SIZE', 0))  # 0 - без ограничений
+
+# Квота хранилища пользователя по умолчанию в байтах (0 - без ограничений),
+# для отдельного пользователя задаётся полем storage_quota
+STORAGE_DEFAULT_QUOTA = int(os.getenv('STORAGE_DEFAULT_QUOTA', 0))
+
+# Хранилище файлов пользователей:
+#   storage.backends.LocalStorage - локальный диск (MEDIA_ROOT)
+#   storage.backends.S3Storage - S3/MinIO (нужен пакет boto3), скачивание по подписанной ссылке
+# Части загрузок, временные файлы и кеш миниатюр всегда остаются на локальном диске
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'storage.backends.LocalStorage')
+STORAGE_S3_BUCKET = os.getenv('STORAGE_S3_BUCKET', '')
+STORAGE_S3_ENDPOINT_URL = os.getenv('STORAGE_S3_ENDPOINT_URL', '')  # для MinIO: http://minio:9000
+STORAGE_S3_REGION = os.getenv('STORAGE_S3_REGION', '')
+STORAGE_S3_ACCESS_KEY = os.getenv('STORAGE_S3_ACCESS_KEY', '')
+STORAGE_S3_SECRET_KEY = os.getenv('STORAGE_S3_SECRET_KEY', '')
+STORAGE_S3_PREFIX = os.getenv('STORAGE_S3_PREFIX', '')
+STORAGE_S3_URL_EXPIRE = int(os.getenv('STORAGE_S3_URL_EXPIRE', 3600))  # срок подписанной ссылки, секунд
+
+# Сжатие содержимого в хранилище: '' - выключено, gzip, zstd (нужен пакет zstandard).
+# Сжимаются только файлы, начало которых заметно сжимается; изображения, архивы
+# и видео хранятся как есть. Квота считается по размеру на диске
+STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', '')
+STORAGE_COMPRESSION_LEVEL = int(os.getenv('STORAGE_COMPRESSION_LEVEL', 0))  # 0 - уровень алгоритма по умолчанию
+STORAGE_COMPRESSION_MIN_SIZE = int(os.getenv('STORAGE_COMPRESSION_MIN_SIZE', 4096))
+# Наибольшая доля от исходного размера, при которой файл стоит сжимать
+STORAGE_COMPRESSION_MAX_RATIO = float(os.getenv('STORAGE_COMPRESSION_MAX_RATIO', 0.9))
+
+# Размер блока при потоковой отдаче файлов (ограничен от 4 Кб до 8 Мб)
+STORAGE_STREAM_CHUNK_SIZE = int(os.getenv('STORAGE_STREAM_CHUNK_SIZE', 256 * 1024))
+
+# Способ отдачи файлов:
+#   storage.delivery.PythonDelivery - через воркер Django
+#   storage.delivery.SendfileDelivery - через воркер Django без копирования (os.sendfile)
+#   storage.delivery.XAccelRedirectDelivery - Nginx (internal location на MEDIA_ROOT)
+#   storage.delivery.XSendfileDelivery - Apache mod_xsendfile и совместимые
+STORAGE_DELIVERY_BACKEND = os.getenv('STORAGE_DELIVERY_BACKEND', 'storage.delivery.PythonDelivery')
+STORAGE_X_ACCEL_REDIRECT_LOCATION = os.getenv('STORAGE_X_ACCEL_REDIRECT_LOCATION', '/protected-media/')
+
+# Cache-Control для отдаваемых файлов. Файлы не изменяются после загрузки,
+# поэтому клиент может хранить копию и проверять её по ETag (ответ 304)
+STORAGE_PRIVATE_CACHE_CONTROL = os.getenv('STORAGE_PRIVATE_CACHE_CONTROL', 'private, no-cache')
+STORAGE_SHARED_LINK_CACHE_CONTROL = os.getenv('STORAGE_SHARED_LINK_CACHE_CONTROL', 'public, max-age=3600')
+
+# Статистика скачиваний (last_download_date, download_count) копится в памяти
+# и записывается одним запросом раз в интервал (секунды). Больше интервал -
+# меньше нагрузка на БД, но больше событий теряется при падении процесса;
+# 0 - запись сразу в каждом запросе
+STORAGE_DOWNLOAD_FLUSH_INTERVAL = float(os.getenv('STORAGE_DOWNLOAD_FLUSH_INTERVAL', 5))
+STORAGE_DOWNLOAD_BUFFER_MAX = int(os.getenv('STORAGE_DOWNLOAD_BUFFER_MAX', 1000))
+
+# Подписанные ссылки на скачивание (api/files/signed/...): время жизни по
+# умолчанию и максимальное, в секундах
+STORAGE_SIGNED_URL_TTL = int(os.getenv('STORAGE_SIGNED_URL_TTL', 3600))
+STORAGE_SIGNED_URL_MAX_TTL = int(os.getenv('STORAGE_SIGNED_URL_MAX_TTL', 7 * 24 * 3600))
+# IP клиента для привязки ссылок (?bind_ip=1) берётся из X-Real-IP только
+# за доверенным прокси (Nginx), который сам выставляет этот заголовок;
+# иначе клиент подделал бы его, и используется REMOTE_ADDR
+STORAGE_TRUST_X_REAL_IP = os.getenv('STORAGE_TRUST_X_REAL_IP', 'False') == 'True'
+
+# Скачивание нескольких файлов одним ZIP-архивом (api/files/archive/):
+# stored - без сжатия, deflated - сжимать всё, auto - не сжимать уже
+# сжатые форматы (изображения, видео, архивы)
+STORAGE_ARCHIVE_COMPRESSION = os.getenv('STORAGE_ARCHIVE_COMPRESSION', 'auto')
+STORAGE_ARCHIVE_MAX_FILES = int(os.getenv('STORAGE_ARCHIVE_MAX_FILES', 1000))
+
+# Фоновое удаление файлов с диска (storage/deletion.py): интервал разбора
+# очереди в секундах (0 - сразу после фиксации транзакции), размер пачки
+# и число попыток для файлов, которые не удаётся удалить
+STORAGE_DELETION_INTERVAL = float(os.getenv('STORAGE_DELETION_INTERVAL', 10))
+STORAGE_DELETION_BATCH_SIZE = int(os.getenv('STORAGE_DELETION_BATCH_SIZE', 500))
+STORAGE_DELETION_MAX_ATTEMPTS = int(os.getenv('STORAGE_DELETION_MAX_ATTEMPTS', 5))
+
+# Очередь фоновых задач (storage/jobs.py, воркер manage.py run_jobs).
+# Без воркера задачи выполняет фоновый поток процесса веб-сервера: ответ их
+# не ждёт, но при аварийном завершении процесса невыполненные задачи теряются
+STORAGE_JOBS_ENABLED = os.getenv('STORAGE_JOBS_ENABLED', 'False') == 'True'
+STORAGE_JOB_WORKERS = int(os.getenv('STORAGE_JOB_WORKERS', os.cpu_count() or 1))
+STORAGE_JOB_MAX_ATTEMPTS = int(os.getenv('STORAGE_JOB_MAX_ATTEMPTS', 5))
+STORAGE_JOB_RETRY_DELAY = int(os.getenv('STORAGE_JOB_RETRY_DELAY', 10))  # секунд, удваивается с каждой попыткой
+STORAGE_JOB_TIMEOUT = int(os.getenv('STORAGE_JOB_TIMEOUT', 3600))  # задача «зависла» и выдаётся снова
+STORAGE_JOB_RETENTION = int(os.getenv('STORAGE_JOB_RETENTION', 24 * 3600))  # хранение выполненных задач
+
+# Миниатюры (api/files/{id}/thumbnail/?size=): допустимые размеры в пикселях,
+# каталог кеша, его предельный размер в байтах (давно не использованные
+# миниатюры вытесняются) и размеры, создаваемые сразу после загрузки
+STORAGE_THUMBNAIL_SIZES = [int(size) for size in os.getenv('STORAGE_THUMBNAIL_SIZES', '64,256,1024').split(',')]
+STORAGE_THUMBNAIL_DEFAULT_SIZE = int(os.getenv('STORAGE_THUMBNAIL_DEFAULT_SIZE', 256))
+STORAGE_THUMBNAIL_DIR = os.getenv('STORAGE_THUMBNAIL_DIR', os.path.join(MEDIA_ROOT, 'derived', 'thumbnails'))
+STORAGE_THUMBNAIL_CACHE_SIZE = int(os.getenv('STORAGE_THUMBNAIL_CACHE_SIZE', 1024 * 1024 * 1024))
+STORAGE_THUMBNAIL_EAGER_SIZES = [int(size) for size in os.getenv('STORAGE_THUMBNAIL_EAGER_SIZES', '').split(',') if size]
+# Миниатюра зависит только от содержимого файла и не меняется
+STORAGE_THUMBNAIL_CACHE_CONTROL = os.getenv('STORAGE_THUMBNAIL_CACHE_CONTROL', 'private, max-age=31536000, immutable')
+
+# Раскладка файлов по подкаталогам (storage/layout.py): число уровней и
+# количество шестнадцатеричных символов ключа на уровень. После изменения
+# существующие файлы переносит команда reshard_storage
+STORAGE_SHARD_DEPTH = int(os.getenv('STORAGE_SHARD_DEPTH', 2))
+STORAGE_SHARD_WIDTH = int(os.getenv('STORAGE_SHARD_WIDTH', 2))
+
 CSRF_TRUSTED_ORIGINS = os.getenv('CSRF_TRUSTED_ORIGINS', '').split(',')
 CSRF_COOKIE_SECURE = False 
 CSRF_COOKIE_HTTPONLY = False
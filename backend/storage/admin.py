@@ -1,18 +1,27 @@
 import os
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.contrib.auth.admin import UserAdmin
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import path, reverse
 from django.utils.crypto import get_random_string
+from django.utils.decorators import method_decorator
 from django.utils.html import format_html
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.http import HttpResponseRedirect
 from django.conf import settings
+from django.db.models import Q
 from django import forms
-from django.utils import timezone
 from .forms import CustomUserCreationForm, CustomUserChangeForm
-from .models import CustomUser, File
+from . import jobs
+from .search import search_files
+from .backends import get_storage
+from .delivery import serve_stored_file
+from .models import CustomUser, File, Job
+from .tracking import download_tracker
+from .uploadhandlers import use_hashing_upload_handler
 import logging
 
 logger = logging.getLogger(__name__)
@@ -62,6 +71,7 @@ class CustomUserAdmin(admin.ModelAdmin):
         ('Файловое хранилище', {
             'fields': (
                 'storage_path', 
+                'storage_quota',
                 'file_count', 
                 'total_file_size_display',
                 'files_management_link'
@@ -88,7 +98,7 @@ class CustomUserAdmin(admin.ModelAdmin):
     
     def file_count(self, obj):
         """Количество файлов пользователя"""
-        return File.objects.filter(user=obj).count()
+        return obj.file_count
     file_count.short_description = 'Файлов'
     
     def total_file_size_display(self, obj):
@@ -167,8 +177,18 @@ class CustomUserAdmin(admin.ModelAdmin):
             'title': f'Управление файлами пользователя {user.username}'
         })
     
+    @method_decorator(csrf_exempt)
     def upload_file(self, request, user_id):
-        """Загрузка нового файла"""
+        """
+        Загрузка нового файла. Обработчик загрузки подменяется до разбора
+        тела запроса, а проверка CSRF читает request.POST, поэтому она
+        выполняется после подмены в _upload_file.
+        """
+        use_hashing_upload_handler(request)
+        return self._upload_file(request, user_id)
+
+    @method_decorator(csrf_protect)
+    def _upload_file(self, request, user_id):
         user = get_object_or_404(CustomUser, pk=user_id)
         
         if not request.user.is_staff and request.user != user:
@@ -178,6 +198,10 @@ class CustomUserAdmin(admin.ModelAdmin):
         if request.method == 'POST' and request.FILES.get('file'):
             uploaded_file = request.FILES['file']
             comment = request.POST.get('comment', '')
+
+            if not user.has_quota_for(uploaded_file.size):
+                messages.error(request, f'Недостаточно места в хранилище пользователя {user.username}')
+                return redirect(reverse('admin:storage_customuser_files', args=[user_id]))
             
             try:
                 file_obj = File(
@@ -188,6 +212,7 @@ class CustomUserAdmin(admin.ModelAdmin):
                     comment=comment
                 )
                 file_obj.save()
+                jobs.enqueue('process_upload', file_id=file_obj.pk)
                 
                 messages.success(request, f'Файл "{uploaded_file.name}" успешно загружен')
                 logger.info(f'Файл "{uploaded_file.name}" загружен пользователем {request.user.username} для пользователя {user.username}')
@@ -224,15 +249,12 @@ class CustomUserAdmin(admin.ModelAdmin):
             messages.error(request, 'У вас нет прав для скачивания этого файла')
             return redirect('admin:index')
 
-        file_obj.last_download_date = timezone.now()
-        file_obj.save()
-
-        from django.http import FileResponse
-        import os
-        
-        if file_obj.file_path and os.path.exists(file_obj.file_path.path):
-            response = FileResponse(file_obj.file_path.open('rb'))
-            response['Content-Disposition'] = f'attachment; filename="{file_obj.original_name}"'
+        if file_obj.file_path and get_storage().exists(file_obj.file_path.name):
+            response = serve_stored_file(request, file_obj.file_path.name, file_obj.original_name,
+                                         etag_key=file_obj.etag_key, encoding=file_obj.encoding,
+                                         size=file_obj.size)
+            if request.method == 'GET' and response.status_code != 304:
+                download_tracker.record(file_obj.pk)
             return response
         else:
             messages.error(request, 'Файл не найден на сервере')
@@ -271,14 +293,29 @@ class FileAdmin(admin.ModelAdmin):
         'original_name', 
         'user', 
         'size_display', 
+        'stored_size_display',
         'upload_date', 
         'last_download_date', 
+        'download_count',
         'comment'
     ]
     
     list_filter = ['user', 'upload_date']
     search_fields = ['original_name', 'user__username', 'comment']
-    readonly_fields = ['original_name', 'user', 'size', 'upload_date', 'last_download_date']
+    readonly_fields = ['original_name', 'user', 'size', 'stored_size', 'encoding', 'upload_date',
+                       'last_download_date', 'download_count']
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Индексированный поиск по названию и комментарию (search.py),
+        а также все файлы пользователя с таким логином"""
+        search_term = search_term.replace('\x00', '').strip()
+        if not search_term:
+            return queryset, False
+        queryset = search_files(queryset, search_term, Q(user__username=search_term))
+        # Без выбранной сортировки - по релевантности
+        if ORDER_VAR not in request.GET:
+            queryset = queryset.order_by('-search_rank', '-pk')
+        return queryset, False
     
     def size_display(self, obj):
         """Отображение размера файла"""
@@ -288,6 +325,12 @@ class FileAdmin(admin.ModelAdmin):
         return "0 Мб"
     size_display.short_description = 'Размер'
     
+    def stored_size_display(self, obj):
+        """Размер на диске (меньше исходного у сжатых файлов)"""
+        size_mb = obj.stored_size / (1024 * 1024)
+        return f"{size_mb:.2f} Мб" + (f" ({obj.encoding})" if obj.encoding else "")
+    stored_size_display.short_description = 'На диске'
+    
     def has_add_permission(self, request):
         """Запрещаем добавление файлов через общую админку"""
         return False
@@ -296,4 +339,12 @@ class FileAdmin(admin.ModelAdmin):
         """Запрещаем изменение файлов через общую админку"""
         return False
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Очередь фоновых задач"""
+    list_display = ['id', 'kind', 'status', 'attempts', 'created_at', 'started_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['kind', 'payload', 'attempts', 'last_error', 'created_at', 'started_at', 'finished_at']
+
+
 admin.site.register(CustomUser, CustomUserAdmin)
\ No newline at end of file
@@ -7,5 +7,6 @@ class StorageConfig(AppConfig):
 
     def ready(self):
         import storage.signals
+        import storage.tasks
 
     verbose_name = 'Хранилище'
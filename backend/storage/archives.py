@@ -0,0 +1,106 @@
+import os
+import zipfile
+import logging
+from django.conf import settings
+from django.utils import timezone
+from .backends import get_storage
+from .compression import iter_content
+from .responses import get_block_size
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_STORED = 'stored'
+ARCHIVE_DEFLATED = 'deflated'
+ARCHIVE_AUTO = 'auto'
+
+# Уже сжатые форматы: повторное сжатие тратит процессор без выигрыша в размере
+COMPRESSED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.mp4', '.m4a', '.mkv', '.webm', '.ogg', '.avi', '.mov',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.epub', '.jar', '.apk',
+}
+
+
+class StreamWriter:
+    """
+    Несдвигаемый поток для zipfile: записанные байты накапливаются до
+    следующего вызова drain(). Без seek/tell zipfile пишет заголовки
+    записей с дескрипторами данных, и архив формируется строго
+    последовательно.
+    """
+
+    def __init__(self):
+        self.buffer = []
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
+
+
+def get_compress_type(filename, policy=None):
+    """Способ сжатия записи по политике STORAGE_ARCHIVE_COMPRESSION"""
+    policy = policy or settings.STORAGE_ARCHIVE_COMPRESSION
+    if policy == ARCHIVE_STORED:
+        return zipfile.ZIP_STORED
+    if policy == ARCHIVE_DEFLATED:
+        return zipfile.ZIP_DEFLATED
+    extension = os.path.splitext(filename)[1].lower()
+    return zipfile.ZIP_STORED if extension in COMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def unique_name(name, used):
+    """Имя записи без повторов: одинаковые имена получают суффикс (2), (3)..."""
+    base, extension = os.path.splitext(name)
+    candidate = name
+    number = 1
+    while candidate in used:
+        number += 1
+        candidate = f'{base} ({number}){extension}'
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(files, policy=None):
+    """
+    Генератор ZIP-архива из файлов хранилища. В памяти находится не больше
+    одного блока чтения (плюс буфер компрессора), на диск ничего не пишется.
+    """
+    block_size = get_block_size()
+    storage = get_storage()
+    writer = StreamWriter()
+    used_names = set()
+
+    with zipfile.ZipFile(writer, mode='w', allowZip64=True) as archive:
+        for file in files:
+            name = file.file_path.name
+            if not storage.exists(name):
+                logger.warning("Файл с ID %s не найден в хранилище и пропущен в архиве", file.pk)
+                continue
+
+            info = zipfile.ZipInfo(
+                unique_name(file.original_name.replace('/', '_'), used_names),
+                date_time=timezone.localtime(file.upload_date).timetuple()[:6]
+            )
+            info.compress_type = get_compress_type(file.original_name, policy)
+
+            with archive.open(info, mode='w', force_zip64=True) as entry:
+                for block in iter_content(name, file.encoding, block_size=block_size):
+                    entry.write(block)
+                    data = writer.drain()
+                    if data:
+                        yield data
+            data = writer.drain()
+            if data:
+                yield data
+
+    # Центральный каталог записывается при закрытии архива
+    yield writer.drain()
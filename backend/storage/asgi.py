@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import Resolver404, resolve
+from .responses import get_block_size
+
+logger = logging.getLogger(__name__)
+
+# Ключ scope, под которым представлению передаётся поток тела запроса
+BODY_STREAM_KEY = 'storage.body_stream'
+
+
+def streaming_body(view):
+    """
+    Представление читает тело запроса само через aiter_body: под
+    StorageASGIHandler оно не собирается заранее во временный файл,
+    а принимается от сервера по мере записи.
+    """
+    view.streaming_body = True
+    return view
+
+
+class BodyStream:
+    """
+    Тело запроса, получаемое от ASGI-сервера по одному сообщению. Следующее
+    сообщение запрашивается только после обработки предыдущего, поэтому
+    медленная запись на диск останавливает чтение из сокета (uvicorn
+    приостанавливает приём при заполнении буфера), а не копит тело в памяти.
+    """
+
+    def __init__(self, receive):
+        self._receive = receive
+        self._started = False
+        self._consumed = asyncio.Event()
+
+    async def receive_for_handler(self):
+        """receive для ASGIHandler: вместо тела - пустое сообщение, а ожидание
+        отключения клиента начинается после того, как тело прочитано"""
+        if not self._started:
+            self._started = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self._consumed.wait()
+        return await self._receive()
+
+    async def __aiter__(self):
+        if self._consumed.is_set():
+            return
+        try:
+            while True:
+                message = await self._receive()
+                if message['type'] == 'http.disconnect':
+                    raise RequestAborted()
+                if message.get('body'):
+                    yield message['body']
+                if not message.get('more_body', False):
+                    return
+        finally:
+            self._consumed.set()
+
+
+class StorageASGIHandler(ASGIHandler):
+    """
+    ASGIHandler, который не читает заранее тело запросов к представлениям,
+    помеченным streaming_body. Остальные запросы обрабатываются как обычно.
+    """
+
+    async def handle(self, scope, receive, send):
+        if scope['method'] in ('PUT', 'POST') and self.is_streaming_view(scope):
+            stream = BodyStream(receive)
+            scope = {**scope, BODY_STREAM_KEY: stream}
+            receive = stream.receive_for_handler
+        await super().handle(scope, receive, send)
+
+    def is_streaming_view(self, scope):
+        path = scope['path']
+        root_path = scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return False
+        return getattr(match.func, 'streaming_body', False)
+
+
+async def aiter_body(request, block_size=None):
+    """
+    Асинхронное чтение тела запроса блоками не больше block_size. Под
+    StorageASGIHandler тело приходит от сервера по мере чтения, в остальных
+    случаях (WSGI, тестовый клиент) читается из уже принятого тела в потоке.
+    """
+    block_size = block_size or get_block_size()
+    stream = getattr(request, 'scope', {}).get(BODY_STREAM_KEY)
+    if stream is None:
+        while True:
+            block = await asyncio.to_thread(request.read, block_size)
+            if not block:
+                return
+            yield block
+
+    # Мелкие сообщения сервера собираются в блок, чтобы не переключаться
+    # в поток записи на каждые несколько килобайт
+    buffer = bytearray()
+    async for message in stream:
+        buffer += message
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+    if buffer:
+        yield bytes(buffer)
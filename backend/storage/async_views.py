@@ -0,0 +1,189 @@
+"""
+Асинхронные представления для долгих передач: скачивание, просмотр, ссылки
+на файл и приём частей загрузки. Под ASGI (uvicorn) медленный клиент
+не занимает поток воркера: запросы к БД идут через асинхронный ORM, файл
+читается и пишется блоками в пуле потоков, а цикл событий обслуживает
+остальные соединения.
+"""
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import RequestAborted
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, NotFound
+from .asgi import aiter_body, streaming_body
+from .authentication import aauthenticate, aget_user_for_token
+from .backends import get_storage
+from .delivery import serve_stored_file
+from .models import File, UploadSession
+from .responses import guess_content_type, is_inline_content_type
+from .serializers import UploadSessionSerializer
+from .signing import verify_download, SignedURLError
+from .tracking import download_tracker
+from .views import FileViewSet
+
+logger = logging.getLogger(__name__)
+
+# Состояние и отмена загрузки по частям остаются синхронными действиями viewset
+upload_session_view = FileViewSet.as_view({'get': 'upload_chunk', 'delete': 'upload_chunk'})
+
+
+def error_response(status, message):
+    """Ошибка в формате storage.exceptions.custom_exception_handler"""
+    return JsonResponse({'error': {'code': status, 'message': str(message)}}, status=status)
+
+
+async def get_user(request):
+    """Пользователь по токену или ответ 401, как у IsAuthenticated в DRF"""
+    try:
+        user = await aauthenticate(request)
+    except AuthenticationFailed as e:
+        return None, error_response(401, e.detail)
+    if user is None:
+        return None, error_response(401, NotAuthenticated.default_detail)
+    return user, None
+
+
+async def serve(request, file_id, name, filename, **kwargs):
+    """Проверка наличия файла в хранилище, отдача файла и учёт скачивания.
+    Обращения к диску и хранилищу выполняются в пуле потоков"""
+    if not name or not await sync_to_async(get_storage().exists, thread_sensitive=False)(name):
+        logger.error("Файл с ID %s не найден в хранилище", file_id)
+        return JsonResponse({"detail": "Файл не найден"}, status=404)
+
+    response = await sync_to_async(serve_stored_file, thread_sensitive=False)(request, name, filename, **kwargs)
+    # HEAD и проверка актуальности копии (304) файл не передают
+    if request.method == 'GET' and response.status_code != 304:
+        await download_tracker.arecord(file_id)
+    return response
+
+
+@require_safe
+async def download_file(request, pk):
+    """Скачивание файла (endpoint: /api/files/{id}/download/)"""
+    user, error = await get_user(request)
+    if error:
+        return error
+
+    files = File.objects.all() if user.is_staff else File.objects.filter(user=user)
+    file = await files.filter(pk=pk).afirst()
+    if file is None:
+        logger.error("Файл с ID %s не найден для пользователя %s", pk, user.username)
+        return JsonResponse({"detail": "Файл не найден"}, status=404)
+
+    response = await serve(request, file.pk, file.file_path.name, file.original_name, etag_key=file.etag_key,
+                           encoding=file.encoding, size=file.size)
+    logger.info("Файл с ID %s скачивается пользователем %s", pk, user.username)
+    return response
+
+
+@require_safe
+async def view_file(request, pk):
+    """Просмотр файла в браузере (endpoint: /api/files/{id}/view/)"""
+    token_key = request.GET.get('token')
+    if token_key and await aget_user_for_token(token_key) is None:
+        return JsonResponse({"detail": "Неверный токен"}, status=401)
+
+    file = await File.objects.filter(pk=pk).afirst()
+    if file is None:
+        return JsonResponse({"detail": "Файл не найден"}, status=404)
+
+    # Определяем content_type и показывать или скачивать
+    content_type = guess_content_type(file.original_name)
+    show_in_browser = is_inline_content_type(content_type)
+    response = await serve(request, file.pk, file.file_path.name, file.original_name,
+                           content_type=content_type, as_attachment=not show_in_browser,
+                           etag_key=file.etag_key, encoding=file.encoding, size=file.size)
+
+    if show_in_browser:
+        logger.info("Файл отображается в браузере: %s", file.original_name)
+    else:
+        logger.info("Файл отправлен на скачивание: %s", file.original_name)
+    return response
+
+
+@require_safe
+async def download_file_by_special_link(request, special_link):
+    """Скачивание файла по специальной ссылке"""
+    logger.debug("Запрос на скачивание файла по специальной ссылке: %s", special_link)
+    file = await File.objects.filter(special_link=special_link).afirst()
+    if file is None:
+        logger.error("Файл с специальной ссылкой '%s' не найден в базе данных", special_link)
+        return JsonResponse({"detail": "Файл не найден"}, status=404)
+
+    response = await serve(request, file.pk, file.file_path.name, file.original_name,
+                           content_type='application/octet-stream',
+                           etag_key=file.etag_key, encoding=file.encoding, size=file.size,
+                           cache_control=settings.STORAGE_SHARED_LINK_CACHE_CONTROL)
+    logger.info("Файл по специальной ссылке '%s' скачивается", special_link)
+    return response
+
+
+@require_safe
+async def download_file_by_signed_url(request, token):
+    """Скачивание файла по подписанной ссылке: проверяется только подпись
+    и наличие файла в хранилище, без запросов к БД"""
+    try:
+        payload = verify_download(token, request)
+    except SignedURLError as e:
+        logger.warning("Отклонена подписанная ссылка: %s", str(e))
+        return JsonResponse({"detail": str(e)}, status=403)
+
+    response = await serve(request, payload['id'], payload['p'], payload['n'],
+                           content_type='application/octet-stream',
+                           etag_key=payload['k'], encoding=payload.get('c', ''), size=payload.get('s'),
+                           cache_control=settings.STORAGE_SHARED_LINK_CACHE_CONTROL)
+    logger.info("Файл %s скачивается по подписанной ссылке", payload['id'])
+    return response
+
+
+@csrf_exempt
+@streaming_body
+async def upload_chunk(request, upload_id):
+    """
+    Запись части загрузки по смещению (endpoint: PUT /api/files/uploads/{id}/?offset=N).
+
+    Тело не собирается заранее: блоки пишутся в файл части по мере приёма,
+    и клиент, отправляющий быстрее, чем пишет диск, притормаживается
+    сервером. GET и DELETE передаются действию upload_chunk во viewset.
+    """
+    if request.method != 'PUT':
+        return await sync_to_async(upload_session_view)(request, upload_id=upload_id)
+
+    user, error = await get_user(request)
+    if error:
+        return error
+
+    upload = await UploadSession.objects.filter(pk=upload_id, user=user).afirst()
+    if upload is None:
+        return error_response(404, NotFound.default_detail)
+    if upload.status != UploadSession.STATUS_ACTIVE:
+        return JsonResponse({"detail": "Загрузка уже завершена"}, status=409)
+
+    try:
+        offset = int(request.GET.get('offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({"detail": "Не указано смещение части"}, status=400)
+
+    if length <= 0:
+        return JsonResponse({"detail": "Пустая часть файла"}, status=400)
+    if length > settings.STORAGE_UPLOAD_MAX_CHUNK_SIZE:
+        return JsonResponse({"detail": "Слишком большая часть файла"}, status=413)
+    if offset < 0 or offset + length > upload.size:
+        return JsonResponse({"detail": "Часть выходит за границы файла"}, status=416)
+
+    try:
+        written = await upload.awrite_chunk(offset, aiter_body(request), length)
+    except RequestAborted:
+        logger.warning("Клиент прервал передачу части загрузки %s", upload_id)
+        return JsonResponse({"detail": "Часть файла получена не полностью"}, status=400)
+    if written != length:
+        logger.warning("Часть загрузки %s получена не полностью: %d из %d байт", upload_id, written, length)
+        return JsonResponse({"detail": "Часть файла получена не полностью"}, status=400)
+
+    upload = await sync_to_async(upload.mark_received)(offset, offset + length)
+    logger.debug("Сессия %s: получено %d байт со смещения %d", upload_id, length, offset)
+    return JsonResponse(UploadSessionSerializer(upload).data)
@@ -0,0 +1,101 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+logger = logging.getLogger(__name__)
+
+
+def token_cache_key(key):
+    return f'storage:token:{key}'
+
+
+def user_cache_key(user_id):
+    return f'storage:user:{user_id}'
+
+
+def get_user_for_token(key):
+    """
+    Пользователь по токену с кешированием на STORAGE_TOKEN_CACHE_TIMEOUT секунд.
+
+    Токен и пользователь кешируются отдельно, поэтому при изменении
+    пользователя достаточно удалить одну запись (invalidate_user).
+    """
+    user_id = cache.get(token_cache_key(key))
+    user = cache.get(user_cache_key(user_id)) if user_id is not None else None
+    if user is not None:
+        return user
+
+    try:
+        token = Token.objects.select_related('user').get(key=key)
+    except Token.DoesNotExist:
+        return None
+
+    timeout = settings.STORAGE_TOKEN_CACHE_TIMEOUT
+    cache.set(token_cache_key(key), token.user_id, timeout)
+    cache.set(user_cache_key(token.user_id), token.user, timeout)
+    return token.user
+
+
+async def aget_user_for_token(key):
+    """get_user_for_token для асинхронных представлений: кеш и ORM без потоков"""
+    user_id = await cache.aget(token_cache_key(key))
+    user = await cache.aget(user_cache_key(user_id)) if user_id is not None else None
+    if user is not None:
+        return user
+
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        return None
+
+    timeout = settings.STORAGE_TOKEN_CACHE_TIMEOUT
+    await cache.aset(token_cache_key(key), token.user_id, timeout)
+    await cache.aset(user_cache_key(token.user_id), token.user, timeout)
+    return token.user
+
+
+async def aauthenticate(request):
+    """
+    Пользователь по заголовку "Authorization: Token <ключ>" для асинхронных
+    представлений вне DRF. None, если заголовка нет; для неверного токена
+    или неактивного пользователя - AuthenticationFailed, как в DRF.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != CachedTokenAuthentication.keyword.lower().encode():
+        return None
+    if len(auth) != 2:
+        raise AuthenticationFailed('Недействительный заголовок токена.')
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed('Недействительный заголовок токена.')
+
+    user = await aget_user_for_token(key)
+    if user is None:
+        raise AuthenticationFailed('Недействительный токен.')
+    if not user.is_active:
+        raise AuthenticationFailed('Пользователь неактивен или удалён.')
+    return user
+
+
+def invalidate_token(key):
+    cache.delete(token_cache_key(key))
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без обращения к БД, пока токен есть в кеше"""
+
+    def authenticate_credentials(self, key):
+        user = get_user_for_token(key)
+        if user is None:
+            raise AuthenticationFailed('Недействительный токен.')
+        if not user.is_active:
+            raise AuthenticationFailed('Пользователь неактивен или удалён.')
+        return (user, Token(key=key, user=user))
@@ -0,0 +1,235 @@
+import os
+import shutil
+import logging
+from functools import lru_cache
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+from django.utils.http import content_disposition_header
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class StorageMixin:
+    """
+    Дополнения к Storage API Django, через которые идёт весь ввод-вывод
+    файлов пользователей: потоковая запись готового файла, чтение диапазона,
+    копирование и обход содержимого. Имена - пути относительно корня хранилища
+    (для локального - MEDIA_ROOT).
+    """
+
+    # Файлы доступны по локальному пути (os.sendfile, X-Accel-Redirect)
+    is_local = False
+
+    def save_file(self, local_path, name, move=True):
+        """Помещает готовый локальный файл в хранилище под именем name"""
+        raise NotImplementedError
+
+    def iter_range(self, name, start=0, length=None, block_size=READ_BLOCK_SIZE):
+        """Потоковое чтение диапазона [start, start + length)"""
+        raise NotImplementedError
+
+    def copy(self, name, new_name):
+        raise NotImplementedError
+
+    def stat(self, name):
+        """(размер, время изменения в секундах)"""
+        raise NotImplementedError
+
+    def iter_names(self, prefix):
+        """Все файлы под префиксом: пары (имя, время изменения)"""
+        raise NotImplementedError
+
+    def download_url(self, name, filename, content_type, as_attachment=True, content_encoding=''):
+        """Прямая ссылка на скачивание в обход приложения или None"""
+        return None
+
+
+@deconstructible(path='storage.backends.LocalStorage')
+class LocalStorage(StorageMixin, FileSystemStorage):
+    """Локальный диск (MEDIA_ROOT), поведение до появления абстракции"""
+
+    is_local = True
+
+    def save_file(self, local_path, name, move=True):
+        target = self.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if move:
+            os.replace(local_path, target)
+            return name
+        try:
+            os.link(local_path, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copy2(local_path, target)
+        return name
+
+    def iter_range(self, name, start=0, length=None, block_size=READ_BLOCK_SIZE):
+        with open(self.path(name), 'rb') as f:
+            f.seek(start)
+            remaining = length
+            while remaining is None or remaining > 0:
+                block = f.read(block_size if remaining is None else min(block_size, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+
+    def copy(self, name, new_name):
+        # Жёсткая ссылка: мгновенно и без второй копии на диске
+        return self.save_file(self.path(name), new_name, move=False)
+
+    def stat(self, name):
+        stat = os.stat(self.path(name))
+        return stat.st_size, stat.st_mtime
+
+    def iter_names(self, prefix):
+        root = self.path(prefix)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    mtime = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, self.location), mtime
+
+
+@deconstructible(path='storage.backends.S3Storage')
+class S3Storage(StorageMixin, Storage):
+    """
+    Объектное хранилище с протоколом S3 (AWS S3, MinIO и совместимые).
+    Требует пакет boto3, который импортируется только при использовании.
+    Скачивание идёт напрямую из хранилища по подписанной ссылке.
+    """
+
+    @cached_property
+    def client(self):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("Для хранилища S3 требуется пакет boto3: pip install boto3")
+        return boto3.client(
+            's3',
+            endpoint_url=settings.STORAGE_S3_ENDPOINT_URL or None,
+            region_name=settings.STORAGE_S3_REGION or None,
+            aws_access_key_id=settings.STORAGE_S3_ACCESS_KEY or None,
+            aws_secret_access_key=settings.STORAGE_S3_SECRET_KEY or None,
+        )
+
+    @property
+    def bucket(self):
+        return settings.STORAGE_S3_BUCKET
+
+    def key(self, name):
+        return f"{settings.STORAGE_S3_PREFIX}{name.replace(os.sep, '/')}"
+
+    def name_from_key(self, key):
+        return key[len(settings.STORAGE_S3_PREFIX):]
+
+    def head(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise ValueError("Запись в S3 выполняется через save() или save_file()")
+        obj = self.client.get_object(Bucket=self.bucket, Key=self.key(name))
+        return DjangoFile(obj['Body'], name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        # upload_fileobj сам переходит на multipart-загрузку для больших файлов
+        self.client.upload_fileobj(content, self.bucket, self.key(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имена в хранилище всегда уникальны (uuid или хеш содержимого)
+        return name
+
+    def exists(self, name):
+        return self.head(name) is not None
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=self.key(name))['ContentLength']
+
+    def get_modified_time(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=self.key(name))['LastModified']
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self.key(name)},
+            ExpiresIn=settings.STORAGE_S3_URL_EXPIRE)
+
+    def save_file(self, local_path, name, move=True):
+        self.client.upload_file(local_path, self.bucket, self.key(name))
+        if move:
+            os.remove(local_path)
+        return name
+
+    def iter_range(self, name, start=0, length=None, block_size=READ_BLOCK_SIZE):
+        params = {'Bucket': self.bucket, 'Key': self.key(name)}
+        if start or length is not None:
+            end = '' if length is None else start + length - 1
+            params['Range'] = f'bytes={start}-{end}'
+        body = self.client.get_object(**params)['Body']
+        try:
+            yield from body.iter_chunks(block_size)
+        finally:
+            body.close()
+
+    def copy(self, name, new_name):
+        # Управляемое копирование на стороне хранилища, в том числе больше 5 ГБ
+        self.client.copy({'Bucket': self.bucket, 'Key': self.key(name)}, self.bucket, self.key(new_name))
+        return new_name
+
+    def stat(self, name):
+        head = self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        return head['ContentLength'], head['LastModified'].timestamp()
+
+    def iter_names(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.key(prefix)):
+            for obj in page.get('Contents', []):
+                yield self.name_from_key(obj['Key']), obj['LastModified'].timestamp()
+
+    def download_url(self, name, filename, content_type, as_attachment=True, content_encoding=''):
+        params = {
+            'Bucket': self.bucket,
+            'Key': self.key(name),
+            'ResponseContentType': content_type,
+            'ResponseContentDisposition': content_disposition_header(as_attachment, filename),
+        }
+        if content_encoding:
+            params['ResponseContentEncoding'] = content_encoding
+        return self.client.generate_presigned_url('get_object', Params=params,
+                                                  ExpiresIn=settings.STORAGE_S3_URL_EXPIRE)
+
+
+@lru_cache(maxsize=None)
+def load_storage(path):
+    storage_class = import_string(path)
+    logger.info("Хранилище файлов: %s", storage_class.__name__)
+    return storage_class()
+
+
+def get_storage():
+    """Хранилище файлов пользователей из настройки STORAGE_BACKEND"""
+    return load_storage(settings.STORAGE_BACKEND)
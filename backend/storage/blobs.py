@@ -0,0 +1,186 @@
+import os
+import hashlib
+import tempfile
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from . import compression, deletion, layout
+from .backends import get_storage
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = os.path.join('uploads', 'blobs')
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def blob_name(sha256):
+    """Путь к содержимому относительно MEDIA_ROOT: uploads/blobs/ab/cd/abcd...
+    (вложенность задаётся настройками раскладки, см. layout.py)"""
+    return layout.sharded_name(BLOBS_DIR, sha256, sha256)
+
+
+def temp_dir():
+    path = os.path.join(settings.MEDIA_ROOT, BLOBS_DIR, 'tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def write_temp(chunks):
+    """
+    Записывает поток во временный файл рядом с хранилищем содержимого,
+    одновременно считая SHA-256 и размер.
+    """
+    fd, path = tempfile.mkstemp(dir=temp_dir())
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                sha256.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, sha256.hexdigest(), size
+
+
+def hash_stored(name):
+    """Потоковый подсчёт SHA-256 файла в хранилище"""
+    sha256 = hashlib.sha256()
+    for block in get_storage().iter_range(name, block_size=HASH_BLOCK_SIZE):
+        sha256.update(block)
+    return sha256.hexdigest()
+
+
+def ingest(path, sha256, size):
+    """
+    Помещает локальный файл в хранилище содержимого и увеличивает счётчик ссылок.
+    Если такое содержимое уже хранится, новая копия удаляется.
+    """
+    def put(storage, name):
+        with open(path, 'rb') as f:
+            encoding = compression.choose_encoding(f.read(compression.SNIFF_SIZE), size)
+        if not encoding:
+            storage.save_file(path, name)
+            return '', size
+        compressed_path, stored_size = compression.compress_to_temp(
+            compression.iter_local(path, HASH_BLOCK_SIZE), encoding, temp_dir())
+        os.remove(path)
+        storage.save_file(compressed_path, name)
+        return encoding, stored_size
+
+    return add_reference(sha256, size, put, lambda: os.remove(path))
+
+
+def ingest_stored(name, sha256, size):
+    """Перенос файла, уже лежащего в хранилище под другим именем (например,
+    собранного из частей), в хранилище содержимого. Старое имя ставится
+    в очередь удаления."""
+    def put(storage, blob_name):
+        sample = b''.join(storage.iter_range(name, 0, compression.SNIFF_SIZE))
+        encoding = compression.choose_encoding(sample, size)
+        if not encoding:
+            storage.copy(name, blob_name)
+            return '', size
+        path, stored_size = compression.compress_to_temp(
+            storage.iter_range(name, block_size=HASH_BLOCK_SIZE), encoding, temp_dir())
+        storage.save_file(path, blob_name)
+        return encoding, stored_size
+
+    blob = add_reference(sha256, size, put, lambda: None)
+    deletion.enqueue([name])
+    return blob
+
+
+def add_reference(sha256, size, put, discard):
+    """
+    Ссылка на содержимое с таким хешем; при первой записи put(storage, имя)
+    помещает его в хранилище и возвращает (сжатие, размер на диске).
+    """
+    from .models import Blob
+
+    storage = get_storage()
+    with transaction.atomic():
+        blob, created = Blob.objects.get_or_create(
+            sha256=sha256,
+            defaults={'name': blob_name(sha256), 'size': size, 'stored_size': size}
+        )
+        blob = Blob.objects.select_for_update().get(pk=blob.pk)
+        if created:
+            # Такое же содержимое могло быть недавно удалено и ждать в очереди
+            deletion.cancel(blob.name)
+
+        exists = storage.exists(blob.name)
+        if exists and not created:
+            discard()
+            logger.info("Содержимое %s уже хранится, копия не создаётся", sha256)
+        else:
+            if exists:
+                # Файл удалённого содержимого мог быть сжат иначе, чем новая
+                # запись, поэтому он не используется повторно
+                storage.delete(blob.name)
+            blob.encoding, blob.stored_size = put(storage, blob.name)
+            Blob.objects.filter(pk=blob.pk).update(encoding=blob.encoding, stored_size=blob.stored_size)
+            logger.info("Содержимое %s сохранено в %s (сжатие: %s, %d из %d байт)",
+                        sha256, blob.name, blob.encoding or 'нет', blob.stored_size, size)
+
+        Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob
+
+
+def store_upload(uploaded_file):
+    """
+    Сохраняет загруженный файл в хранилище содержимого. Файл, принятый
+    uploadhandlers.HashingUploadHandler, уже лежит во временном каталоге
+    с посчитанным хешем и переносится без повторной записи.
+    """
+    if hasattr(uploaded_file, 'sha256'):
+        return ingest(uploaded_file.temporary_file_path(), uploaded_file.sha256, uploaded_file.size)
+    path, sha256, size = write_temp(uploaded_file.chunks())
+    return ingest(path, sha256, size)
+
+
+def release(blob_id):
+    """
+    Уменьшает счётчик ссылок. Содержимое ставится в очередь удаления с диска,
+    только когда на него не остаётся ни одного файла.
+    """
+    from .models import Blob
+
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+
+        blob.delete()
+        deletion.enqueue([blob.name])
+
+
+def release_many(blob_counts):
+    """
+    Освобождение содержимого сразу для многих файлов: {blob_id: число ссылок}.
+    Счётчики обновляются одним bulk_update, ненужное содержимое удаляется
+    одним DELETE, файлы ставятся в очередь удаления.
+    """
+    from .models import Blob
+
+    if not blob_counts:
+        return
+    with transaction.atomic():
+        locked = list(Blob.objects.select_for_update().filter(pk__in=blob_counts))
+        alive = [blob for blob in locked if blob.ref_count > blob_counts[blob.pk]]
+        dead = [blob for blob in locked if blob.ref_count <= blob_counts[blob.pk]]
+
+        for blob in alive:
+            blob.ref_count -= blob_counts[blob.pk]
+        if alive:
+            Blob.objects.bulk_update(alive, ['ref_count'])
+        if dead:
+            Blob.objects.filter(pk__in=[blob.pk for blob in dead]).delete()
+            deletion.enqueue([blob.name for blob in dead])
+
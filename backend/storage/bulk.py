@@ -0,0 +1,137 @@
+import uuid
+import logging
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from . import blobs, deletion, jobs
+from .models import CustomUser, File, UploadSession
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые можно менять массово
+BULK_UPDATE_FIELDS = ('original_name', 'comment')
+NAME_MAX_LENGTH = File._meta.get_field('original_name').max_length
+
+
+def create_files(user, uploads, comments=()):
+    """
+    Загрузка многих файлов одним запросом. Содержимое каждого файла попадает
+    в хранилище содержимого, строки создаются одним bulk_create, счётчики
+    пользователя обновляются одним UPDATE. Возвращает список
+    (индекс, файл или None, ошибка).
+    """
+    max_size = settings.STORAGE_UPLOAD_MAX_FILE_SIZE
+    results = []
+    files = []
+
+    with transaction.atomic():
+        for index, upload in enumerate(uploads):
+            if max_size and upload.size > max_size:
+                results.append((index, None, f"Размер файла превышает допустимый ({max_size} байт)."))
+                continue
+            try:
+                blob = blobs.store_upload(upload)
+            except OSError as e:
+                logger.error("Ошибка при сохранении файла '%s': %s", upload.name, str(e))
+                results.append((index, None, "Ошибка при сохранении файла"))
+                continue
+
+            file = File(
+                user=user,
+                original_name=upload.name,
+                size=blob.size,
+                comment=comments[index] if index < len(comments) else '',
+                special_link=uuid.uuid4().hex,
+            )
+            file.attach_blob(blob)
+            files.append(file)
+            results.append((index, file, None))
+
+        # save() и сигнал post_save при bulk_create не вызываются,
+        # поэтому занятое место учитывается здесь одним запросом
+        File.objects.bulk_create(files)
+        if files:
+            user.change_usage(sum(file.stored_size for file in files), len(files))
+        for file in files:
+            jobs.enqueue('process_upload', file_id=file.pk)
+
+    logger.info("Пользователь %s загрузил %d файлов одним запросом", user.username, len(files))
+    return results
+
+
+def delete_files(queryset):
+    """
+    Удаление многих файлов: одна выборка, один DELETE, освобождение
+    содержимого и счётчиков пользователей пачкой. Возвращает id удалённых файлов.
+    """
+    rows = list(queryset.values_list('id', 'user_id', 'stored_size', 'blob_id', 'file_path'))
+    if not rows:
+        return []
+    ids = [row[0] for row in rows]
+
+    usage = defaultdict(lambda: [0, 0])
+    for _, user_id, size, _, _ in rows:
+        usage[user_id][0] -= size
+        usage[user_id][1] -= 1
+    blob_counts = Counter(blob_id for _, _, _, blob_id, _ in rows if blob_id)
+    # Файлы, ещё не перенесённые в хранилище содержимого
+    legacy_names = [name for _, _, _, blob_id, name in rows if not blob_id and name]
+
+    with transaction.atomic():
+        UploadSession.objects.filter(file_id__in=ids).update(file=None)
+        # Публичный delete() у модели с получателем post_delete
+        # (signals.delete_file_content) загружает каждую строку и шлёт сигнал
+        # на каждую, а сигнал освободил бы содержимое и счётчики второй раз
+        # после release_many ниже. _raw_delete - один DELETE без сигналов, тем
+        # же путём Django удаляет строки моделей без получателей (fast delete).
+        # Приватный API: поведение закреплено тестом BulkTests
+        query = File.objects.filter(pk__in=ids)
+        query._raw_delete(query.db)
+
+        blobs.release_many(blob_counts)
+        for user_id, (size, count) in usage.items():
+            CustomUser(pk=user_id).change_usage(size, count)
+        deletion.enqueue(legacy_names)
+
+    logger.info("Удалено файлов одним запросом: %d", len(ids))
+    return ids
+
+
+def update_files(queryset, items):
+    """
+    Массовое изменение имени и комментария: одна выборка и один bulk_update.
+    items - список словарей с id и изменяемыми полями. Возвращает список
+    (id, файл или None, ошибка).
+    """
+    files = queryset.in_bulk([item.get('id') for item in items if isinstance(item.get('id'), int)])
+    results = []
+    changed = {}
+    fields = set()
+
+    for item in items:
+        file_id = item.get('id')
+        file = files.get(file_id)
+        if file is None:
+            results.append((file_id, None, "Файл не найден"))
+            continue
+        values = {field: item[field] for field in BULK_UPDATE_FIELDS if field in item}
+        if not values:
+            results.append((file_id, None, "Не указаны изменяемые поля"))
+            continue
+        if 'original_name' in values and not values['original_name']:
+            results.append((file_id, None, "Новое имя файла не указано"))
+            continue
+        if len(values.get('original_name') or '') > NAME_MAX_LENGTH:
+            results.append((file_id, None, f"Имя файла длиннее {NAME_MAX_LENGTH} символов"))
+            continue
+        for field, value in values.items():
+            setattr(file, field, value)
+        fields.update(values)
+        changed[file.pk] = file
+        results.append((file_id, file, None))
+
+    if changed:
+        with transaction.atomic():
+            File.objects.bulk_update(list(changed.values()), sorted(fields))
+    logger.info("Изменено файлов одним запросом: %d", len(changed))
+    return results
@@ -0,0 +1,193 @@
+import os
+import zlib
+import tempfile
+import logging
+from functools import lru_cache
+from django.conf import settings
+from .backends import READ_BLOCK_SIZE, get_storage
+
+logger = logging.getLogger(__name__)
+
+ENCODING_GZIP = 'gzip'
+ENCODING_ZSTD = 'zstd'
+ENCODING_CHOICES = [
+    ('', 'Без сжатия'),
+    (ENCODING_GZIP, 'gzip'),
+    (ENCODING_ZSTD, 'zstd'),
+]
+
+# Начало файла, по которому решается, сжимать ли его
+SNIFF_SIZE = 64 * 1024
+# Блок при распаковке: столько сжатых данных читается из хранилища за раз
+# и не больше стольких распакованных отдаётся за раз. Один сжатый блок
+# разворачивается в сотни мегабайт (например, файл из нулей), поэтому
+# размер вывода ограничивается отдельно от ввода
+DECODE_BLOCK_SIZE = 64 * 1024
+
+# Сигнатуры уже сжатых форматов: архивы, изображения, аудио и видео, PDF
+COMPRESSED_SIGNATURES = (
+    b'\x1f\x8b', b'\x28\xb5\x2f\xfd', b'PK\x03\x04', b'BZh', b'\xfd7zXZ', b'7z\xbc\xaf', b'Rar!',
+    b'\x89PNG', b'\xff\xd8\xff', b'GIF8', b'RIFF', b'OggS', b'ID3', b'\x1aE\xdf\xa3', b'%PDF',
+)
+
+
+@lru_cache(maxsize=None)
+def zstd_module():
+    """Пакет zstandard импортируется только при использовании"""
+    try:
+        import zstandard
+    except ImportError:
+        logger.warning("Пакет zstandard не установлен, для сжатия используется gzip")
+        return None
+    return zstandard
+
+
+def configured_encoding():
+    """Алгоритм из настройки STORAGE_COMPRESSION; без пакета zstandard - gzip"""
+    encoding = settings.STORAGE_COMPRESSION
+    if encoding == ENCODING_ZSTD and zstd_module() is None:
+        return ENCODING_GZIP
+    return encoding
+
+
+def choose_encoding(sample, size):
+    """
+    Алгоритм сжатия для содержимого по его началу или '' - хранить как есть.
+    Уже сжатые форматы узнаются по сигнатуре, остальное сжимается, только
+    если пробное быстрое сжатие начала файла даёт заметный выигрыш.
+    """
+    encoding = configured_encoding()
+    if not encoding or not sample or size < settings.STORAGE_COMPRESSION_MIN_SIZE:
+        return ''
+    # MP4 и QuickTime: сигнатура ftyp со смещения 4
+    if sample.startswith(COMPRESSED_SIGNATURES) or sample[4:8] == b'ftyp':
+        return ''
+    if len(zlib.compress(sample, 1)) > len(sample) * settings.STORAGE_COMPRESSION_MAX_RATIO:
+        return ''
+    return encoding
+
+
+def compressor(encoding):
+    level = settings.STORAGE_COMPRESSION_LEVEL
+    if encoding == ENCODING_ZSTD:
+        return zstd_module().ZstdCompressor(level=level or 3).compressobj()
+    # wbits=31 - формат gzip, который клиенты принимают как Content-Encoding: gzip
+    return zlib.compressobj(level or 6, zlib.DEFLATED, 31)
+
+
+def zstd_decompressor():
+    module = zstd_module()
+    if module is None:
+        raise RuntimeError("Для чтения файлов, сжатых zstd, требуется пакет zstandard: pip install zstandard")
+    return module.ZstdDecompressor()
+
+
+class BlockReader:
+    """Файлоподобное чтение потока блоков для ZstdDecompressor.read_to_iter"""
+
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while not self.buffer:
+            self.buffer = next(self.blocks, None)
+            if self.buffer is None:
+                self.buffer = b''
+                return b''
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def compress_to_temp(blocks, encoding, directory):
+    """Сжимает поток блоков во временный файл в directory: (путь, размер)"""
+    fd, path = tempfile.mkstemp(dir=directory)
+    stored_size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            engine = compressor(encoding)
+            for block in blocks:
+                data = engine.compress(block)
+                f.write(data)
+                stored_size += len(data)
+            data = engine.flush()
+            f.write(data)
+            stored_size += len(data)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, stored_size
+
+
+def iter_local(path, block_size):
+    with open(path, 'rb') as f:
+        while block := f.read(block_size):
+            yield block
+
+
+def decode(blocks, encoding):
+    """Распакованное содержимое блоками не больше DECODE_BLOCK_SIZE"""
+    if encoding == ENCODING_ZSTD:
+        yield from zstd_decompressor().read_to_iter(
+            BlockReader(blocks), read_size=DECODE_BLOCK_SIZE, write_size=DECODE_BLOCK_SIZE)
+        return
+
+    engine = zlib.decompressobj(31)
+    for block in blocks:
+        data = engine.decompress(block, DECODE_BLOCK_SIZE)
+        if data:
+            yield data
+        # Не поместившееся в вывод остаётся в unconsumed_tail или внутри
+        # распаковщика (полный вывод): продолжаем, пока он заполняется
+        while engine.unconsumed_tail or len(data) == DECODE_BLOCK_SIZE:
+            data = engine.decompress(engine.unconsumed_tail, DECODE_BLOCK_SIZE)
+            if data:
+                yield data
+    data = engine.flush()
+    if data:
+        yield data
+
+
+def iter_content(name, encoding='', start=0, length=None, block_size=None):
+    """
+    Содержимое файла хранилища в исходном виде: сжатый файл распаковывается
+    на лету, диапазон [start, start + length) отсчитывается по несжатым данным.
+    """
+    storage = get_storage()
+    if not encoding:
+        yield from storage.iter_range(name, start, length, block_size=block_size or READ_BLOCK_SIZE)
+        return
+
+    # Сжатый поток нельзя начать с середины: данные до start распаковываются
+    # и отбрасываются
+    position = 0
+    end = None if length is None else start + length
+    for data in decode(storage.iter_range(name, block_size=DECODE_BLOCK_SIZE), encoding):
+        data_start = position
+        position += len(data)
+        if position <= start:
+            continue
+        data = data[max(start - data_start, 0):]
+        if end is not None and position > end:
+            data = data[:len(data) - (position - end)]
+        if data:
+            yield data
+        if end is not None and position >= end:
+            return
+
+
+def accepts_encoding(request, encoding):
+    """Принимает ли клиент Content-Encoding (заголовок Accept-Encoding с q > 0)"""
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        token, _, params = item.strip().partition(';')
+        if token.strip().lower() not in (encoding, '*'):
+            continue
+        params = params.replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1
+        except ValueError:
+            quality = 1
+        return quality > 0
+    return False
@@ -0,0 +1,130 @@
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.db import connections, transaction
+from . import jobs
+from .backends import get_storage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(names):
+    """
+    Ставит файлы (пути относительно MEDIA_ROOT) в очередь удаления. Запись
+    в очередь входит в текущую транзакцию: при откате файлы остаются на месте,
+    после фиксации их удаляет фоновый поток.
+    """
+    from .models import PendingDeletion
+
+    names = [name for name in names if name]
+    if not names:
+        return
+    PendingDeletion.objects.bulk_create([PendingDeletion(name=name) for name in names])
+    transaction.on_commit(deletion_worker.wake)
+
+
+def cancel(name):
+    """Снимает файл с очереди удаления, если он снова понадобился"""
+    from .models import PendingDeletion
+
+    PendingDeletion.objects.filter(name=name).delete()
+
+
+class DeletionWorker:
+    """
+    Фоновое удаление файлов с диска.
+
+    Запросы удаляют только строки в БД и ставят файлы в очередь
+    PendingDeletion, а поток раз в STORAGE_DELETION_INTERVAL секунд (и сразу
+    после фиксации удаления) удаляет их с диска пачками. Очередь хранится
+    в БД, поэтому не теряется при перезапуске; её также разбирает команда
+    collect_garbage. Интервал 0 - удаление сразу после фиксации транзакции,
+    при STORAGE_JOBS_ENABLED очередь разбирает воркер фоновых задач.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._thread = None
+
+    @property
+    def interval(self):
+        return settings.STORAGE_DELETION_INTERVAL
+
+    def wake(self):
+        if self.interval <= 0:
+            self.process()
+            return
+        if settings.STORAGE_JOBS_ENABLED:
+            # Очередь разбирает воркер run_jobs, а не поток веб-процесса
+            jobs.enqueue('process_deletions', unique=True)
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='storage-deletion', daemon=True)
+                self._thread.start()
+                atexit.register(self.process)
+        self._event.set()
+
+    def run(self):
+        while True:
+            self._event.wait(self.interval)
+            self._event.clear()
+            try:
+                self.process()
+            except Exception as e:
+                logger.error("Ошибка фонового удаления файлов: %s", str(e))
+            finally:
+                connections.close_all()
+
+    def process(self, batch_size=None):
+        """Разбирает очередь пачками, возвращает число удалённых файлов"""
+        batch_size = batch_size or settings.STORAGE_DELETION_BATCH_SIZE
+        total = 0
+        while True:
+            removed, failed = self.process_batch(batch_size)
+            total += removed
+            if removed + failed < batch_size:
+                return total
+
+    def process_batch(self, batch_size):
+        from .models import Blob, File, PendingDeletion
+
+        with transaction.atomic():
+            # skip_locked: несколько процессов разбирают очередь, не мешая друг другу
+            items = list(PendingDeletion.objects.select_for_update(skip_locked=True)
+                         .filter(attempts__lt=settings.STORAGE_DELETION_MAX_ATTEMPTS)
+                         .order_by('id')[:batch_size])
+            if not items:
+                return 0, 0
+
+            # Содержимое, загруженное заново после постановки в очередь, и файлы,
+            # на которые по-прежнему ссылаются записи (например, старый путь,
+            # снова найденный сборкой мусора после reshard_storage), не удаляем
+            names = [item.name for item in items]
+            alive = set(Blob.objects.filter(name__in=names).values_list('name', flat=True))
+            alive.update(File.objects.filter(file_path__in=names).values_list('file_path', flat=True))
+            storage = get_storage()
+            done, failed = [], []
+            for item in items:
+                if item.name not in alive:
+                    try:
+                        # Отсутствующий файл хранилище считает уже удалённым
+                        storage.delete(item.name)
+                        logger.info("Файл %s удалён из хранилища", item.name)
+                    except Exception as e:
+                        logger.error("Ошибка при удалении файла %s: %s", item.name, str(e))
+                        item.attempts += 1
+                        item.last_error = str(e)
+                        failed.append(item)
+                        continue
+                done.append(item.pk)
+
+            PendingDeletion.objects.filter(pk__in=done).delete()
+            if failed:
+                PendingDeletion.objects.bulk_update(failed, ['attempts', 'last_error'])
+        return len(done), len(failed)
+
+
+deletion_worker = DeletionWorker()
@@ -0,0 +1,206 @@
+import os
+import logging
+import mimetypes
+from functools import lru_cache
+from urllib.parse import quote
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date
+from django.utils.module_loading import import_string
+from .backends import get_storage
+from .compression import accepts_encoding, iter_content
+from .responses import (aiter_in_thread, if_range_matches, is_asgi_request, make_etag,
+                        parse_range_header, stream_file)
+
+logger = logging.getLogger(__name__)
+
+
+class BaseDelivery:
+    """Способ передачи содержимого файла клиенту"""
+
+    def serve(self, request, path, filename, content_type, as_attachment, etag=None):
+        raise NotImplementedError
+
+
+class PythonDelivery(BaseDelivery):
+    """Файл передаётся через воркер Django"""
+
+    def serve(self, request, path, filename, content_type, as_attachment, etag=None):
+        return stream_file(request, path, filename, content_type, as_attachment, etag=etag)
+
+
+class SendfileDelivery(BaseDelivery):
+    """
+    Файл передаётся без копирования в Python: под WSGI через
+    wsgi.file_wrapper сервера (os.sendfile в gunicorn), в том числе для
+    одиночных диапазонов, под ASGI - асинхронным итератором.
+    """
+
+    def serve(self, request, path, filename, content_type, as_attachment, etag=None):
+        return stream_file(request, path, filename, content_type, as_attachment, zero_copy=True,
+                           etag=etag)
+
+
+class ProxyDelivery(BaseDelivery):
+    """
+    Передача файла фронт-прокси: Django только проверяет права и возвращает
+    заголовок с внутренним путём, а чтение файла, Range и отправку
+    выполняет прокси.
+    """
+    header = None
+
+    def get_internal_path(self, path):
+        raise NotImplementedError
+
+    def serve(self, request, path, filename, content_type, as_attachment, etag=None):
+        internal_path = self.get_internal_path(path)
+        if internal_path is None:
+            logger.warning("Файл %s вне MEDIA_ROOT, отдаётся через Django", path)
+            return stream_file(request, path, filename, content_type, as_attachment, etag=etag)
+
+        response = HttpResponse(content_type=content_type)
+        response[self.header] = internal_path
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        return response
+
+
+def get_media_relative_path(path):
+    media_root = os.path.abspath(settings.MEDIA_ROOT)
+    path = os.path.abspath(path)
+    if os.path.commonpath([media_root, path]) != media_root:
+        return None
+    return os.path.relpath(path, media_root)
+
+
+class XAccelRedirectDelivery(ProxyDelivery):
+    """Nginx: internal location, указывающий на MEDIA_ROOT"""
+    header = 'X-Accel-Redirect'
+
+    def get_internal_path(self, path):
+        relative_path = get_media_relative_path(path)
+        if relative_path is None:
+            return None
+        location = settings.STORAGE_X_ACCEL_REDIRECT_LOCATION.rstrip('/')
+        return f"{location}/{quote(relative_path.replace(os.sep, '/'))}"
+
+
+class XSendfileDelivery(ProxyDelivery):
+    """Apache mod_xsendfile, lighttpd и совместимые: абсолютный путь к файлу"""
+    header = 'X-Sendfile'
+
+    def get_internal_path(self, path):
+        if get_media_relative_path(path) is None:
+            return None
+        return os.path.abspath(path)
+
+
+@lru_cache(maxsize=None)
+def load_delivery_backend(backend_path):
+    return import_string(backend_path)()
+
+
+def get_delivery_backend():
+    return load_delivery_backend(settings.STORAGE_DELIVERY_BACKEND)
+
+
+def serve_file(request, path, filename, content_type=None, as_attachment=True,
+               etag_key='', cache_control=None, content_encoding=''):
+    """
+    Отдача файла выбранным в настройках способом (STORAGE_DELIVERY_BACKEND).
+
+    Условные запросы (If-None-Match/If-Modified-Since) обрабатываются до
+    передачи файла: если у клиента актуальная копия, возвращается 304.
+    content_encoding - файл сжат и отдаётся как есть с этим Content-Encoding.
+    """
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    stat = os.stat(path)
+    etag = make_etag(stat, f'{etag_key}-{content_encoding}' if content_encoding else etag_key)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is not None:
+        logger.debug("Файл '%s' не изменился, ответ %d", filename, response.status_code)
+    elif content_encoding:
+        # Прокси не передают клиенту Content-Encoding из ответа с внутренним
+        # перенаправлением, поэтому сжатый файл всегда отдаётся через Django
+        response = stream_file(request, path, filename, content_type, as_attachment, zero_copy=True,
+                               etag=etag)
+    else:
+        response = get_delivery_backend().serve(request, path, filename, content_type, as_attachment, etag=etag)
+
+    if content_encoding:
+        response['Content-Encoding'] = content_encoding
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control or settings.STORAGE_PRIVATE_CACHE_CONTROL
+    return response
+
+
+def serve_stored_file(request, name, filename, content_type=None, as_attachment=True,
+                      etag_key='', cache_control=None, encoding='', size=None):
+    """
+    Отдача файла из хранилища (STORAGE_BACKEND). Локальный файл отдаётся
+    через serve_file со всеми его способами, из удалённого хранилища клиент
+    перенаправляется на подписанную ссылку: Range, ETag и сама передача
+    данных обрабатываются хранилищем, а не узлом приложения.
+
+    Сжатый файл (encoding) клиент, принимающий такой Content-Encoding,
+    получает как есть, остальные - распакованным на лету (serve_decoded).
+    size - исходный размер файла.
+    """
+    storage = get_storage()
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if encoding and not accepts_encoding(request, encoding):
+        return serve_decoded(request, name, filename, content_type, as_attachment, etag_key,
+                             cache_control, encoding, size)
+
+    if storage.is_local:
+        return serve_file(request, storage.path(name), filename, content_type, as_attachment,
+                          etag_key=etag_key, cache_control=cache_control, content_encoding=encoding)
+
+    response = HttpResponseRedirect(storage.download_url(name, filename, content_type, as_attachment,
+                                                         content_encoding=encoding))
+    # Подписанная ссылка действует ограниченное время, её нельзя кешировать
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+def serve_decoded(request, name, filename, content_type, as_attachment, etag_key, cache_control,
+                  encoding, size=None):
+    """
+    Сжатый файл для клиента, не принимающего его Content-Encoding: содержимое
+    распаковывается при отдаче. Поддерживается один диапазон (данные до его
+    начала распаковываются и отбрасываются), для нескольких файл отдаётся целиком.
+    """
+    # Ключ сжатого файла - хеш его исходного содержимого
+    etag = f'"{etag_key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        ranges = None
+        if size is not None and request.method in ('GET', 'HEAD') and if_range_matches(request, etag, 0):
+            ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        else:
+            start, length = 0, size
+            if ranges and len(ranges) == 1:
+                start, end = ranges[0]
+                length = end - start + 1
+            blocks = iter_content(name, encoding, start, None if ranges is None or len(ranges) > 1 else length)
+            body = aiter_in_thread(blocks) if is_asgi_request(request) else blocks
+            response = StreamingHttpResponse(body, content_type=content_type)
+            if length is not None:
+                response['Content-Length'] = length
+            if ranges and len(ranges) == 1:
+                response.status_code = 206
+                response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+            response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        response['Accept-Ranges'] = 'bytes' if size is not None else 'none'
+
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control or settings.STORAGE_PRIVATE_CACHE_CONTROL
+    return response
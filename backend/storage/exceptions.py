@@ -1,5 +1,14 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.views import exception_handler
 
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Недостаточно места в хранилище'
+    default_code = 'quota_exceeded'
+
+
 def custom_exception_handler(exc, context):
     response = exception_handler(exc, context)
 
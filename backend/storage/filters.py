@@ -0,0 +1,16 @@
+from rest_framework.filters import SearchFilter
+from .search import search_files
+
+
+class FileSearchFilter(SearchFilter):
+    """
+    Поиск по параметру q через search_files (полнотекстовый и по триграммам)
+    вместо ILIKE по search_fields. Порядок результатов по релевантности
+    задаёт FileCursorPagination.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        if not text:
+            return queryset
+        return search_files(queryset, text)
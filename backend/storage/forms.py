@@ -9,4 +9,4 @@ class CustomUserCreationForm(UserCreationForm):
 class CustomUserChangeForm(UserChangeForm):
     class Meta:
         model = CustomUser
-        fields = ('username', 'email', 'first_name', 'last_name', 'storage_path')
+        fields = ('username', 'email', 'first_name', 'last_name', 'storage_path', 'storage_quota')
@@ -0,0 +1,177 @@
+import atexit
+import logging
+import queue
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Avg, Count, F, Min, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def register(kind):
+    """Регистрирует функцию-обработчик задачи: @register('process_upload')"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, unique=False, **payload):
+    """
+    Ставит задачу в очередь в текущей транзакции. unique - не добавлять,
+    если такая же задача уже ждёт выполнения.
+
+    Без воркера (STORAGE_JOBS_ENABLED=False) задачу после фиксации транзакции
+    выполняет фоновый поток того же процесса (local_runner), ответ её не ждёт.
+    """
+    from .models import Job
+
+    if kind not in HANDLERS:
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+
+    if not settings.STORAGE_JOBS_ENABLED:
+        transaction.on_commit(lambda: local_runner.submit(kind, payload))
+        return None
+
+    if unique and Job.objects.filter(kind=kind, payload=payload, status=Job.STATUS_PENDING).exists():
+        return None
+    job = Job.objects.create(kind=kind, payload=payload)
+    logger.debug("Задача %s #%s поставлена в очередь", kind, job.pk)
+    return job
+
+
+def run_inline(kind, payload):
+    try:
+        HANDLERS[kind](**payload)
+    except Exception as e:
+        logger.error("Ошибка выполнения задачи %s: %s", kind, str(e))
+
+
+class LocalRunner:
+    """
+    Выполнение задач без воркера run_jobs.
+
+    Задачи копятся в очереди в памяти процесса и выполняются по одной
+    фоновым потоком, поэтому запрос, поставивший задачу, не ждёт её. При
+    обычном завершении процесса оставшиеся задачи выполняются до выхода,
+    при аварийном - теряются, как и без очереди; надёжная очередь в БД -
+    STORAGE_JOBS_ENABLED=True.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, kind, payload):
+        self._queue.put((kind, payload))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='storage-jobs', daemon=True)
+                self._thread.start()
+                atexit.register(self.drain)
+
+    def run(self):
+        while True:
+            kind, payload = self._queue.get()
+            try:
+                run_inline(kind, payload)
+            finally:
+                connections.close_all()
+                self._queue.task_done()
+
+    def drain(self):
+        """Дожидается выполнения всех поставленных задач"""
+        self._queue.join()
+
+
+local_runner = LocalRunner()
+
+
+def claim(limit):
+    """
+    Забирает до limit готовых к выполнению задач. Зависшие задачи (воркер
+    завершился аварийно) снова выдаются через STORAGE_JOB_TIMEOUT секунд.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    stuck = now - timedelta(seconds=settings.STORAGE_JOB_TIMEOUT)
+    with transaction.atomic():
+        # skip_locked: несколько воркеров не получат одну и ту же задачу
+        ids = list(Job.objects.select_for_update(skip_locked=True)
+                   .filter(Q(status=Job.STATUS_PENDING, run_after__lte=now)
+                           | Q(status=Job.STATUS_RUNNING, started_at__lt=stuck))
+                   .order_by('run_after', 'id')
+                   .values_list('id', flat=True)[:limit])
+        Job.objects.filter(pk__in=ids).update(
+            status=Job.STATUS_RUNNING, started_at=now, attempts=F('attempts') + 1)
+    return ids
+
+
+def execute(job_id):
+    """Выполнение задачи в процессе воркера, с повтором при ошибке"""
+    from .models import Job
+
+    close_old_connections()
+    job = Job.objects.get(pk=job_id)
+    try:
+        HANDLERS[job.kind](**job.payload)
+    except Exception as e:
+        logger.error("Ошибка выполнения задачи %s #%s (попытка %d): %s",
+                     job.kind, job.pk, job.attempts, str(e))
+        if job.attempts < settings.STORAGE_JOB_MAX_ATTEMPTS:
+            # Экспоненциальная задержка перед повтором
+            delay = settings.STORAGE_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_PENDING, last_error=str(e),
+                run_after=timezone.now() + timedelta(seconds=delay))
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_FAILED, last_error=str(e), finished_at=timezone.now())
+        return False
+    finally:
+        close_old_connections()
+
+    Job.objects.filter(pk=job.pk).update(status=Job.STATUS_DONE, finished_at=timezone.now())
+    logger.debug("Задача %s #%s выполнена", job.kind, job.pk)
+    return True
+
+
+def prune():
+    """Удаляет выполненные задачи старше STORAGE_JOB_RETENTION секунд"""
+    from .models import Job
+
+    cutoff = timezone.now() - timedelta(seconds=settings.STORAGE_JOB_RETENTION)
+    deleted, _ = Job.objects.filter(status=Job.STATUS_DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def metrics():
+    """
+    Метрики очереди для подбора числа воркеров: глубина очереди по статусам
+    и типам, возраст самой старой ждущей задачи, среднее ожидание и время
+    выполнения задач за последний час (в секундах).
+    """
+    from .models import Job
+
+    now = timezone.now()
+    pending = Job.objects.filter(status=Job.STATUS_PENDING, run_after__lte=now)
+    recent = Job.objects.filter(status=Job.STATUS_DONE, finished_at__gte=now - timedelta(hours=1))
+    oldest = pending.aggregate(oldest=Min('run_after'))['oldest']
+    timings = recent.aggregate(wait=Avg(F('started_at') - F('created_at')),
+                               run=Avg(F('finished_at') - F('started_at')))
+
+    return {
+        'by_status': dict(Job.objects.values_list('status').annotate(count=Count('id')).order_by()),
+        'pending_by_kind': dict(pending.values_list('kind').annotate(count=Count('id')).order_by()),
+        'oldest_pending_age': (now - oldest).total_seconds() if oldest else 0,
+        'avg_wait': timings['wait'].total_seconds() if timings['wait'] else 0,
+        'avg_run': timings['run'].total_seconds() if timings['run'] else 0,
+        'done_last_hour': recent.count(),
+    }
@@ -0,0 +1,44 @@
+import os
+import hashlib
+import uuid
+from django.conf import settings
+from django.utils.text import get_valid_filename
+
+USER_FILES_DIR = 'uploads'
+
+
+def shard_dirs(key):
+    """
+    Промежуточные каталоги для ключа: при STORAGE_SHARD_DEPTH=2 и
+    STORAGE_SHARD_WIDTH=2 ключ 'abcdef...' даёт ['ab', 'cd']. Так в одном
+    каталоге оказывается не больше 16**ширина записей на уровень.
+    """
+    width = settings.STORAGE_SHARD_WIDTH
+    return [key[level * width:(level + 1) * width] for level in range(settings.STORAGE_SHARD_DEPTH)]
+
+
+def sharded_name(base, key, filename):
+    return os.path.join(base, *shard_dirs(key), filename)
+
+
+def user_file_name(storage_path, original_name):
+    """Новое уникальное имя файла пользователя: uploads/user_.../ab/cd/<uuid>_<имя>.
+    От имени остаётся только последняя часть пути без недопустимых символов"""
+    key = uuid.uuid4().hex
+    filename = get_valid_filename(os.path.basename(original_name.replace('\\', '/')))
+    return sharded_name(os.path.join(USER_FILES_DIR, storage_path), key, f'{key}_{filename}')
+
+
+def file_key(filename):
+    """Ключ раскладки для существующего файла: uuid из начала имени, для
+    файлов с другими именами - хеш имени"""
+    prefix = filename.split('_', 1)[0]
+    if len(prefix) == 32 and all(char in '0123456789abcdef' for char in prefix):
+        return prefix
+    return hashlib.md5(filename.encode()).hexdigest()
+
+
+def expected_user_file_name(storage_path, name):
+    """Где файл пользователя должен лежать при текущих настройках раскладки"""
+    filename = os.path.basename(name)
+    return sharded_name(os.path.join(USER_FILES_DIR, storage_path), file_key(filename), filename)
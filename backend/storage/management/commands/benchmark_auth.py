@@ -0,0 +1,69 @@
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.views import APIView
+from storage.authentication import CachedTokenAuthentication
+from storage.models import CustomUser, File
+
+
+class Command(BaseCommand):
+    help = ('Количество запросов к БД и время ответа на запрос для files/, users/me/ и view '
+            'с TokenAuthentication и с CachedTokenAuthentication')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Пользователь, от имени которого выполняются запросы')
+        parser.add_argument('--repeat', type=int, default=20, help='Количество запросов на endpoint')
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['username'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"Пользователь {options['username']} не найден")
+
+        token, _ = Token.objects.get_or_create(user=user)
+        file = File.objects.filter(user=user).first()
+        endpoints = {
+            'files/': ('/api/files/', {'HTTP_AUTHORIZATION': f'Token {token.key}'}),
+            'users/me/': ('/api/users/me/', {'HTTP_AUTHORIZATION': f'Token {token.key}'}),
+        }
+        if file:
+            endpoints['view'] = (f'/api/files/{file.pk}/view/?token={token.key}', {})
+        else:
+            self.stderr.write("У пользователя нет файлов, view не измеряется")
+
+        # Без кеша: кеш очищается перед каждым запросом, как если бы его не было
+        # (view разрешает токен сам и тоже обращается к БД)
+        modes = {
+            'TokenAuthentication': ([TokenAuthentication], True),
+            'CachedTokenAuthentication': ([CachedTokenAuthentication], False),
+        }
+
+        self.stdout.write(f"{'endpoint':<12}{'аутентификация':<28}{'запросов к БД':>15}{'мс/запрос':>12}")
+        client = Client()
+        for endpoint, (url, headers) in endpoints.items():
+            for mode, (classes, clear_cache) in modes.items():
+                with mock.patch.object(APIView, 'authentication_classes', classes):
+                    cache.clear()
+                    client.get(url, **headers)  # прогрев кеша
+                    queries, elapsed = self.measure(client, url, headers, options['repeat'], clear_cache)
+                self.stdout.write(f"{endpoint:<12}{mode:<28}{queries:>15.1f}{elapsed * 1000:>12.2f}")
+
+    def measure(self, client, url, headers, repeat, clear_cache):
+        total_queries = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            if clear_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url, **headers)
+                if response.streaming:
+                    for _chunk in response.streaming_content:
+                        pass
+            total_queries += len(context.captured_queries)
+        return total_queries / repeat, (time.perf_counter() - start) / repeat
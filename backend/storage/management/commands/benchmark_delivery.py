@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from rest_framework.authtoken.models import Token
+from storage.models import File
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_BACKENDS = {
+    'python': 'storage.delivery.PythonDelivery',
+    'sendfile': 'storage.delivery.SendfileDelivery',
+}
+
+
+class SendfileWrapper:
+    """wsgi.file_wrapper, передающий файл через os.sendfile, как это делает gunicorn"""
+
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        if hasattr(self.filelike, 'close'):
+            self.filelike.close()
+
+
+class Command(BaseCommand):
+    help = ('Сравнение пропускной способности и затрат CPU на гигабайт при отдаче файла '
+            'через download и download-by-link для разных способов доставки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_id', type=int, help='ID файла для скачивания')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество скачиваний на режим')
+        parser.add_argument('--range', dest='byte_range', default='',
+                            help='Заголовок Range, например bytes=0-1048575')
+
+    def handle(self, *args, **options):
+        try:
+            file = File.objects.select_related('user').get(pk=options['file_id'])
+        except File.DoesNotExist:
+            raise CommandError(f"Файл с ID {options['file_id']} не найден")
+
+        token, _ = Token.objects.get_or_create(user=file.user)
+        endpoints = {
+            'download': (f'/api/files/{file.pk}/download/', {'HTTP_AUTHORIZATION': f'Token {token.key}'}),
+            'download-by-link': (f'/api/files/download-by-link/{file.special_link}/', {}),
+        }
+        headers = {'HTTP_RANGE': options['byte_range']} if options['byte_range'] else {}
+
+        self.stdout.write(f"Файл: {file.original_name} ({file.size} байт), повторов: {options['repeat']}")
+        self.stdout.write(f"{'endpoint':<18}{'режим':<10}{'МБ/с':>10}{'CPU с/ГБ':>12}{'байт':>14}")
+
+        with open(os.devnull, 'wb') as devnull:
+            for endpoint, (url, auth) in endpoints.items():
+                for mode, backend in DELIVERY_BACKENDS.items():
+                    with override_settings(STORAGE_DELIVERY_BACKEND=backend):
+                        sent, wall, cpu = self.measure(url, {**auth, **headers}, mode, devnull, options['repeat'])
+                    gigabytes = sent / 1024 ** 3
+                    self.stdout.write(
+                        f"{endpoint:<18}{mode:<10}"
+                        f"{sent / 1024 ** 2 / wall if wall else 0:>10.1f}"
+                        f"{cpu / gigabytes if gigabytes else 0:>12.3f}"
+                        f"{sent:>14}"
+                    )
+
+    def measure(self, url, headers, mode, devnull, repeat):
+        """Прогон запросов через WSGI-приложение с выводом тела в /dev/null"""
+        application = WSGIHandler()
+        sent = 0
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+        for _ in range(repeat):
+            environ = RequestFactory().get(url, **headers).environ
+            if mode == 'sendfile':
+                environ['wsgi.file_wrapper'] = SendfileWrapper
+
+            result = application(environ, lambda status, response_headers, exc_info=None: None)
+            try:
+                if isinstance(result, SendfileWrapper):
+                    sent += self.sendfile(result.filelike, devnull)
+                else:
+                    for chunk in result:
+                        devnull.write(chunk)
+                        sent += len(chunk)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        return sent, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    def sendfile(self, filelike, devnull):
+        fileno = filelike.fileno()
+        offset = os.lseek(fileno, 0, os.SEEK_CUR)
+        count = getattr(filelike, 'remaining', None)
+        if count is None:
+            count = os.fstat(fileno).st_size - offset
+        sent = 0
+        while sent < count:
+            chunk = os.sendfile(devnull.fileno(), fileno, offset + sent, count - sent)
+            if not chunk:
+                break
+            sent += chunk
+        return sent
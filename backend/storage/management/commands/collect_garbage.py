@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from storage import bulk, deletion
+from storage.backends import get_storage
+from storage.blobs import BLOBS_DIR
+from storage.deletion import deletion_worker
+from storage.models import Blob, File, PendingDeletion, UploadSession
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'
+
+
+class Command(BaseCommand):
+    help = ('Сборка мусора в хранилище: файлы без записей в БД, записи без файлов, '
+            'брошенные сессии загрузки, временные файлы и очередь удаления')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество файлов или строк за проход')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Не трогать файлы моложе стольких секунд (идущие загрузки)')
+        parser.add_argument('--session-age', type=int, default=24,
+                            help='Через сколько часов без изменений сессия загрузки считается брошенной')
+        parser.add_argument('--delete-missing', action='store_true',
+                            help='Удалять записи о файлах, которых нет в хранилище')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать найденное')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.storage = get_storage()
+
+        stale = self.collect_sessions(options['session_age'])
+        scratch = self.collect_scratch(options['min_age'])
+        orphans = self.collect_orphans(options['min_age'])
+        missing = self.collect_missing(options['delete_missing'])
+
+        removed = 0
+        if not self.dry_run:
+            removed = deletion_worker.process(self.batch_size)
+        queued = PendingDeletion.objects.count()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Брошенных сессий загрузки: {stale}, временных файлов: {scratch}, файлов без записей: {orphans}, "
+            f"записей без файлов: {missing}, удалено из хранилища: {removed}, осталось в очереди: {queued}"))
+
+    def collect_sessions(self, session_age):
+        """Брошенные сессии загрузки: недогруженные части удаляются с локального диска"""
+        cutoff = timezone.now() - timedelta(hours=session_age)
+        sessions = UploadSession.objects.filter(status=UploadSession.STATUS_ACTIVE, updated_at__lt=cutoff)
+        total = 0
+        while True:
+            batch = list(sessions.order_by('created_at')[:self.batch_size])
+            if not batch:
+                return total
+            total += len(batch)
+            for upload in batch:
+                self.stdout.write(f"Брошенная загрузка {upload.id} ({upload.original_name})")
+            if self.dry_run:
+                return total
+            UploadSession.objects.filter(pk__in=[upload.pk for upload in batch]).delete()
+            for upload in batch:
+                upload.discard()
+            logger.info("Удалено брошенных сессий загрузки: %d", len(batch))
+
+    def is_scratch(self, name):
+        """Временные файлы загрузок, которые всегда лежат на локальном диске"""
+        return name.endswith(PART_SUFFIX) or name.startswith(os.path.join(BLOBS_DIR, 'tmp') + os.sep)
+
+    def collect_scratch(self, min_age):
+        """Временные файлы незавершённых загрузок и части без активной сессии"""
+        root = os.path.join(settings.MEDIA_ROOT, 'uploads')
+        cutoff = time.time() - min_age
+        candidates = []
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, settings.MEDIA_ROOT)
+                try:
+                    if not self.is_scratch(name) or os.stat(path).st_mtime > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                candidates.append(name)
+
+        parts = [name[:-len(PART_SUFFIX)] for name in candidates if name.endswith(PART_SUFFIX)]
+        active = {name + PART_SUFFIX for name in UploadSession.objects.filter(
+            target_name__in=parts, status=UploadSession.STATUS_ACTIVE).values_list('target_name', flat=True)}
+        garbage = [name for name in candidates if name not in active]
+        for name in garbage:
+            self.stdout.write(f"Временный файл: {name}")
+            if not self.dry_run:
+                try:
+                    os.remove(os.path.join(settings.MEDIA_ROOT, name))
+                except FileNotFoundError:
+                    pass
+        return len(garbage)
+
+    def walk_uploads(self, min_age):
+        """Файлы пользователей в хранилище старше min_age"""
+        cutoff = time.time() - min_age
+        for name, mtime in self.storage.iter_names('uploads'):
+            if mtime <= cutoff and not self.is_scratch(name):
+                yield name
+
+    def collect_orphans(self, min_age):
+        """Файлы на диске, на которые не ссылается ни одна запись"""
+        total = 0
+        batch = []
+        for name in self.walk_uploads(min_age):
+            batch.append(name)
+            if len(batch) >= self.batch_size:
+                total += self.handle_orphans(batch)
+                batch = []
+        if batch:
+            total += self.handle_orphans(batch)
+        return total
+
+    def handle_orphans(self, names):
+        referenced = set(Blob.objects.filter(name__in=names).values_list('name', flat=True))
+        referenced.update(File.objects.filter(file_path__in=names).values_list('file_path', flat=True))
+        referenced.update(PendingDeletion.objects.filter(name__in=names).values_list('name', flat=True))
+
+        orphans = [name for name in names if name not in referenced]
+        for name in orphans:
+            self.stdout.write(f"Файл без записи в БД: {name}")
+        if orphans and not self.dry_run:
+            with transaction.atomic():
+                deletion.enqueue(orphans)
+        return len(orphans)
+
+    def collect_missing(self, delete_missing):
+        """Записи о файлах и содержимом, которых нет в хранилище"""
+        total = 0
+        for model, field in ((Blob, 'name'), (File, 'file_path')):
+            last_id = 0
+            while True:
+                rows = list(model.objects.filter(pk__gt=last_id).order_by('pk')
+                            .values_list('pk', field)[:self.batch_size])
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                missing = [pk for pk, name in rows if not self.storage.exists(name)]
+                for pk in missing:
+                    self.stdout.write(f"{model._meta.verbose_name} с ID {pk} отсутствует в хранилище")
+                total += len(missing)
+                if model is File and missing and delete_missing and not self.dry_run:
+                    bulk.delete_files(File.objects.filter(pk__in=missing))
+                    logger.warning("Удалено записей о файлах, отсутствующих в хранилище: %d", len(missing))
+        return total
@@ -0,0 +1,75 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from storage import blobs
+from storage.backends import get_storage
+from storage.models import CustomUser, File
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Перенос существующих файлов в хранилище содержимого с дедупликацией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Количество файлов за проход')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет перенесено')
+
+    def handle(self, *args, **options):
+        migrated = missing = changed = failed = 0
+        last_id = 0
+        storage = get_storage()
+
+        while True:
+            batch = list(File.objects.filter(blob__isnull=True, pk__gt=last_id)
+                         .order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+
+            for file in batch:
+                name = file.file_path.name
+                if not name or not storage.exists(name):
+                    self.stderr.write(f"Файл {file.pk} ('{file.original_name}') не найден в хранилище: {name}")
+                    missing += 1
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f"Будет перенесён файл {file.pk}: {file.file_path.name}")
+                    migrated += 1
+                    continue
+                try:
+                    if self.migrate_file(file.pk, name):
+                        migrated += 1
+                    else:
+                        changed += 1
+                except Exception as e:
+                    logger.error("Ошибка переноса файла %s: %s", file.pk, str(e))
+                    self.stderr.write(f"Ошибка переноса файла {file.pk}: {e}")
+                    failed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено: {migrated}, не найдено в хранилище: {missing}, "
+            f"изменено во время переноса: {changed}, ошибок: {failed}"))
+
+    def migrate_file(self, file_id, name):
+        """
+        Перенос одного файла; исходный файл ставится в очередь удаления
+        и удаляется только после фиксации транзакции. Хеш считается до
+        блокировки строки, чтобы чтение большого файла не задерживало
+        запись; если за это время файл удалили, перенесли или заменили,
+        он пропускается (False).
+        """
+        storage = get_storage()
+        size = storage.size(name)
+        sha256 = blobs.hash_stored(name)
+        with transaction.atomic():
+            file = File.objects.select_for_update().filter(pk=file_id).first()
+            if file is None or file.blob_id or file.file_path.name != name or storage.size(name) != size:
+                logger.info("Файл %s изменился во время подсчёта хеша, перенос пропущен", file_id)
+                return False
+            stored_size = file.stored_size
+            file.attach_blob(blobs.ingest_stored(name, sha256, size))
+            file.save(update_fields=['blob', 'sha256', 'file_path', 'encoding', 'stored_size'])
+            CustomUser(pk=file.user_id).change_usage(file.stored_size - stored_size, 0)
+        logger.info("Файл %s перенесён в хранилище содержимого (%s)", file_id, sha256)
+        return True
@@ -0,0 +1,44 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from storage.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков занятого места и количества файлов пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество пользователей за проход')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        checked = fixed = 0
+        last_id = 0
+
+        while True:
+            users = list(
+                CustomUser.objects.filter(pk__gt=last_id).order_by('pk')
+                .annotate(actual_bytes=Coalesce(Sum('file__stored_size'), 0), actual_count=Count('file'))
+                [:options['batch_size']]
+            )
+            if not users:
+                break
+            last_id = users[-1].pk
+
+            for user in users:
+                checked += 1
+                if user.used_bytes == user.actual_bytes and user.file_count == user.actual_count:
+                    continue
+                self.stdout.write(
+                    f"{user.username}: {user.used_bytes} -> {user.actual_bytes} байт, "
+                    f"{user.file_count} -> {user.actual_count} файлов")
+                if not options['dry_run']:
+                    CustomUser.objects.filter(pk=user.pk).update(
+                        used_bytes=user.actual_bytes, file_count=user.actual_count)
+                    logger.info("Исправлены счётчики хранилища пользователя %s", user.username)
+                fixed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Проверено пользователей: {checked}, с расхождениями: {fixed}"))
@@ -0,0 +1,107 @@
+import time
+import logging
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from storage import deletion, layout
+from storage.backends import get_storage
+from storage.blobs import blob_name
+from storage.models import Blob, File
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Перенос существующих файлов в раскладку по подкаталогам из настроек '
+            'STORAGE_SHARD_DEPTH/STORAGE_SHARD_WIDTH без остановки сайта')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Количество файлов за проход')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Пауза между проходами, секунд (снижает нагрузку на диск)')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать файлы для переноса')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.sleep = options['sleep']
+        self.dry_run = options['dry_run']
+        self.storage = get_storage()
+
+        blobs_moved = self.reshard(Blob.objects.all(), self.move_blobs)
+        files_moved = self.reshard(File.objects.filter(blob__isnull=True).select_related('user'),
+                                   self.move_files)
+
+        verb = 'Требуют переноса' if self.dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb}: содержимого {blobs_moved}, файлов вне хранилища содержимого {files_moved}"))
+
+    def reshard(self, queryset, move):
+        """Проход по таблице пачками по возрастанию id"""
+        total = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # Строки блокируются, чтобы параллельная загрузка или удаление
+                # не увидели наполовину перенесённый файл
+                rows = list(queryset.select_for_update(of=('self',)).filter(pk__gt=last_id)
+                            .order_by('pk')[:self.batch_size])
+                if not rows:
+                    return total
+                last_id = rows[-1].pk
+                total += move(rows)
+            if self.sleep:
+                time.sleep(self.sleep)
+
+    def move_blobs(self, rows):
+        moved = []
+        for blob in rows:
+            new_name = blob_name(blob.sha256)
+            if blob.name == new_name:
+                continue
+            if not self.dry_run and not self.link(blob.name, new_name):
+                continue
+            moved.append((blob, new_name))
+
+        if self.dry_run or not moved:
+            return len(moved)
+
+        old_names = []
+        for blob, new_name in moved:
+            old_names.append(blob.name)
+            blob.name = new_name
+            File.objects.filter(blob=blob).update(file_path=new_name)
+        Blob.objects.bulk_update([blob for blob, _ in moved], ['name'])
+        # Старые пути удаляются фоновым потоком после фиксации транзакции
+        deletion.enqueue(old_names)
+        logger.info("Перенесено содержимого в новую раскладку: %d", len(moved))
+        return len(moved)
+
+    def move_files(self, rows):
+        moved = []
+        old_names = []
+        for file in rows:
+            new_name = layout.expected_user_file_name(file.user.storage_path, file.file_path.name)
+            if file.file_path.name == new_name:
+                continue
+            if not self.dry_run and not self.link(file.file_path.name, new_name):
+                continue
+            old_names.append(file.file_path.name)
+            file.file_path.name = new_name
+            moved.append(file)
+
+        if self.dry_run or not moved:
+            return len(moved)
+
+        File.objects.bulk_update(moved, ['file_path'])
+        deletion.enqueue(old_names)
+        logger.info("Перенесено файлов в новую раскладку: %d", len(moved))
+        return len(moved)
+
+    def link(self, old_name, new_name):
+        """Файл появляется под новым именем, оставаясь доступным по старому:
+        скачивания, начатые до переноса, не прерываются"""
+        if not self.storage.exists(old_name):
+            self.stdout.write(self.style.WARNING(f"Файл отсутствует в хранилище: {old_name}"))
+            return False
+        if not self.storage.exists(new_name):
+            self.storage.copy(old_name, new_name)
+        return True
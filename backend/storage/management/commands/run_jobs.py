@@ -0,0 +1,70 @@
+import json
+import time
+import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from storage import jobs
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять выполненные задачи, секунд
+PRUNE_INTERVAL = 600
+
+
+def init_worker():
+    """Процессы пула запускаются через spawn и не разделяют соединения с БД
+    родительского процесса, поэтому Django инициализируется заново"""
+    import django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых задач: выполняет задачи из очереди в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.STORAGE_JOB_WORKERS,
+                            help='Количество процессов')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между опросами пустой очереди, секунд')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и завершиться')
+        parser.add_argument('--stats', action='store_true', help='Показать метрики очереди и завершиться')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(jobs.metrics(), ensure_ascii=False, indent=2))
+            return
+
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        logger.info("Воркер фоновых задач запущен, процессов: %d", workers)
+
+        context = multiprocessing.get_context('spawn')
+        running = set()
+        last_prune = 0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+            while True:
+                free = workers - len(running)
+                for job_id in (jobs.claim(free) if free > 0 else []):
+                    running.add(pool.submit(jobs.execute, job_id))
+
+                if not running:
+                    if options['once']:
+                        break
+                    if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                        jobs.prune()
+                        last_prune = time.monotonic()
+                    connections.close_all()
+                    time.sleep(poll_interval)
+                    continue
+
+                done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error("Процесс воркера завершился с ошибкой: %s", str(e))
+
+        self.stdout.write(self.style.SUCCESS("Очередь задач пуста"))
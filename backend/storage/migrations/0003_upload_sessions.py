@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:01
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0002_alter_file_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='size',
+            field=models.PositiveBigIntegerField(editable=False, verbose_name='Размер файла'),
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('original_name', models.CharField(max_length=255, verbose_name='Оригинальное название')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер файла')),
+                ('comment', models.TextField(blank=True, verbose_name='Комментарий')),
+                ('target_name', models.CharField(editable=False, max_length=500, verbose_name='Путь к файлу в хранилище')),
+                ('received_ranges', models.JSONField(default=list, editable=False, verbose_name='Полученные диапазоны')),
+                ('status', models.CharField(choices=[('active', 'Загружается'), ('completed', 'Завершена')], default='active', max_length=16, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+                ('file', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_session', to='storage.file', verbose_name='Файл')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сессия загрузки',
+                'verbose_name_plural': 'Сессии загрузки',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:07
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CREATE INDEX CONCURRENTLY без блокировки записи
+    # (см. 0012_query_indexes), такая миграция не может быть в транзакции
+    atomic = False
+
+    dependencies = [
+        ('storage', '0004_content_addressed_blobs'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['-upload_date', '-id'], name='file_upload_date_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['user', '-upload_date', '-id'], name='file_user_upload_date_id_idx'),
+        ),
+    ]
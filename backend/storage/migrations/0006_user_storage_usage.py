@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_storage_usage(apps, schema_editor):
+    CustomUser = apps.get_model('storage', 'CustomUser')
+    File = apps.get_model('storage', 'File')
+    user_files = File.objects.filter(user=OuterRef('pk')).order_by().values('user')
+    CustomUser.objects.update(
+        used_bytes=Coalesce(Subquery(user_files.annotate(total=Sum('size')).values('total')), 0),
+        file_count=Coalesce(Subquery(user_files.annotate(count=Count('pk')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0005_file_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='file_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество файлов'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='storage_quota',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Пусто - квота по умолчанию (STORAGE_DEFAULT_QUOTA)', null=True, verbose_name='Квота хранилища (байт)'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='used_bytes',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Занято байт'),
+        ),
+        migrations.RunPython(fill_storage_usage, migrations.RunPython.noop),
+    ]
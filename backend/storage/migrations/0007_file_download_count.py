@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0006_user_storage_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='download_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество скачиваний'),
+        ),
+    ]
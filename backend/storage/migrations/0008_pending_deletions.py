@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0007_file_download_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500, verbose_name='Путь относительно MEDIA_ROOT')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток удаления')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Поставлено в очередь')),
+            ],
+            options={
+                'verbose_name': 'Файл на удаление',
+                'verbose_name_plural': 'Очередь удаления файлов',
+                'indexes': [models.Index(fields=['name'], name='pendingdeletion_name_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:27
+
+import storage.backends
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0009_background_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='file_path',
+            field=models.FileField(max_length=500, storage=storage.backends.get_storage, upload_to='', verbose_name='Адрес файла'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:32
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # GIN-индексы строятся CREATE INDEX CONCURRENTLY без блокировки записи,
+    # поэтому миграция выполняется вне транзакции. Добавление хранимого
+    # вычисляемого столбца search_vector PostgreSQL выполняет только с
+    # перезаписью таблицы под блокировкой: на время migrate таблица файлов
+    # недоступна, это делается в окно обслуживания
+    atomic = False
+
+    dependencies = [
+        ('storage', '0010_file_storage_backend'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddField(
+            model_name='file',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('original_name', config='russian', weight='A'), '||', django.contrib.postgres.search.SearchVector('comment', config='russian', weight='B'), django.contrib.postgres.search.SearchConfig('russian')), output_field=django.contrib.postgres.search.SearchVectorField(), verbose_name='Поисковый вектор'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='file',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='file_search_vector_idx'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='file',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('original_name'), name='gin_trgm_ops'), name='file_original_name_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:34
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицы, но не может
+    # выполняться внутри транзакции. Если построение прервётся, останется
+    # недействительный индекс: его нужно удалить (DROP INDEX CONCURRENTLY)
+    # и повторить migrate.
+    atomic = False
+
+    dependencies = [
+        ('storage', '0011_file_search'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='blob',
+            index=models.Index(fields=['name'], name='blob_name_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['size'], name='file_size_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['user', 'size'], name='file_user_size_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['last_download_date'], name='file_last_download_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['user', 'last_download_date'], name='file_user_last_download_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['original_name'], name='file_original_name_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['user', 'original_name'], name='file_user_original_name_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='file',
+            index=models.Index(fields=['file_path'], name='file_file_path_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='uploadsession',
+            index=models.Index(fields=['status', 'updated_at'], name='uploadsession_status_upd_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:47
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_stored_size(apps, schema_editor):
+    # Существующие файлы хранятся без сжатия
+    for model in ('Blob', 'File'):
+        apps.get_model('storage', model).objects.update(stored_size=F('size'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='encoding',
+            field=models.CharField(blank=True, choices=[('', 'Без сжатия'), ('gzip', 'gzip'), ('zstd', 'zstd')], default='', max_length=8, verbose_name='Сжатие'),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='stored_size',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Размер на диске'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='encoding',
+            field=models.CharField(blank=True, choices=[('', 'Без сжатия'), ('gzip', 'gzip'), ('zstd', 'zstd')], default='', editable=False, max_length=8, verbose_name='Сжатие'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='stored_size',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Размер на диске'),
+        ),
+        migrations.RunPython(fill_stored_size, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,19 @@
 import os
 import uuid
+import asyncio
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Upper
+from django.utils import timezone
+from django.utils._os import safe_join
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django_cleanup import cleanup
+from . import blobs, compression, deletion, layout
+from .backends import get_storage
+from .search import file_search_vector
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,6 +22,13 @@ class CustomUser(AbstractUser):
     storage_path = models.CharField(max_length=255,
                                     verbose_name='Место хранения файлов',
                                     default='')
+    # Счётчики обновляются при создании и удалении файлов (signals.py),
+    # расхождения исправляет команда reconcile_storage_usage
+    used_bytes = models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Занято байт')
+    file_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество файлов')
+    storage_quota = models.PositiveBigIntegerField(null=True, blank=True,
+                                                   verbose_name='Квота хранилища (байт)',
+                                                   help_text='Пусто - квота по умолчанию (STORAGE_DEFAULT_QUOTA)')
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
@@ -20,52 +38,172 @@ class CustomUser(AbstractUser):
             logger.info("Создана папка для пользователя %s: %s", self.username, self.storage_path)
             self.save(update_fields=['storage_path'])
 
+    def delete(self, *args, **kwargs):
+        """
+        Файлы пользователя удаляются пачкой (bulk.delete_files) до каскада,
+        иначе каскад загрузит и обработает сигналом каждый файл. При удалении
+        через QuerySet.delete() файлы удаляются каскадом по одному.
+        """
+        from . import bulk
+
+        with transaction.atomic():
+            bulk.delete_files(File.objects.filter(user=self))
+            return super().delete(*args, **kwargs)
+
     def get_file_count(self):
-        return File.objects.filter(user=self).count()
+        return self.file_count
 
     def get_total_file_size(self):
-        return round(sum(file.size for file in File.objects.filter(user=self)) / 1024 / 1024, 2)
+        return self.bytes_to_mb(self.used_bytes)
+
+    @property
+    def quota(self):
+        """Квота в байтах или None, если хранилище не ограничено"""
+        if self.storage_quota is not None:
+            return self.storage_quota
+        return settings.STORAGE_DEFAULT_QUOTA or None
+
+    def has_quota_for(self, size):
+        quota = self.quota
+        if quota is None:
+            return True
+        # Объект пользователя может быть взят из кеша аутентификации,
+        # поэтому занятое место читается из БД
+        used_bytes = CustomUser.objects.filter(pk=self.pk).values_list('used_bytes', flat=True).first() or 0
+        return used_bytes + size <= quota
+
+    def change_usage(self, size, count):
+        """Атомарное изменение счётчиков занятого места без чтения строки"""
+        from .authentication import invalidate_user
+
+        CustomUser.objects.filter(pk=self.pk).update(
+            used_bytes=Greatest(F('used_bytes') + size, 0),
+            file_count=Greatest(F('file_count') + count, 0),
+        )
+        invalidate_user(self.pk)
+
+    @staticmethod
+    def bytes_to_mb(size):
+        return round((size or 0) / 1024 / 1024, 2)
 
     def __str__(self):
         return self.username
 
+class Blob(models.Model):
+    """Содержимое файла, хранящееся на диске один раз для всех одинаковых файлов"""
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    name = models.CharField(max_length=500, verbose_name='Путь в хранилище')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    encoding = models.CharField(max_length=8, blank=True, default='', choices=compression.ENCODING_CHOICES,
+                                verbose_name='Сжатие')
+    stored_size = models.PositiveBigIntegerField(default=0, verbose_name='Размер на диске')
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+
+    def __str__(self):
+        return self.sha256
+
+    class Meta:
+        verbose_name = 'Содержимое'
+        verbose_name_plural = 'Содержимое'
+        indexes = [
+            # Проверка очереди удаления и сборка мусора ищут содержимое по пути
+            models.Index(fields=['name'], name='blob_name_idx'),
+        ]
+
+
+class PendingDeletion(models.Model):
+    """Файл на диске, ожидающий удаления фоновым потоком (deletion.py)"""
+    name = models.CharField(max_length=500, verbose_name='Путь относительно MEDIA_ROOT')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток удаления')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Поставлено в очередь')
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Файл на удаление'
+        verbose_name_plural = 'Очередь удаления файлов'
+        indexes = [
+            models.Index(fields=['name'], name='pendingdeletion_name_idx'),
+        ]
+
+
+# Файлы на диске удаляются через счётчик ссылок Blob, а не django_cleanup
+@cleanup.ignore
 class File(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE,
                              verbose_name='Пользователь')
     original_name = models.CharField(max_length=255, editable=False, verbose_name='Оригинальное название')
-    size = models.PositiveIntegerField(editable=False, verbose_name='Размер файла')
+    size = models.PositiveBigIntegerField(editable=False, verbose_name='Размер файла')
+    # Размер содержимого в хранилище с учётом сжатия: по нему считается
+    # занятое место пользователя (used_bytes) и квота
+    stored_size = models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Размер на диске')
     upload_date = models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')
     last_download_date = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Последняя дата скачивания')
+    download_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество скачиваний')
     comment = models.TextField(blank=True, verbose_name='Комментарий')
-    file_path = models.FileField(upload_to='', verbose_name='Адрес файла', max_length=500)
+    file_path = models.FileField(upload_to='', storage=get_storage, verbose_name='Адрес файла', max_length=500)
     special_link = models.CharField(max_length=255, unique=True, editable=False, verbose_name='Специальная ссылка')
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False, verbose_name='SHA-256')
+    # Копия Blob.encoding: отдача файла обходится без чтения содержимого из БД
+    encoding = models.CharField(max_length=8, blank=True, default='', editable=False,
+                                choices=compression.ENCODING_CHOICES, verbose_name='Сжатие')
+    blob = models.ForeignKey(Blob, null=True, blank=True, on_delete=models.PROTECT, editable=False,
+                             related_name='files', verbose_name='Содержимое')
+    # Вычисляется базой данных при любой записи, в том числе bulk_update и update()
+    search_vector = models.GeneratedField(expression=file_search_vector(), output_field=SearchVectorField(),
+                                          db_persist=True, verbose_name='Поисковый вектор')
 
     def save(self, *args, **kwargs):
         if not self.pk:
             self.special_link = uuid.uuid4().hex
             logger.info("Создан специальный линк для файла: %s", self.special_link)
 
-            self.file_path.name = self.get_upload_to()
-
-        user_folder = os.path.join(settings.MEDIA_ROOT, 'uploads', self.user.storage_path)
-        os.makedirs(user_folder, exist_ok=True)
+            # Новое содержимое сохраняется в хранилище с дедупликацией.
+            # Файл, уже записанный в хранилище (например, собранный из
+            # частей при докачке), сохраняет своё имя.
+            if self.file_path.name and not self.file_path._committed:
+                with transaction.atomic():
+                    self.attach_blob(blobs.store_upload(self.file_path.file))
+                    super().save(*args, **kwargs)
+                return
+            if not self.file_path.name:
+                self.file_path.name = self.get_upload_to()
+            # Файл вне хранилища содержимого лежит несжатым
+            self.stored_size = self.size
 
         super().save(*args, **kwargs)
 
+    def attach_blob(self, blob):
+        """Связывает файл с содержимым в хранилище"""
+        self.blob = blob
+        self.sha256 = blob.sha256
+        self.encoding = blob.encoding
+        self.stored_size = blob.stored_size
+        self.file_path.name = blob.name
+        self.file_path._committed = True
+
+    @property
+    def etag_key(self):
+        """Ключ для ETag: хеш содержимого, для ещё не перенесённых файлов - id"""
+        return self.sha256 or self.pk
+
     def get_upload_to(self):
-        unique_filename = f"{uuid.uuid4().hex}_{self.original_name}"
-        return os.path.join('uploads/', self.user.storage_path, unique_filename)
+        return layout.user_file_name(self.user.storage_path, self.original_name)
 
-    def delete(self, *args, **kwargs):
+    def delete_content(self):
+        """Освобождает содержимое файла: для общего содержимого уменьшается
+        счётчик ссылок, файл вне хранилища содержимого ставится в очередь удаления"""
+        if self.blob_id:
+            blobs.release(self.blob_id)
+            logger.info("Освобождено содержимое файла '%s'.", self.original_name)
+            return
         if self.file_path:
-            try:
-                if os.path.isfile(self.file_path.path):
-                    os.remove(self.file_path.path)
-                    logger.info("Файл '%s' успешно удален.", self.original_name)
-            except Exception as e:
-                logger.error("Ошибка при удалении файла '%s': %s", self.original_name, str(e))
-        super().delete(*args, **kwargs)
+            deletion.enqueue([self.file_path.name])
+            logger.info("Файл '%s' поставлен в очередь на удаление.", self.original_name)
 
     def __str__(self):
         return f"id файла: {self.id}"
@@ -73,3 +211,177 @@ class File(models.Model):
     class Meta:
         verbose_name = 'Файл'
         verbose_name_plural = 'Файлы'
+        indexes = [
+            # Постраничный вывод по курсору (upload_date, id): все файлы и файлы пользователя
+            models.Index(fields=['-upload_date', '-id'], name='file_upload_date_id_idx'),
+            models.Index(fields=['user', '-upload_date', '-id'], name='file_user_upload_date_id_idx'),
+            # Сортировка списка (параметр o): по всем файлам для staff и по файлам пользователя
+            models.Index(fields=['size'], name='file_size_idx'),
+            models.Index(fields=['user', 'size'], name='file_user_size_idx'),
+            models.Index(fields=['last_download_date'], name='file_last_download_idx'),
+            models.Index(fields=['user', 'last_download_date'], name='file_user_last_download_idx'),
+            models.Index(fields=['original_name'], name='file_original_name_idx'),
+            models.Index(fields=['user', 'original_name'], name='file_user_original_name_idx'),
+            # Сборка мусора сверяет файлы в хранилище с записями
+            models.Index(fields=['file_path'], name='file_file_path_idx'),
+            # Поиск (search.py): полнотекстовый и по триграммам названия
+            GinIndex(fields=['search_vector'], name='file_search_vector_idx'),
+            GinIndex(OpClass(Upper('original_name'), name='gin_trgm_ops'), name='file_original_name_trgm_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """Сессия загрузки файла по частям с возможностью докачки"""
+    STATUS_ACTIVE = 'active'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Загружается'),
+        (STATUS_COMPLETED, 'Завершена'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,
+                             related_name='upload_sessions',
+                             verbose_name='Пользователь')
+    original_name = models.CharField(max_length=255, verbose_name='Оригинальное название')
+    size = models.PositiveBigIntegerField(verbose_name='Размер файла')
+    comment = models.TextField(blank=True, verbose_name='Комментарий')
+    target_name = models.CharField(max_length=500, editable=False, verbose_name='Путь к файлу в хранилище')
+    received_ranges = models.JSONField(default=list, editable=False, verbose_name='Полученные диапазоны')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_ACTIVE, verbose_name='Статус')
+    file = models.OneToOneField(File, null=True, blank=True, on_delete=models.SET_NULL,
+                                related_name='upload_session', verbose_name='Файл')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлена')
+
+    def save(self, *args, **kwargs):
+        if not self.target_name:
+            self.target_name = layout.user_file_name(self.user.storage_path, self.original_name)
+        super().save(*args, **kwargs)
+
+    @property
+    def part_path(self):
+        """Путь к файлу, в который пишутся части до завершения загрузки.
+        Путь вне MEDIA_ROOT - SuspiciousFileOperation"""
+        return safe_join(settings.MEDIA_ROOT, f'{self.target_name}.part')
+
+    @property
+    def received_bytes(self):
+        return sum(end - start for start, end in self.received_ranges)
+
+    @property
+    def is_complete(self):
+        return self.received_ranges == [[0, self.size]] or self.size == 0
+
+    def missing_ranges(self):
+        """Диапазоны [start, end), которые ещё не получены"""
+        missing = []
+        position = 0
+        for start, end in self.received_ranges:
+            if start > position:
+                missing.append([position, start])
+            position = max(position, end)
+        if position < self.size:
+            missing.append([position, self.size])
+        return missing
+
+    def add_range(self, start, end):
+        """Добавляет полученный диапазон, объединяя пересекающиеся"""
+        ranges = sorted(self.received_ranges + [[start, end]])
+        merged = []
+        for range_start, range_end in ranges:
+            if merged and range_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+        self.received_ranges = merged
+
+    def allocate(self):
+        """Создаёт пустой файл нужного размера в папке пользователя"""
+        os.makedirs(os.path.dirname(self.part_path), exist_ok=True)
+        with open(self.part_path, 'wb') as f:
+            f.truncate(self.size)
+
+    async def awrite_chunk(self, offset, blocks, length):
+        """
+        Записывает часть файла из асинхронного потока блоков запроса. Запись
+        идёт в пуле потоков, следующий блок запрашивается после записи
+        предыдущего, поэтому в памяти держится не больше одного блока.
+        """
+        fd = await asyncio.to_thread(os.open, self.part_path, os.O_WRONLY)
+        written = 0
+        try:
+            async for block in blocks:
+                block = block[:length - written]
+                await asyncio.to_thread(os.pwrite, fd, block, offset + written)
+                written += len(block)
+                if written >= length:
+                    break
+        finally:
+            os.close(fd)
+        return written
+
+    def mark_received(self, start, end):
+        """Отмечает диапазон полученным под блокировкой строки: параллельные
+        части не затирают диапазоны друг друга. Возвращает обновлённую сессию"""
+        with transaction.atomic():
+            upload = UploadSession.objects.select_for_update().get(pk=self.pk)
+            upload.add_range(start, end)
+            upload.save(update_fields=['received_ranges', 'updated_at'])
+        return upload
+
+    def discard(self):
+        """Удаляет недогруженный файл"""
+        try:
+            if os.path.isfile(self.part_path):
+                os.remove(self.part_path)
+        except OSError as e:
+            logger.error("Ошибка при удалении части загрузки %s: %s", self.id, str(e))
+
+    def __str__(self):
+        return f"Загрузка {self.id} ({self.original_name})"
+
+    class Meta:
+        verbose_name = 'Сессия загрузки'
+        verbose_name_plural = 'Сессии загрузки'
+        indexes = [
+            # Поиск брошенных сессий в collect_garbage
+            models.Index(fields=['status', 'updated_at'], name='uploadsession_status_upd_idx'),
+        ]
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди, выполняемая командой run_jobs (jobs.py)"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнена'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=100, verbose_name='Тип задачи')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING,
+                              verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='Выполнить после')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начата')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершена')
+
+    def __str__(self):
+        return f"{self.kind} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            # Выборка очередных задач воркером
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
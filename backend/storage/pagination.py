@@ -0,0 +1,31 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.settings import api_settings
+
+
+class FileCursorPagination(CursorPagination):
+    """
+    Постраничный вывод файлов по курсору: новые файлы первыми.
+
+    Позиция хранится в курсоре, поэтому стоимость запроса не зависит от
+    номера страницы. Сортировка из параметра 'o' тоже поддерживается.
+    """
+    ordering = ('-upload_date', '-id')
+    page_size = settings.STORAGE_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.STORAGE_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        # Результаты поиска (storage.search) - по релевантности,
+        # если сортировка не задана явно
+        if 'search_position' in queryset.query.annotations and api_settings.ORDERING_PARAM not in request.query_params:
+            return ('-search_position',)
+        return super().get_ordering(request, queryset, view)
+
+
+class UserCursorPagination(CursorPagination):
+    """Постраничный вывод пользователей по курсору"""
+    ordering = ('id',)
+    page_size = settings.STORAGE_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.STORAGE_MAX_PAGE_SIZE
@@ -0,0 +1,311 @@
+import os
+import re
+import asyncio
+import mimetypes
+import uuid
+import logging
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+logger = logging.getLogger(__name__)
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Границы размера блока при потоковой отдаче: память воркера на один ответ
+# не превышает MAX_STREAM_BLOCK_SIZE независимо от размера файла
+MIN_STREAM_BLOCK_SIZE = 4 * 1024
+MAX_STREAM_BLOCK_SIZE = 8 * 1024 * 1024
+
+CONTENT_TYPES = {
+    '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif', '.bmp': 'image/bmp', '.svg': 'image/svg+xml',
+    '.webp': 'image/webp', '.pdf': 'application/pdf',
+    '.txt': 'text/plain', '.html': 'text/html', '.htm': 'text/html',
+    '.css': 'text/css', '.js': 'application/javascript',
+    '.json': 'application/json', '.xml': 'application/xml',
+    '.mp3': 'audio/mpeg', '.mp4': 'video/mp4',
+    '.webm': 'video/webm', '.ogg': 'audio/ogg',
+}
+
+INLINE_CONTENT_TYPES = ['image/', 'text/', 'application/pdf', 'audio/', 'video/']
+
+# Больше диапазонов в одном запросе не обслуживаем - отдаём файл целиком
+MAX_RANGES = 16
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def get_block_size():
+    """Размер блока чтения из настройки STORAGE_STREAM_CHUNK_SIZE"""
+    block_size = getattr(settings, 'STORAGE_STREAM_CHUNK_SIZE', STREAM_BLOCK_SIZE)
+    return min(max(int(block_size), MIN_STREAM_BLOCK_SIZE), MAX_STREAM_BLOCK_SIZE)
+
+
+def guess_content_type(filename):
+    """Определение content_type по расширению файла"""
+    file_extension = os.path.splitext(filename)[1].lower()
+    return CONTENT_TYPES.get(file_extension, 'application/octet-stream')
+
+
+def is_inline_content_type(content_type):
+    """Можно ли показывать файл в браузере, а не скачивать"""
+    return any(content_type.startswith(t) for t in INLINE_CONTENT_TYPES)
+
+
+def parse_range_header(header, size):
+    """
+    Разбор заголовка Range.
+
+    Возвращает None, если заголовок отсутствует или некорректен (файл
+    отдаётся целиком), пустой список, если ни один диапазон не попадает
+    в файл (416), иначе список диапазонов [(start, end)] с включительным end.
+    """
+    if not header:
+        return None
+
+    unit, _, ranges_spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not ranges_spec:
+        return None
+
+    ranges = []
+    for spec in ranges_spec.split(','):
+        match = RANGE_RE.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+            if start >= size:
+                continue
+            ranges.append((start, min(end, size - 1)))
+        elif last:
+            suffix = int(last)
+            if suffix == 0:
+                continue
+            ranges.append((max(size - suffix, 0), size - 1))
+        else:
+            return None
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # Объединяем пересекающиеся и соседние диапазоны
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def make_etag(stat, key=''):
+    """Строгий ETag: хранимые файлы не изменяются, поэтому ключ файла,
+    размер и время изменения однозначно определяют содержимое"""
+    return f'"{key}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def if_range_matches(request, etag, last_modified):
+    """Проверка If-Range: частичный ответ возможен, только если файл не менялся"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return etag is not None and if_range == etag
+    if if_range.startswith('W/'):
+        return False
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and if_range_date == int(last_modified)
+
+
+def read_range(file_handle, start, length, block_size=None):
+    """Читает диапазон файла блоками ограниченного размера"""
+    block_size = block_size or get_block_size()
+    file_handle.seek(start)
+    remaining = length
+    while remaining > 0:
+        block = file_handle.read(min(block_size, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        yield block
+
+
+def stream_ranges(path, ranges, parts):
+    """Генератор тела ответа multipart/byteranges"""
+    with open(path, 'rb') as file_handle:
+        for (start, end), header in zip(ranges, parts):
+            yield header
+            yield from read_range(file_handle, start, end - start + 1)
+            yield b'\r\n'
+    yield parts[-1]
+
+
+def stream_single_range(path, start, length):
+    with open(path, 'rb') as file_handle:
+        yield from read_range(file_handle, start, length)
+
+
+async def astream_ranges(path, ranges, parts):
+    """Асинхронный генератор тела ответа multipart/byteranges для ASGI"""
+    for (start, end), header in zip(ranges, parts):
+        yield header
+        async for block in aiter_range(path, start, end - start + 1):
+            yield block
+        yield b'\r\n'
+    yield parts[-1]
+
+
+async def aiter_range(path, start, length, block_size=None):
+    """
+    Асинхронное чтение диапазона для ASGI: файл открывается и блоки
+    читаются через os.pread в пуле потоков, не блокируя цикл событий и без переключения потока
+    на каждый маленький блок, как при обёртке синхронного итератора.
+    """
+    block_size = block_size or get_block_size()
+    fd = await asyncio.to_thread(os.open, path, os.O_RDONLY)
+    try:
+        position = start
+        end = start + length
+        while position < end:
+            block = await asyncio.to_thread(os.pread, fd, min(block_size, end - position), position)
+            if not block:
+                break
+            position += len(block)
+            yield block
+    finally:
+        await asyncio.to_thread(os.close, fd)
+
+
+async def aiter_in_thread(iterator):
+    """
+    Асинхронная обёртка синхронного итератора для ASGI: каждый следующий
+    блок вычисляется в пуле потоков (например, распаковка или чтение из
+    удалённого хранилища), цикл событий не блокируется.
+    """
+    done = object()
+    try:
+        while True:
+            block = await asyncio.to_thread(next, iterator, done)
+            if block is done:
+                break
+            yield block
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await asyncio.to_thread(close)
+
+
+class RangeFile:
+    """
+    Файл, ограниченный диапазоном [start, start + length).
+
+    Позиция дескриптора выставляется на начало диапазона, поэтому
+    wsgi.file_wrapper сервера (например, gunicorn) передаёт ровно
+    Content-Length байт через os.sendfile, а без sendfile чтение
+    останавливается на конце диапазона.
+    """
+
+    def __init__(self, path, start, length):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def is_asgi_request(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def file_body_response(request, path, start, length, size, content_type, zero_copy=False):
+    """Ответ с содержимым файла или его диапазона"""
+    if is_asgi_request(request):
+        # Синхронный итератор под ASGI Django читает в память целиком до
+        # отправки, поэтому тело всегда отдаётся асинхронным итератором
+        response = StreamingHttpResponse(aiter_range(path, start, length), content_type=content_type)
+    elif zero_copy:
+        response = FileResponse(RangeFile(path, start, length), content_type=content_type)
+        response.block_size = get_block_size()
+    elif start == 0 and length == size:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response.block_size = get_block_size()
+    else:
+        response = StreamingHttpResponse(stream_single_range(path, start, length), content_type=content_type)
+    response['Content-Length'] = length
+    return response
+
+
+def stream_file(request, path, filename, content_type=None, as_attachment=True, zero_copy=False,
+                etag=None):
+    """
+    Потоковая отдача файла средствами Django с поддержкой Range/If-Range.
+
+    Без заголовка Range (или при несовпадении If-Range) файл отдаётся целиком
+    со статусом 200, для одного диапазона - 206 с Content-Range, для нескольких -
+    206 multipart/byteranges, для диапазонов вне файла - 416.
+
+    zero_copy - отдавать файл и одиночные диапазоны через wsgi.file_wrapper
+    (os.sendfile) под WSGI. Под ASGI тело ответа всегда читается асинхронно.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    ranges = None
+    if request.method in ('GET', 'HEAD') and if_range_matches(request, etag, stat.st_mtime):
+        ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+    if ranges == []:
+        logger.debug("Запрошенный диапазон вне файла %s (%d байт)", filename, size)
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif ranges is None:
+        response = file_body_response(request, path, 0, size, size, content_type, zero_copy)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = file_body_response(request, path, start, end - start + 1, size, content_type, zero_copy)
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        boundary = uuid.uuid4().hex
+        parts = [
+            (f'--{boundary}\r\n'
+             f'Content-Type: {content_type}\r\n'
+             f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+            for start, end in ranges
+        ]
+        parts.append(f'--{boundary}--\r\n'.encode())
+        content_length = (sum(len(part) for part in parts)
+                          + sum(end - start + 1 + 2 for start, end in ranges))
+        body = astream_ranges if is_asgi_request(request) else stream_ranges
+        response = StreamingHttpResponse(
+            body(path, ranges, parts),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = content_length
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if response.status_code != 416:
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
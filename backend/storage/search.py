@@ -0,0 +1,55 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import CharField, DecimalField, F, FloatField, Q, Value
+from django.db.models.functions import Cast, Concat, LPad, Upper
+
+# Конфигурация полнотекстового поиска PostgreSQL: русские слова приводятся
+# к основе русским стеммером, латинские - английским. Входит в выражение
+# генерируемого столбца File.search_vector, поэтому её смена требует миграции.
+SEARCH_CONFIG = 'russian'
+
+
+def file_search_vector():
+    """Выражение для столбца File.search_vector: название важнее комментария"""
+    return (SearchVector('original_name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('comment', weight='B', config=SEARCH_CONFIG))
+
+
+def search_files(queryset, text, extra=None):
+    """
+    Поиск файлов по названию и комментарию с ранжированием (аннотации
+    search_rank и search_position для пагинации).
+
+    Совпадают файлы, найденные полнотекстовым поиском (GIN по search_vector),
+    похожие по триграммам на название - с учётом опечаток - или содержащие
+    строку в названии без учёта регистра. Оба последних условия записаны
+    через UPPER(original_name) и используют один GIN-индекс gin_trgm_ops.
+    extra - дополнительное условие совпадения (например, по владельцу).
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    condition = (Q(search_vector=query)
+                 | Q(name_upper__trigram_word_similar=text)
+                 | Q(name_upper__contains=Upper(Value(text))))
+    if extra is not None:
+        condition |= extra
+    # ts_rank возвращает real: ранг приводится к double precision один раз,
+    # из него же строится позиция курсора (search_position)
+    rank = SearchRank(F('search_vector'), query) + TrigramWordSimilarity(text, 'original_name')
+    return (queryset.alias(name_upper=Upper('original_name'))
+            .filter(condition)
+            .annotate(search_rank=Cast(rank, FloatField()))
+            .annotate(search_position=search_position('search_rank')))
+
+
+def search_position(rank):
+    """
+    Уникальная позиция для курсора пагинации: ранг и id строкой одинаковой
+    длины, поэтому строки сравниваются так же, как пары (ранг, id). Курсор
+    DRF помнит только первое поле сортировки, и при равных рангах новый
+    подходящий файл сдвигал бы уже выданные страницы.
+    """
+    return Concat(
+        LPad(Cast(Cast(rank, DecimalField(max_digits=32, decimal_places=15)), CharField()), 32, Value('0')),
+        LPad(Cast('id', CharField()), 20, Value('0')),
+        output_field=CharField(),
+    )
+
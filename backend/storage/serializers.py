@@ -1,26 +1,30 @@
+import os
 import re
 import logging
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils.text import get_valid_filename
 from rest_framework import serializers
-from .models import File, CustomUser
+from .models import File, CustomUser, UploadSession
 
 logger = logging.getLogger(__name__)
 
 class UserSerializer(serializers.ModelSerializer):
-    file_count = serializers.SerializerMethodField()
+    file_count = serializers.IntegerField(read_only=True)
     total_file_size = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
         fields = ['id', 'username', 'email', 'password', 'first_name', 'last_name',
                   'is_active', 'is_staff', 'is_superuser', 'storage_path',
-                  'file_count', 'total_file_size']
+                  'file_count', 'total_file_size', 'used_bytes', 'storage_quota']
         extra_kwargs = {
             'password': {'write_only': True},
             'is_staff': {'required': False}, 
             'is_active': {'required': False},
+            'used_bytes': {'read_only': True},
+            'storage_quota': {'read_only': True},
         }
-    def get_file_count(self, obj):
-        return obj.get_file_count()
 
     def get_total_file_size(self, obj):
         return obj.get_total_file_size()
@@ -61,7 +65,7 @@ class FileSerializer(serializers.ModelSerializer):
     class Meta:
         model = File
         fields = ['id', 'user_id', 'user', 'user_name', 'user_display', 'original_name', 
-                 'size', 'upload_date', 'last_download_date', 'comment', 
+                 'size', 'upload_date', 'last_download_date', 'download_count', 'comment', 
                  'file_path', 'special_link']
     
     def get_user_name(self, obj):
@@ -93,3 +97,35 @@ class FileSerializer(serializers.ModelSerializer):
             'username': f'User {obj.user_id}',
             'display_name': f'User {obj.user_id}'
         }
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    received_bytes = serializers.IntegerField(read_only=True)
+    missing_ranges = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'original_name', 'size', 'comment', 'status',
+                  'received_bytes', 'received_ranges', 'missing_ranges',
+                  'file', 'created_at', 'updated_at']
+        read_only_fields = ['status', 'received_ranges', 'file', 'created_at', 'updated_at']
+
+    def get_missing_ranges(self, obj):
+        return obj.missing_ranges()
+
+    def validate_original_name(self, value):
+        # Как у файлов из multipart-запроса: только имя, без каталогов.
+        # Имя на диске строится из него через get_valid_filename
+        name = os.path.basename(value.replace('\\', '/')).strip()
+        try:
+            get_valid_filename(name)
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError("Недопустимое имя файла.")
+        return name
+
+    def validate_size(self, value):
+        max_size = settings.STORAGE_UPLOAD_MAX_FILE_SIZE
+        if max_size and value > max_size:
+            raise serializers.ValidationError(
+                f"Размер файла превышает допустимый ({max_size} байт).")
+        return value
@@ -1,8 +1,47 @@
 import os
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import CustomUser
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token, invalidate_user
+from .models import CustomUser, File, UploadSession
+
+
+@receiver([post_save, post_delete], sender=Token)
+def clear_token_cache(sender, instance, **kwargs):
+    """Сброс кеша токена при его изменении или удалении"""
+    invalidate_token(instance.key)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def clear_user_cache(sender, instance, **kwargs):
+    """Сброс закешированного пользователя (права, активность, пароль)"""
+    invalidate_user(instance.pk)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def discard_user_uploads(sender, instance, **kwargs):
+    """Части недогруженных файлов лежат на локальном диске, а не в хранилище.
+    Файлы пользователя здесь не удаляются: каскад уже собрал их до сигнала
+    и пошлёт post_delete для каждого (см. CustomUser.delete)"""
+    uploads = list(UploadSession.objects.filter(user=instance, status=UploadSession.STATUS_ACTIVE))
+    transaction.on_commit(lambda: [upload.discard() for upload in uploads])
+
+
+@receiver(post_save, sender=File)
+def add_file_usage(sender, instance, created, **kwargs):
+    """Учёт нового файла в счётчиках пользователя"""
+    if created:
+        instance.user.change_usage(instance.stored_size, 1)
+
+
+@receiver(post_delete, sender=File)
+def delete_file_content(sender, instance, **kwargs):
+    """Освобождение содержимого при удалении файла, в том числе каскадном
+    (при удалении пользователя File.delete не вызывается)"""
+    instance.delete_content()
+    CustomUser(pk=instance.user_id).change_usage(-instance.stored_size, -1)
 
 # import logging
 #
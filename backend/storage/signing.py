@@ -0,0 +1,55 @@
+import time
+import logging
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+SALT = 'storage.signed-download'
+
+
+class SignedURLError(Exception):
+    pass
+
+
+def get_client_ip(request):
+    """IP клиента: заголовок X-Real-IP от Nginx при STORAGE_TRUST_X_REAL_IP,
+    иначе адрес соединения"""
+    if settings.STORAGE_TRUST_X_REAL_IP and request.META.get('HTTP_X_REAL_IP'):
+        return request.META['HTTP_X_REAL_IP']
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def sign_download(file, ttl=None, ip=''):
+    """
+    Подписанный токен скачивания. Подпись (HMAC на SECRET_KEY) покрывает id
+    файла, путь в хранилище, имя, время истечения и, при необходимости, IP.
+    """
+    ttl = min(ttl or settings.STORAGE_SIGNED_URL_TTL, settings.STORAGE_SIGNED_URL_MAX_TTL)
+    expires = int(time.time()) + ttl
+    payload = {
+        'id': file.pk,
+        'p': file.file_path.name,
+        'n': file.original_name,
+        'k': str(file.etag_key),
+        'c': file.encoding,
+        's': file.size,
+        'e': expires,
+        'ip': ip,
+    }
+    return signing.dumps(payload, salt=SALT, compress=True), expires
+
+
+def verify_download(token, request):
+    """Проверка токена без обращения к БД; возвращает данные файла из подписи"""
+    try:
+        payload = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise SignedURLError('Неверная подпись ссылки')
+
+    if payload['e'] < time.time():
+        raise SignedURLError('Срок действия ссылки истёк')
+    if payload['ip'] and payload['ip'] != get_client_ip(request):
+        logger.warning("Подписанная ссылка на файл %s использована с другого IP", payload['id'])
+        raise SignedURLError('Ссылка привязана к другому IP-адресу')
+    return payload
@@ -0,0 +1,47 @@
+import logging
+from django.conf import settings
+from django.db import transaction
+from . import blobs, jobs, thumbnails
+from .deletion import deletion_worker
+from .models import CustomUser, File
+
+logger = logging.getLogger(__name__)
+
+
+@jobs.register('process_upload')
+def process_upload(file_id):
+    """Обработка загруженного файла вне запроса"""
+    file = File.objects.filter(pk=file_id).first()
+    if file is None:
+        return
+    if not file.blob_id:
+        ingest_file(file)
+        file.refresh_from_db()
+
+    # Заранее создаём миниатюры, чтобы первый просмотр списка не ждал их
+    for size in settings.STORAGE_THUMBNAIL_EAGER_SIZES:
+        thumbnails.get_thumbnail(file, size)
+
+
+def ingest_file(file):
+    """Подсчёт хеша и перенос файла в хранилище содержимого (например,
+    собранного из частей при загрузке по частям)"""
+    name = file.file_path.name
+    sha256 = blobs.hash_stored(name)
+    with transaction.atomic():
+        blob = blobs.ingest_stored(name, sha256, file.size)
+        updated = File.objects.filter(pk=file.pk, blob__isnull=True).update(
+            blob=blob, sha256=sha256, file_path=blob.name, encoding=blob.encoding, stored_size=blob.stored_size)
+        if not updated:
+            # Файл удалён или уже перенесён, пока считался хеш
+            blobs.release(blob.pk)
+            return
+        # Сжатое содержимое занимает меньше места, чем собранный файл
+        CustomUser(pk=file.user_id).change_usage(blob.stored_size - file.stored_size, 0)
+    logger.info("Файл с ID %s перенесён в хранилище содержимого", file.pk)
+
+
+@jobs.register('process_deletions')
+def process_deletions():
+    """Удаление с диска файлов из очереди PendingDeletion"""
+    deletion_worker.process()
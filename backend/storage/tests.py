@@ -1,3 +1,1179 @@
-from django.test import TestCase
+import io
+import os
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from . import blobs, deletion, jobs, thumbnails
+from .authentication import token_cache_key, user_cache_key
+from .backends import get_storage
+from .compression import DECODE_BLOCK_SIZE, ENCODING_GZIP, ENCODING_ZSTD, zstd_module
+from .models import Blob, CustomUser, File, Job, PendingDeletion, UploadSession
+from .responses import MAX_RANGES, parse_range_header
+from .search import search_files
 
-# Create your tests here.
+BLOCK_SIZE = 64 * 1024
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan')
+# Узлы, сохраняющие порядок и раннюю остановку внешнего (первого) входа
+ORDER_PRESERVING = ('Nested Loop', 'Incremental Sort')
+
+
+def find_full_scans(node, limited=False):
+    """
+    Таблицы, которые план читает целиком: Seq Scan, а также обход всего
+    индекса без Index Cond - так планировщик обходит запрет seq scan, когда
+    подходящего индекса нет. Обход индекса, порядок которого поднимается
+    прямо к LIMIT, допустим: чтение останавливается после нужных строк.
+    """
+    tables = []
+    node_type = node.get('Node Type')
+    full_index_scan = node_type in INDEX_SCANS and 'Index Cond' not in node
+    if node_type == 'Seq Scan' or (full_index_scan and not limited):
+        tables.append(node['Relation Name'])
+    for number, child in enumerate(node.get('Plans', [])):
+        ordered = node_type == 'Limit' or (limited and node_type in ORDER_PRESERVING and number == 0)
+        tables += find_full_scans(child, limited=ordered)
+    return tables
+
+
+class StorageTestCase(TestCase):
+    """Файлы тестов пишутся во временный MEDIA_ROOT, который удаляется после класса"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def create_user(self, username, **kwargs):
+        return CustomUser.objects.create_user(username, password='password', **kwargs)
+
+    def token_for(self, user):
+        return Token.objects.get_or_create(user=user)[0].key
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token_for(user)}')
+        return client
+
+    def upload(self, client, name, content):
+        response = client.post('/api/files/', {'file_path': SimpleUploadedFile(name, content)},
+                               format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return File.objects.get(pk=response.data['id'])
+
+
+@override_settings(STORAGE_STREAM_CHUNK_SIZE=BLOCK_SIZE)
+class StreamingViewTests(StorageTestCase):
+    """Просмотр файла отдаётся блоками не больше STORAGE_STREAM_CHUNK_SIZE:
+    память воркера не зависит от размера файла"""
+
+    def setUp(self):
+        self.user = self.create_user('viewer')
+        self.content = os.urandom(BLOCK_SIZE * 8 + 123)
+        self.file = self.upload(self.client_for(self.user), 'video.mp4', self.content)
+
+    def test_view_streams_bounded_chunks(self):
+        response = self.client.get(f'/api/files/{self.file.pk}/view/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertEqual(b''.join(chunks), self.content)
+        self.assertGreater(len(chunks), 1)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), BLOCK_SIZE)
+
+    async def test_view_streams_bounded_chunks_under_asgi(self):
+        # Под ASGI синхронный итератор Django собрал бы в памяти целиком
+        response = await AsyncClient().get(f'/api/files/{self.file.pk}/view/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(b''.join(chunks), self.content)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), BLOCK_SIZE)
+
+
+class RangeRequestTests(StorageTestCase):
+    """Запросы диапазонов (Range, If-Range) при скачивании"""
+
+    def setUp(self):
+        self.user = self.create_user('ranges')
+        self.client = self.client_for(self.user)
+        self.token = self.token_for(self.user)
+        self.content = os.urandom(1000)
+        self.file = self.upload(self.client, 'data.bin', self.content)
+        self.url = f'/api/files/{self.file.pk}/download/'
+
+    def get(self, range_header, **extra):
+        response = self.client.get(self.url, HTTP_RANGE=range_header, **extra)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range_header(self):
+        cases = [
+            ('bytes=10-19', [(10, 19)]),
+            ('bytes=990-', [(990, 999)]),
+            ('bytes=-5', [(995, 999)]),
+            ('bytes=-5000', [(0, 999)]),
+            ('bytes=0-4,5-9,3-6', [(0, 9)]),
+            ('bytes=20-29, 0-1', [(0, 1), (20, 29)]),
+            ('bytes=900-5000', [(900, 999)]),
+            ('bytes=1000-', []),
+            ('bytes=-0', []),
+            ('bytes=5-1', None),
+            ('bytes=abc', None),
+            ('items=0-1', None),
+            ('', None),
+            ('bytes=' + ','.join(f'{n * 10}-{n * 10}' for n in range(MAX_RANGES + 1)), None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header):
+                self.assertEqual(parse_range_header(header, 1000), expected)
+
+    def test_single_range(self):
+        response, body = self.get('bytes=10-19')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1000')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(body, self.content[10:20])
+
+    def test_suffix_range(self):
+        response, body = self.get('bytes=-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 995-999/1000')
+        self.assertEqual(body, self.content[-5:])
+
+    def test_adjacent_ranges_merged(self):
+        response, body = self.get('bytes=0-4,5-9')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 0-9/1000')
+        self.assertEqual(body, self.content[:10])
+
+    def assert_multipart(self, response, body):
+        self.assertEqual(response.status_code, 206)
+        content_type = response['Content-Type']
+        self.assertTrue(content_type.startswith('multipart/byteranges; boundary='))
+        boundary = content_type.split('boundary=')[1].encode()
+        self.assertEqual(int(response['Content-Length']), len(body))
+        parts = body.split(b'--' + boundary)
+        self.assertEqual(parts[0], b'')
+        self.assertEqual(parts[-1], b'--\r\n')
+        for part, (start, end) in zip(parts[1:-1], ((0, 1), (10, 11))):
+            headers, data = part.split(b'\r\n\r\n', 1)
+            self.assertIn(f'Content-Range: bytes {start}-{end}/1000'.encode(), headers)
+            self.assertEqual(data, self.content[start:end + 1] + b'\r\n')
+
+    def test_multiple_ranges(self):
+        self.assert_multipart(*self.get('bytes=0-1,10-11'))
+
+    async def test_multiple_ranges_under_asgi(self):
+        response = await AsyncClient().get(self.url, headers={'Authorization': f'Token {self.token}',
+                                                             'Range': 'bytes=0-1,10-11'})
+
+        self.assertTrue(response.is_async)
+        self.assert_multipart(response, b''.join([chunk async for chunk in response.streaming_content]))
+
+    def test_too_many_ranges_served_whole(self):
+        response, body = self.get('bytes=' + ','.join(f'{n * 10}-{n * 10}' for n in range(MAX_RANGES + 1)))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get('bytes=1000-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1000')
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response, body = self.get('bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[:10])
+
+        # Файл изменился с тех пор, как клиент получил начало: отдаётся целиком
+        response, body = self.get('bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+
+@override_settings(STORAGE_DOWNLOAD_FLUSH_INTERVAL=0)
+class AsyncDownloadTests(StorageTestCase):
+    """Скачивание под ASGI: учитываются только действительно переданные файлы"""
+
+    def setUp(self):
+        self.user = self.create_user('downloader')
+        self.content = b'downloaded content'
+        self.file = self.upload(self.client_for(self.user), 'report.txt', self.content)
+        self.client = AsyncClient()
+        self.headers = {'Authorization': f'Token {self.token_for(self.user)}'}
+        self.url = f'/api/files/{self.file.pk}/download/'
+
+    async def assert_download_count(self, count):
+        file = await File.objects.aget(pk=self.file.pk)
+        self.assertEqual(file.download_count, count)
+
+    async def test_get_is_counted(self):
+        response = await self.client.get(self.url, headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content)
+        await self.assert_download_count(1)
+
+    async def test_head_is_allowed_and_not_counted(self):
+        response = await self.client.head(self.url, headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        await self.assert_download_count(0)
+
+    async def test_not_modified_is_not_counted(self):
+        etag = (await self.client.get(self.url, headers=self.headers))['ETag']
+
+        response = await self.client.get(self.url, headers={**self.headers, 'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        await self.assert_download_count(1)
+
+    async def test_archive_streams_under_asgi(self):
+        response = await self.client.post('/api/files/archive/', {'ids': [self.file.pk]},
+                                          content_type='application/json', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        archive = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(zipfile.ZipFile(io.BytesIO(archive)).read('report.txt'), self.content)
+
+
+class CompressedDownloadTests(StorageTestCase):
+    """Сжатый файл распаковывается при отдаче блоками не больше DECODE_BLOCK_SIZE,
+    как бы сильно ни сжималось содержимое"""
+
+    def setUp(self):
+        self.user = self.create_user('compressed')
+        self.client = self.client_for(self.user)
+        # Нули сжимаются в тысячи раз: весь файл укладывается в один сжатый блок
+        self.content = bytes(DECODE_BLOCK_SIZE * 128)
+
+    def assert_bounded_download(self, encoding):
+        with override_settings(STORAGE_COMPRESSION=encoding):
+            file = self.upload(self.client, 'zeros.txt', self.content)
+        self.assertEqual(file.encoding, encoding)
+        self.assertLess(file.stored_size, DECODE_BLOCK_SIZE)
+
+        response = self.client.get(f'/api/files/{file.pk}/download/', HTTP_ACCEPT_ENCODING='identity')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        chunks = list(response.streaming_content)
+        self.assertEqual(b''.join(chunks), self.content)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), DECODE_BLOCK_SIZE)
+
+    def test_gzip(self):
+        self.assert_bounded_download(ENCODING_GZIP)
+
+    @skipUnless(zstd_module(), 'Пакет zstandard не установлен')
+    def test_zstd(self):
+        self.assert_bounded_download(ENCODING_ZSTD)
+
+
+class TokenCacheTests(StorageTestCase):
+    """Кеш токенов сбрасывается, когда токен или пользователь меняется"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user('cached')
+        self.token = self.token_for(self.user)
+        self.client = self.client_for(self.user)
+
+    def assert_authenticated(self, expected):
+        self.assertEqual(self.client.get('/api/files/').status_code, 200 if expected else 401)
+
+    def test_token_cached(self):
+        self.assert_authenticated(True)
+
+        self.assertEqual(cache.get(token_cache_key(self.token)), self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assert_authenticated(True)
+            tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('authtoken_token', tables)
+
+    def test_deleted_token_rejected(self):
+        self.assert_authenticated(True)
+
+        Token.objects.filter(key=self.token).get().delete()
+
+        self.assertIsNone(cache.get(token_cache_key(self.token)))
+        self.assert_authenticated(False)
+
+    def test_deactivated_user_rejected(self):
+        self.assert_authenticated(True)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        self.assert_authenticated(False)
+
+    async def test_deactivated_user_rejected_by_async_views(self):
+        client = AsyncClient()
+        url = '/api/files/999999/download/'
+        headers = {'Authorization': f'Token {self.token}'}
+        self.assertEqual((await client.get(url, headers=headers)).status_code, 404)
+
+        self.user.is_active = False
+        await self.user.asave()
+
+        self.assertEqual((await client.get(url, headers=headers)).status_code, 401)
+
+    def test_password_change_refreshes_cached_user(self):
+        self.assert_authenticated(True)
+
+        self.user.set_password('new password')
+        self.user.save()
+
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        self.assert_authenticated(True)
+        self.assertTrue(cache.get(user_cache_key(self.user.pk)).check_password('new password'))
+
+    def test_deleted_user_rejected(self):
+        self.assert_authenticated(True)
+
+        self.user.delete()
+
+        self.assertIsNone(cache.get(token_cache_key(self.token)))
+        self.assert_authenticated(False)
+
+
+class UploadSessionTests(StorageTestCase):
+    """Загрузка по частям: начало, части по смещению, завершение"""
+
+    def setUp(self):
+        self.user = self.create_user('chunked')
+        self.client = self.client_for(self.user)
+        self.content = os.urandom(3000)
+
+    def start(self, name='report.txt', size=None):
+        return self.client.post('/api/files/uploads/',
+                                {'original_name': name, 'size': len(self.content) if size is None else size},
+                                format='json')
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(f'/api/files/uploads/{upload_id}/?offset={offset}', data,
+                               content_type='application/octet-stream')
+
+    def finalize(self, upload_id):
+        return self.client.post(f'/api/files/uploads/{upload_id}/finalize/')
+
+    def test_chunks_in_any_order_make_the_file(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data['id']
+        self.assertEqual(response.data['missing_ranges'], [[0, 3000]])
+
+        response = self.put(upload_id, 2000, self.content[2000:])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['missing_ranges'], [[0, 2000]])
+
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['missing_ranges'], [[0, 2000]])
+
+        self.assertEqual(self.put(upload_id, 0, self.content[:2000]).status_code, 200)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 201)
+
+        file = File.objects.get(pk=response.data['id'])
+        self.assertEqual((file.original_name, file.size), ('report.txt', 3000))
+        with file.file_path.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        # Повторное завершение возвращает тот же файл
+        self.assertEqual(self.finalize(upload_id).data['id'], file.pk)
+
+    def test_chunk_outside_file_rejected(self):
+        upload_id = self.start().data['id']
+
+        self.assertEqual(self.put(upload_id, 2500, self.content[:1000]).status_code, 416)
+        self.assertEqual(self.put(upload_id, -1, self.content[:10]).status_code, 416)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).received_ranges, [])
+
+    def test_chunk_after_finalize_rejected(self):
+        upload_id = self.start().data['id']
+        self.put(upload_id, 0, self.content)
+        self.finalize(upload_id)
+
+        self.assertEqual(self.put(upload_id, 0, self.content).status_code, 409)
+
+    def test_name_cannot_leave_user_directory(self):
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        user_dir = os.path.join(media_root, 'uploads', self.user.storage_path)
+
+        response = self.start(name='../../../../../../tmp/escaped.txt')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['original_name'], 'escaped.txt')
+        upload = UploadSession.objects.get(pk=response.data['id'])
+        self.assertTrue(os.path.realpath(upload.part_path).startswith(user_dir + os.sep))
+        self.assertTrue(os.path.exists(upload.part_path))
+
+    def test_invalid_names_rejected(self):
+        for name in ('..', '../', '???'):
+            with self.subTest(name):
+                response = self.start(name=name)
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class SignedDownloadTests(StorageTestCase):
+    """Подписанные ссылки: подпись, срок действия и привязка к IP"""
+
+    def setUp(self):
+        self.user = self.create_user('signer')
+        self.client = self.client_for(self.user)
+        self.content = b'signed content'
+        self.file = self.upload(self.client, 'signed.txt', self.content)
+
+    def signed_path(self, **params):
+        response = self.client.get(f'/api/files/{self.file.pk}/get_special_link/', params,
+                                   REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        return response.data['signed_link'].removeprefix('http://testserver')
+
+    def download(self, path, **extra):
+        return APIClient().get(path, **{'REMOTE_ADDR': '10.0.0.1', **extra})
+
+    def test_valid_link(self):
+        response = self.download(self.signed_path())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_tampered_token_rejected(self):
+        path = self.signed_path()
+        token = path.rstrip('/').rsplit('/', 1)[1]
+        tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+
+        self.assertEqual(self.download(path.replace(token, tampered)).status_code, 403)
+
+    def test_expired_token_rejected(self):
+        path = self.signed_path(ttl=60)
+
+        with mock.patch('storage.signing.time.time', return_value=time.time() + 61):
+            self.assertEqual(self.download(path).status_code, 403)
+
+    def test_bound_ip(self):
+        path = self.signed_path(bind_ip=1)
+
+        self.assertEqual(self.download(path).status_code, 200)
+        self.assertEqual(self.download(path, REMOTE_ADDR='10.0.0.2').status_code, 403)
+        # Без доверенного прокси заголовок X-Real-IP подделывается клиентом
+        self.assertEqual(self.download(path, REMOTE_ADDR='10.0.0.2', HTTP_X_REAL_IP='10.0.0.1').status_code, 403)
+
+    @override_settings(STORAGE_TRUST_X_REAL_IP=True)
+    def test_bound_ip_behind_proxy(self):
+        path = self.client.get(f'/api/files/{self.file.pk}/get_special_link/', {'bind_ip': 1},
+                               REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP='10.0.0.1').data['signed_link']
+        path = path.removeprefix('http://testserver')
+
+        self.assertEqual(self.download(path, REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP='10.0.0.1').status_code, 200)
+        self.assertEqual(self.download(path, REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP='10.0.0.2').status_code, 403)
+
+
+class ThumbnailTests(StorageTestCase):
+    """Кеш миниатюр: вытеснение не мешает создаваемым миниатюрам"""
+
+    def setUp(self):
+        self.thumbnail_dir = os.path.join(self.media_root, 'thumbnails')
+        self.enterContext(override_settings(STORAGE_THUMBNAIL_DIR=self.thumbnail_dir))
+        self.user = self.create_user('thumbnails')
+
+    def upload_image(self):
+        from PIL import Image
+
+        image = io.BytesIO()
+        Image.new('RGB', (400, 300), 'red').save(image, 'PNG')
+        return self.upload(self.client_for(self.user), 'photo.png', image.getvalue())
+
+    def test_eviction_during_generation(self):
+        file = self.upload_image()
+        render_image = thumbnails.render_image
+
+        def render_and_evict(source, target, size):
+            rendered = render_image(source, target, size)
+            # Параллельный запрос вытесняет весь кеш, пока миниатюра не на месте
+            thumbnails.evict(max_size=0)
+            return rendered
+
+        with mock.patch('storage.thumbnails.render_image', side_effect=render_and_evict):
+            path = thumbnails.get_thumbnail(file, 64)
+
+        self.assertEqual(path, thumbnails.thumbnail_path(file.etag_key, 64))
+        self.assertTrue(os.path.getsize(path) > 0)
+
+    def test_evict_least_recently_used(self):
+        paths = []
+        for number in range(3):
+            path = thumbnails.thumbnail_path(f'{number:064x}', 64)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(path, (1000 + number, 1000))
+            paths.append(path)
+        abandoned = os.path.join(self.thumbnail_dir, thumbnails.TEMP_PREFIX + 'abandoned.jpg')
+        writing = os.path.join(self.thumbnail_dir, thumbnails.TEMP_PREFIX + 'writing.jpg')
+        for path in (abandoned, writing):
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+        old = time.time() - thumbnails.TEMP_MAX_AGE - 1
+        os.utime(abandoned, (old, old))
+
+        self.assertEqual(thumbnails.evict(max_size=150), 2)
+
+        self.assertEqual([os.path.exists(path) for path in paths], [False, False, True])
+        self.assertFalse(os.path.exists(abandoned))
+        self.assertTrue(os.path.exists(writing))
+
+
+class SearchTests(StorageTestCase):
+    """Поиск файлов (параметр q): полнотекстовый, по триграммам и подстроке,
+    с сортировкой по релевантности и постраничным выводом по курсору"""
+
+    def setUp(self):
+        self.user = self.create_user('searcher')
+        self.client = self.client_for(self.user)
+
+    def add(self, name, comment=''):
+        file = self.upload(self.client, name, name.encode())
+        if comment:
+            File.objects.filter(pk=file.pk).update(comment=comment)
+        return file.pk
+
+    def search(self, text, **params):
+        response = self.client.get('/api/files/', {'q': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_websearch_syntax(self):
+        report = self.add('Годовой отчёт.docx')
+        draft = self.add('Черновик отчёта.docx')
+        plan = self.add('План продаж.xlsx')
+
+        cases = [
+            ('отчёт', {report, draft}),
+            ('отчеты', {report, draft}),
+            ('отчёт -черновик', {report}),
+            ('"годовой отчёт"', {report}),
+            ('план or черновик', {plan, draft}),
+        ]
+        for text, expected in cases:
+            with self.subTest(text):
+                self.assertEqual(set(self.search(text)), expected)
+
+    def test_comment_matches(self):
+        file = self.add('scan_001.pdf', comment='договор аренды')
+        self.add('scan_002.pdf')
+
+        self.assertEqual(self.search('аренда'), [file])
+
+    def test_typo_and_substring(self):
+        presentation = self.add('Презентация проекта.pptx')
+        self.add('Отчёт.docx')
+
+        # Опечатка: находится по похожести триграмм
+        self.assertEqual(self.search('презентацыя'), [presentation])
+        # Часть слова без учёта регистра
+        self.assertEqual(self.search('ЗЕНТАЦ'), [presentation])
+
+    def test_ranked_by_relevance(self):
+        in_comment = self.add('scan.pdf', comment='бюджет')
+        in_name = self.add('Бюджет.xlsx')
+
+        self.assertEqual(self.search('бюджет'), [in_name, in_comment])
+        # Явная сортировка важнее релевантности
+        self.assertEqual(self.search('бюджет', o='id'), [in_comment, in_name])
+
+    def test_cursor_pages_stable_during_search(self):
+        ids = {self.add(f'Смета {number}.xlsx') for number in range(5)}
+        self.add('Другое.txt')
+
+        seen = []
+        response = self.client.get('/api/files/', {'q': 'смета', 'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen += [item['id'] for item in response.data['results']]
+            if len(seen) == 2:
+                # Новый подходящий файл не сдвигает уже выданные страницы
+                self.add('Смета новая.xlsx')
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertLessEqual(ids, set(seen))
+
+
+class ListQueryCountTests(StorageTestCase):
+    """Число запросов к БД на страницу списка не зависит от числа строк"""
+
+    def setUp(self):
+        self.admin = self.create_user('admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.added = 0
+
+    def add_users_with_files(self, count):
+        for _ in range(count):
+            self.added += 1
+            user = self.create_user(f'user{self.added}')
+            self.upload(self.client_for(user), f'file{self.added}.txt', b'content %d' % self.added)
+
+    def assert_constant_queries(self, url, rows):
+        """Запросы для страницы из 2 строк и из rows строк совпадают по числу"""
+        self.add_users_with_files(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        small_page = len(response.data['results'])
+        # Журнал запросов очищается в начале каждого запроса, число сохраняется сразу
+        query_count = len(queries)
+
+        self.add_users_with_files(rows - 2)
+        with self.assertNumQueries(query_count):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(response.data['results']), small_page)
+
+    def test_files_list(self):
+        self.assert_constant_queries('/api/files/', rows=8)
+
+    def test_users_list(self):
+        self.assert_constant_queries('/api/users/', rows=8)
+
+    def test_list_users(self):
+        self.assert_constant_queries('/api/users/list_users/', rows=8)
+
+
+class QuotaTests(StorageTestCase):
+    """Учёт занятого места и квота пользователя"""
+
+    def setUp(self):
+        self.user = self.create_user('quota')
+        self.client = self.client_for(self.user)
+
+    def assert_usage(self, used_bytes, file_count):
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.used_bytes, self.user.file_count), (used_bytes, file_count))
+
+    def test_usage_follows_upload_and_delete(self):
+        first = self.upload(self.client, 'a.txt', b'a' * 100)
+        self.upload(self.client, 'b.txt', b'b' * 50)
+        self.assert_usage(150, 2)
+
+        self.assertEqual(self.client.delete(f'/api/files/{first.pk}/').status_code, 204)
+        self.assert_usage(50, 1)
+
+    def test_upload_over_quota_rejected(self):
+        self.upload(self.client, 'a.txt', b'a' * 100)
+        CustomUser.objects.filter(pk=self.user.pk).update(storage_quota=1000)
+
+        response = self.client.post('/api/files/', {'file_path': SimpleUploadedFile('b.txt', b'b' * 1000)},
+                                    format='multipart')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(File.objects.count(), 1)
+        self.assert_usage(100, 1)
+
+    @override_settings(STORAGE_DEFAULT_QUOTA=500)
+    def test_default_quota(self):
+        self.assertEqual(self.user.quota, 500)
+        self.assertTrue(self.user.has_quota_for(500))
+        self.assertFalse(self.user.has_quota_for(501))
+
+        self.user.storage_quota = 2000
+        self.assertTrue(self.user.has_quota_for(1500))
+
+    def test_chunked_upload_over_quota_rejected(self):
+        self.user.storage_quota = 1000
+        self.user.save()
+
+        response = self.client.post('/api/files/uploads/', {'original_name': 'big.bin', 'size': 1001}, format='json')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_reconcile_storage_usage(self):
+        self.upload(self.client, 'a.txt', b'a' * 100)
+        other = self.create_user('other')
+        CustomUser.objects.filter(pk=self.user.pk).update(used_bytes=7, file_count=5)
+        CustomUser.objects.filter(pk=other.pk).update(used_bytes=3, file_count=1)
+
+        call_command('reconcile_storage_usage', '--dry-run', stdout=io.StringIO())
+        self.assert_usage(7, 5)
+
+        out = io.StringIO()
+        call_command('reconcile_storage_usage', stdout=out)
+
+        self.assertIn('с расхождениями: 2', out.getvalue())
+        self.assert_usage(100, 1)
+        other.refresh_from_db()
+        self.assertEqual((other.used_bytes, other.file_count), (0, 0))
+
+
+class BulkTests(StorageTestCase):
+    """Массовые загрузка и удаление файлов"""
+
+    def setUp(self):
+        self.user = self.create_user('bulk')
+        self.client = self.client_for(self.user)
+
+    def test_upload_over_quota_rejected_before_body_is_read(self):
+        self.user.storage_quota = 1000
+        self.user.save()
+
+        with mock.patch('storage.views.use_hashing_upload_handler',
+                        side_effect=AssertionError('тело запроса принято до проверки квоты')):
+            response = self.client.post('/api/files/bulk/upload/',
+                                        {'files': [SimpleUploadedFile('a.bin', b'x' * 2000)]},
+                                        format='multipart')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(File.objects.exists())
+
+    def test_delete_releases_content_and_usage_once(self):
+        content = b'shared content'
+        own = [self.upload(self.client, f'{number}.txt', content) for number in range(2)]
+        shared = self.upload(self.client_for(self.create_user('other')), 'shared.txt', content)
+
+        response = self.client.post('/api/files/bulk/delete/', {'ids': [file.pk for file in own]},
+                                    format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Blob.objects.get(pk=shared.blob_id).ref_count, 1)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.used_bytes, self.user.file_count), (0, 0))
+
+
+class DeletionQueueTests(StorageTestCase):
+    """Очередь удаления не стирает файлы, на которые ссылаются записи"""
+
+    def setUp(self):
+        self.user = self.create_user('queue')
+
+    def store(self, name, content=b'content'):
+        return get_storage().save(name, ContentFile(content))
+
+    def test_referenced_file_kept(self):
+        # Файл вне хранилища содержимого: старый путь, который снова
+        # попал в очередь (например, сборкой мусора после reshard_storage)
+        name = self.store(f'uploads/{self.user.storage_path}/legacy.txt')
+        file = File.objects.create(user=self.user, original_name='legacy.txt', size=7, file_path=name)
+        garbage = self.store(f'uploads/{self.user.storage_path}/garbage.txt')
+
+        with transaction.atomic():
+            deletion.enqueue([name, garbage])
+        deletion.deletion_worker.process()
+
+        self.assertTrue(get_storage().exists(name))
+        self.assertTrue(File.objects.filter(pk=file.pk).exists())
+        self.assertFalse(get_storage().exists(garbage))
+        self.assertFalse(PendingDeletion.objects.exists())
+
+
+class BlobTests(StorageTestCase):
+    """Хранилище содержимого: одинаковые файлы делят одну запись со счётчиком ссылок"""
+
+    def setUp(self):
+        self.users = [self.create_user(f'blob{number}') for number in range(2)]
+
+    def detach(self, *files):
+        """Записи файлов отвязываются от содержимого, как при их удалении"""
+        File.objects.filter(pk__in=[file.pk for file in files]).update(blob=None)
+
+    def test_upload_deduplicated(self):
+        first, second = [self.upload(self.client_for(user), 'same.txt', b'same content') for user in self.users]
+        other = self.upload(self.client_for(self.users[0]), 'other.txt', b'other content')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertNotEqual(first.blob_id, other.blob_id)
+        blob = Blob.objects.get(pk=first.blob_id)
+        self.assertEqual((blob.ref_count, blob.sha256), (2, hashlib.sha256(b'same content').hexdigest()))
+        self.assertEqual(first.file_path.name, blob.name)
+        self.assertEqual(os.listdir(os.path.dirname(get_storage().path(blob.name))), [blob.sha256])
+
+    def test_release(self):
+        files = [self.upload(self.client_for(user), 'same.txt', b'same content') for user in self.users]
+        blob = Blob.objects.get(pk=files[0].blob_id)
+        self.detach(*files)
+
+        blobs.release(blob.pk)
+        self.assertEqual(Blob.objects.get(pk=blob.pk).ref_count, 1)
+        self.assertFalse(PendingDeletion.objects.exists())
+
+        blobs.release(blob.pk)
+        self.assertFalse(Blob.objects.filter(pk=blob.pk).exists())
+        self.assertEqual(list(PendingDeletion.objects.values_list('name', flat=True)), [blob.name])
+
+    def test_release_many(self):
+        client = self.client_for(self.users[0])
+        shared = [self.upload(client, f'{number}.txt', b'shared') for number in range(3)]
+        single = self.upload(client, 'single.txt', b'single')
+        self.detach(shared[0], shared[1], single)
+
+        blobs.release_many({shared[0].blob_id: 2, single.blob_id: 1})
+
+        self.assertEqual(Blob.objects.get(pk=shared[0].blob_id).ref_count, 1)
+        self.assertFalse(Blob.objects.filter(pk=single.blob_id).exists())
+        self.assertEqual(list(PendingDeletion.objects.values_list('name', flat=True)), [single.file_path.name])
+
+    def test_readding_released_content_cancels_deletion(self):
+        file = self.upload(self.client_for(self.users[0]), 'a.txt', b'content')
+        self.detach(file)
+        blobs.release(file.blob_id)
+
+        again = self.upload(self.client_for(self.users[1]), 'b.txt', b'content')
+
+        self.assertEqual(Blob.objects.get(pk=again.blob_id).ref_count, 1)
+        self.assertFalse(PendingDeletion.objects.exists())
+        self.assertTrue(get_storage().exists(again.file_path.name))
+
+
+class HashingUploadTests(StorageTestCase):
+    """Хеш загружаемого файла считается при приёме тела запроса, без повторного чтения"""
+
+    def setUp(self):
+        self.user = self.create_user('hashing')
+        self.client = self.client_for(self.user)
+        # Несколько блоков обработчика загрузки
+        self.content = os.urandom(blobs.HASH_BLOCK_SIZE * 3 + 123)
+
+    def test_streamed_hash_used(self):
+        with mock.patch('storage.blobs.write_temp', side_effect=AssertionError('файл записан повторно')), \
+                mock.patch('storage.blobs.hash_stored', side_effect=AssertionError('хеш посчитан повторно')):
+            file = self.upload(self.client, 'random.bin', self.content)
+
+        self.assertEqual(file.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(file.size, len(self.content))
+        with file.file_path.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        # Временный файл перенесён в хранилище, а не скопирован
+        self.assertEqual(os.listdir(blobs.temp_dir()), [])
+
+    def test_store_upload_hashes_other_files(self):
+        blob = blobs.store_upload(SimpleUploadedFile('plain.bin', self.content))
+
+        self.assertEqual(blob.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(blob.size, len(self.content))
+
+
+class DeduplicateCommandTests(StorageTestCase):
+    """Перенос старых файлов в хранилище содержимого командой deduplicate_files"""
+
+    def setUp(self):
+        self.user = self.create_user('legacy')
+
+    def legacy_file(self, filename, content):
+        name = get_storage().save(f'uploads/{self.user.storage_path}/{filename}', ContentFile(content))
+        return File.objects.create(user=self.user, original_name=filename, size=len(content), file_path=name)
+
+    def run_command(self):
+        out = io.StringIO()
+        call_command('deduplicate_files', stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_identical_files_share_content(self):
+        files = [self.legacy_file(f'{number}.txt', b'legacy content') for number in range(2)]
+        old_names = [file.file_path.name for file in files]
+
+        self.assertIn('Перенесено: 2', self.run_command())
+
+        for file in files:
+            file.refresh_from_db()
+        self.assertIsNotNone(files[0].blob_id)
+        self.assertEqual(files[0].blob_id, files[1].blob_id)
+        self.assertEqual(Blob.objects.get(pk=files[0].blob_id).ref_count, 2)
+        self.assertEqual(files[0].sha256, hashlib.sha256(b'legacy content').hexdigest())
+        self.assertEqual(set(PendingDeletion.objects.values_list('name', flat=True)), set(old_names))
+        self.assertIn('Перенесено: 0', self.run_command())
+
+    def test_file_changed_while_hashing_skipped(self):
+        file = self.legacy_file('moving.txt', b'moving content')
+        hash_stored = blobs.hash_stored
+
+        def hash_and_move(name):
+            # Пока считается хеш, файл переносится (например, reshard_storage)
+            File.objects.filter(pk=file.pk).update(file_path=f'{name}.moved')
+            return hash_stored(name)
+
+        with mock.patch('storage.blobs.hash_stored', side_effect=hash_and_move):
+            self.assertIn('изменено во время переноса: 1', self.run_command())
+
+        file.refresh_from_db()
+        self.assertIsNone(file.blob_id)
+        self.assertFalse(Blob.objects.exists())
+
+
+class UserDeletionTests(StorageTestCase):
+    """Удаление пользователя, содержимое файлов которого есть и у других"""
+
+    def share_content(self, owners):
+        users = [self.create_user(f'owner{number}') for number in range(owners)]
+        files = [self.upload(self.client_for(user), 'shared.txt', b'shared content') for user in users]
+        return users, files[0].blob_id
+
+    def assert_blob_references(self, blob_id, count):
+        self.assertEqual(Blob.objects.get(pk=blob_id).ref_count, count)
+        self.assertEqual(File.objects.filter(blob_id=blob_id).count(), count)
+
+    def test_delete_user_sharing_content_with_one_user(self):
+        users, blob_id = self.share_content(2)
+
+        users[0].delete()
+
+        self.assert_blob_references(blob_id, 1)
+        users[1].refresh_from_db()
+        self.assertEqual(users[1].file_count, 1)
+
+    def test_delete_user_sharing_content_with_two_users(self):
+        users, blob_id = self.share_content(3)
+
+        users[0].delete()
+
+        self.assert_blob_references(blob_id, 2)
+
+    def test_delete_users_queryset(self):
+        users, blob_id = self.share_content(3)
+
+        CustomUser.objects.filter(pk__in=[users[0].pk, users[1].pk]).delete()
+
+        self.assert_blob_references(blob_id, 1)
+
+
+@override_settings(STORAGE_JOBS_ENABLED=True, STORAGE_JOB_MAX_ATTEMPTS=3, STORAGE_JOB_RETRY_DELAY=10)
+class JobTests(StorageTestCase):
+    """Очередь фоновых задач: повторы с задержкой, очистка и метрики"""
+
+    def setUp(self):
+        self.handler = mock.Mock()
+        handlers = mock.patch.dict(jobs.HANDLERS, {'test': self.handler})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+        # Воркер закрывает соединение вокруг задачи, тест идёт в одной транзакции
+        close_connections = mock.patch('storage.jobs.close_old_connections')
+        close_connections.start()
+        self.addCleanup(close_connections.stop)
+
+    def run_once(self):
+        """Забирает и выполняет готовые задачи, как воркер run_jobs"""
+        return [jobs.execute(job_id) for job_id in jobs.claim(10)]
+
+    def test_done(self):
+        job = jobs.enqueue('test', value=1)
+
+        self.assertEqual(self.run_once(), [True])
+
+        self.handler.assert_called_once_with(value=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_DONE, 1))
+        self.assertEqual(self.run_once(), [])
+
+    def test_unique(self):
+        first = jobs.enqueue('test', unique=True)
+
+        self.assertIsNone(jobs.enqueue('test', unique=True))
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [first.pk])
+
+    def test_retry_with_backoff_then_fail(self):
+        self.handler.side_effect = RuntimeError('сбой')
+        job = jobs.enqueue('test')
+
+        for attempt, delay in ((1, 10), (2, 20)):
+            before = timezone.now()
+            self.assertEqual(self.run_once(), [False])
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.last_error), (Job.STATUS_PENDING, attempt, 'сбой'))
+            self.assertGreaterEqual(job.run_after, before + timedelta(seconds=delay))
+            # До истечения задержки задача не выдаётся
+            self.assertEqual(jobs.claim(10), [])
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+        self.assertEqual(self.run_once(), [False])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 3))
+        self.assertEqual(jobs.claim(10), [])
+
+    @override_settings(STORAGE_JOB_TIMEOUT=60)
+    def test_stuck_job_is_claimed_again(self):
+        job = jobs.enqueue('test')
+        self.assertEqual(jobs.claim(10), [job.pk])
+        self.assertEqual(jobs.claim(10), [])
+
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=61))
+
+        self.assertEqual(jobs.claim(10), [job.pk])
+
+    @override_settings(STORAGE_JOB_RETENTION=3600)
+    def test_prune_keeps_recent_and_unfinished(self):
+        now = timezone.now()
+        old = Job.objects.create(kind='test', status=Job.STATUS_DONE, finished_at=now - timedelta(hours=2))
+        recent = Job.objects.create(kind='test', status=Job.STATUS_DONE, finished_at=now)
+        failed = Job.objects.create(kind='test', status=Job.STATUS_FAILED, finished_at=now - timedelta(hours=2))
+        pending = Job.objects.create(kind='test')
+
+        self.assertEqual(jobs.prune(), 1)
+
+        self.assertFalse(Job.objects.filter(pk=old.pk).exists())
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, failed.pk, pending.pk})
+
+    def test_metrics(self):
+        now = timezone.now()
+        Job.objects.create(kind='test', run_after=now - timedelta(seconds=30))
+        Job.objects.create(kind='other')
+        Job.objects.create(kind='test', run_after=now + timedelta(hours=1))
+        Job.objects.create(kind='test', status=Job.STATUS_DONE, created_at=now, started_at=now - timedelta(seconds=10),
+                           finished_at=now - timedelta(seconds=4))
+        Job.objects.filter(status=Job.STATUS_DONE).update(created_at=now - timedelta(seconds=12))
+        admin = self.create_user('admin', is_staff=True)
+
+        self.assertEqual(self.client_for(self.create_user('user')).get('/api/jobs/metrics/').status_code, 403)
+        response = self.client_for(admin).get('/api/jobs/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['by_status'], {Job.STATUS_PENDING: 3, Job.STATUS_DONE: 1})
+        self.assertEqual(response.data['pending_by_kind'], {'test': 1, 'other': 1})
+        self.assertGreaterEqual(response.data['oldest_pending_age'], 30)
+        self.assertAlmostEqual(response.data['avg_wait'], 2, places=3)
+        self.assertAlmostEqual(response.data['avg_run'], 6, places=3)
+        self.assertEqual(response.data['done_last_hour'], 1)
+
+    @override_settings(STORAGE_JOBS_ENABLED=False)
+    def test_without_worker_runs_in_background_thread(self):
+        threads = []
+        self.handler.side_effect = lambda **payload: threads.append(threading.current_thread())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(jobs.enqueue('test', value=1))
+        jobs.local_runner.drain()
+
+        # Задачу выполняет не поток запроса, поставивший её
+        self.handler.assert_called_once_with(value=1)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertFalse(Job.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SKIP LOCKED проверяется на PostgreSQL')
+class JobClaimTests(TransactionTestCase):
+    """Задача, которую держит один воркер, не выдаётся другому"""
+
+    def test_locked_job_skipped(self):
+        first, second = Job.objects.create(kind='test'), Job.objects.create(kind='test')
+        locked, done = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    list(Job.objects.select_for_update().filter(pk=first.pk))
+                    locked.set()
+                    done.wait(5)
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=hold_lock)
+        worker.start()
+        try:
+            self.assertTrue(locked.wait(5))
+            self.assertEqual(jobs.claim(10), [second.pk])
+        finally:
+            done.set()
+            worker.join()
+
+        self.assertEqual(jobs.claim(10), [first.pk])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Планы запросов проверяются на PostgreSQL')
+class QueryPlanTests(StorageTestCase):
+    """EXPLAIN частых запросов API, админки и фоновых задач: ни один не должен
+    читать таблицу целиком вместо индекса"""
+
+    def setUp(self):
+        self.user = self.create_user('planner')
+        # На маленькой таблице планировщик законно выбирает полное чтение
+        # и сортировку. Со штрафом на них он берёт индекс везде, где тот
+        # подходит, и результат не зависит от объёма данных
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+
+    def hot_queries(self):
+        now = timezone.now()
+        page = settings.STORAGE_PAGE_SIZE + 1
+        files = File.objects.select_related('user')
+        own = files.filter(user=self.user)
+
+        queries = [
+            ('Файлы пользователя, новые первыми', own.order_by('-upload_date', '-id')[:page]),
+            ('Все файлы, новые первыми', files.order_by('-upload_date', '-id')[:page]),
+        ]
+        for field in ('size', 'last_download_date', 'original_name'):
+            for ordering in (field, f'-{field}'):
+                queries.append((f'Файлы пользователя, сортировка {ordering}', own.order_by(ordering)[:page]))
+                queries.append((f'Все файлы, сортировка {ordering}', files.order_by(ordering)[:page]))
+
+        queries += [
+            ('Поиск по файлам пользователя', search_files(own, 'отчёт').order_by('-search_position')[:page]),
+            ('Поиск по всем файлам', search_files(files, 'отчёт').order_by('-search_position')[:page]),
+            ('Файл по специальной ссылке', File.objects.filter(special_link='0' * 32)),
+            ('Фильтр по дате загрузки в админке',
+             files.filter(upload_date__gte=now - timedelta(days=7), upload_date__lt=now).order_by('-pk')[:100]),
+            ('Занятое место пользователя',
+             File.objects.filter(user=self.user).values('user').annotate(total=Sum('stored_size'), count=Count('id'))),
+            ('Файлы по пути в хранилище', File.objects.filter(file_path__in=['uploads/x'])),
+            ('Содержимое по пути в хранилище', Blob.objects.filter(name__in=['uploads/blobs/x'])),
+            ('Брошенные сессии загрузки',
+             UploadSession.objects.filter(status=UploadSession.STATUS_ACTIVE, updated_at__lt=now)
+             .order_by('created_at')[:500]),
+            ('Очередь фоновых задач',
+             Job.objects.filter(status=Job.STATUS_PENDING, run_after__lte=now).order_by('run_after', 'id')[:10]),
+            ('Очередь удаления',
+             PendingDeletion.objects.filter(attempts__lt=settings.STORAGE_DELETION_MAX_ATTEMPTS)
+             .order_by('id')[:settings.STORAGE_DELETION_BATCH_SIZE]),
+        ]
+        return queries
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries():
+            with self.subTest(name):
+                plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+                self.assertEqual(find_full_scans(plan), [], f"{name}:\n{queryset.explain()}")
@@ -0,0 +1,225 @@
+import os
+import shutil
+import tempfile
+import threading
+import subprocess
+import time
+import logging
+from contextlib import contextmanager
+from django.conf import settings
+from .backends import get_storage
+from .compression import iter_content
+from .responses import guess_content_type
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_CONTENT_TYPE = 'image/jpeg'
+THUMBNAIL_QUALITY = 80
+# Ограничение времени работы внешних программ (pdftoppm, ffmpeg), секунд
+CONVERT_TIMEOUT = 30
+# Кеш проверяется на превышение размера не чаще раза в столько секунд
+EVICT_INTERVAL = 60
+# Временные файлы создаваемых миниатюр и скачанных исходников: вытеснение
+# их не трогает, пока они не старше TEMP_MAX_AGE секунд (брошены упавшим процессом)
+TEMP_PREFIX = '.tmp-'
+TEMP_MAX_AGE = 3600
+
+_evict_lock = threading.Lock()
+_last_evict = 0
+
+
+def cache_dir():
+    return settings.STORAGE_THUMBNAIL_DIR
+
+
+def thumbnail_path(key, size):
+    """Путь к миниатюре в кеше производных файлов. Ключ - хеш содержимого,
+    поэтому одинаковые файлы разных пользователей делят одну миниатюру"""
+    key = str(key)
+    return os.path.join(cache_dir(), key[:2], f'{key}_{size}.jpg')
+
+
+def get_kind(filename):
+    """Вид исходного файла: image, pdf, video или None, если миниатюра невозможна"""
+    content_type = guess_content_type(filename)
+    if content_type.startswith('image/') and content_type != 'image/svg+xml':
+        return 'image'
+    if content_type == 'application/pdf':
+        return 'pdf'
+    if content_type.startswith('video/'):
+        return 'video'
+    return None
+
+
+def get_thumbnail(file, size):
+    """
+    Возвращает путь к миниатюре файла, создавая её при первом обращении,
+    или None, если для такого файла миниатюру построить нельзя.
+    """
+    path = thumbnail_path(file.etag_key, size)
+    try:
+        # Отметка последнего обращения для LRU - явно выставленное время
+        # доступа: время изменения входит в ETag и должно оставаться прежним
+        os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        return path
+    except FileNotFoundError:
+        pass
+    return generate(file, size)
+
+
+@contextmanager
+def local_source(name, encoding=''):
+    """Локальный путь к исходному файлу: из удалённого хранилища или сжатый
+    файл временно скачивается (распаковывается) в кеш миниатюр. None, если файла нет"""
+    storage = get_storage()
+    if storage.is_local and not encoding:
+        path = storage.path(name)
+        yield path if os.path.isfile(path) else None
+        return
+    if not storage.exists(name):
+        yield None
+        return
+
+    os.makedirs(cache_dir(), exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=cache_dir(), prefix=TEMP_PREFIX, suffix=os.path.splitext(name)[1])
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for block in iter_content(name, encoding):
+                f.write(block)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def generate(file, size):
+    kind = get_kind(file.original_name)
+    if kind is None:
+        return None
+
+    path = thumbnail_path(file.etag_key, size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=TEMP_PREFIX, suffix='.jpg')
+    os.close(fd)
+    try:
+        with local_source(file.file_path.name, file.encoding) as source:
+            converter = {'image': render_image, 'pdf': render_pdf, 'video': render_video}[kind]
+            if source is None or not converter(source, temp_path, size):
+                os.remove(temp_path)
+                return None
+        # Атомарная замена: параллельные запросы не увидят недописанный файл
+        os.replace(temp_path, path)
+    except Exception as e:
+        logger.error("Ошибка создания миниатюры файла с ID %s: %s", file.pk, str(e))
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+    logger.info("Создана миниатюра %dpx для файла с ID %s", size, file.pk)
+    maybe_evict()
+    return path
+
+
+def render_image(source, target, size):
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning("Pillow не установлен, миниатюры изображений недоступны")
+        return False
+
+    with Image.open(source) as image:
+        # draft позволяет декодировать JPEG сразу в уменьшенном масштабе
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, 'white')
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image.save(target, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    return True
+
+
+def render_pdf(source, target, size):
+    """Первая страница PDF через pdftoppm (poppler-utils), если он установлен"""
+    if not shutil.which('pdftoppm'):
+        return False
+    prefix = target[:-len('.jpg')]
+    subprocess.run(
+        ['pdftoppm', '-jpeg', '-f', '1', '-l', '1', '-scale-to', str(size), '-singlefile', source, prefix],
+        check=True, timeout=CONVERT_TIMEOUT, capture_output=True
+    )
+    return os.path.getsize(target) > 0
+
+
+def render_video(source, target, size):
+    """Кадр видео через ffmpeg, если он установлен"""
+    if not shutil.which('ffmpeg'):
+        return False
+    scale = f'scale={size}:{size}:force_original_aspect_ratio=decrease'
+    # Первый кадр часто чёрный, поэтому берём кадр на первой секунде,
+    # а для совсем коротких роликов - первый
+    for seek in ('1', '0'):
+        subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-ss', seek, '-i', source, '-frames:v', '1', '-vf', scale, target],
+            timeout=CONVERT_TIMEOUT, capture_output=True
+        )
+        if os.path.getsize(target) > 0:
+            return True
+    return False
+
+
+def maybe_evict():
+    global _last_evict
+
+    if time.monotonic() - _last_evict < EVICT_INTERVAL:
+        return
+    with _evict_lock:
+        if time.monotonic() - _last_evict < EVICT_INTERVAL:
+            return
+        _last_evict = time.monotonic()
+    evict()
+
+
+def evict(max_size=None):
+    """
+    Вытеснение давно не использованных миниатюр (LRU по времени доступа),
+    пока кеш не станет меньше 90% от STORAGE_THUMBNAIL_CACHE_SIZE.
+    Временные файлы идущего создания миниатюр не трогаются.
+    Возвращает число удалённых миниатюр.
+    """
+    max_size = max_size if max_size is not None else settings.STORAGE_THUMBNAIL_CACHE_SIZE
+    entries = []
+    total = 0
+    abandoned = time.time() - TEMP_MAX_AGE
+    for dirpath, _, filenames in os.walk(cache_dir()):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+                # Временный файл ещё дописывается другим запросом
+                if filename.startswith(TEMP_PREFIX):
+                    if stat.st_mtime < abandoned:
+                        os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+    if total <= max_size:
+        return 0
+
+    removed = 0
+    target = max_size * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    logger.info("Из кеша миниатюр вытеснено файлов: %d", removed)
+    return removed
@@ -0,0 +1,97 @@
+import atexit
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, DateTimeField, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadTracker:
+    """
+    Отложенная запись статистики скачиваний.
+
+    События скачивания копятся в памяти процесса и раз в
+    STORAGE_DOWNLOAD_FLUSH_INTERVAL секунд записываются фоновым потоком одним
+    UPDATE для всех скачанных файлов. При аварийном завершении процесса
+    теряются события не более чем за один интервал. Интервал 0 - запись
+    сразу в запросе, как раньше.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+
+    @property
+    def interval(self):
+        return settings.STORAGE_DOWNLOAD_FLUSH_INTERVAL
+
+    def record(self, file_id):
+        now = timezone.now()
+        if self.interval <= 0:
+            self.write({file_id: (now, 1)})
+            return
+
+        with self._lock:
+            last_date, count = self._pending.get(file_id, (now, 0))
+            self._pending[file_id] = (max(last_date, now), count + 1)
+            overflow = len(self._pending) >= settings.STORAGE_DOWNLOAD_BUFFER_MAX
+            self.ensure_worker()
+
+        if overflow:
+            self.flush()
+
+    async def arecord(self, file_id):
+        """record для асинхронных представлений: когда событие пишется в БД
+        сразу (интервал 0 или заполненный буфер), запись идёт в потоке"""
+        if self.interval <= 0 or len(self._pending) + 1 >= settings.STORAGE_DOWNLOAD_BUFFER_MAX:
+            await sync_to_async(self.record)(file_id)
+        else:
+            self.record(file_id)
+
+    def ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self.run, name='download-tracker', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Ошибка записи статистики скачиваний: %s", str(e))
+            finally:
+                connections.close_all()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self.write(pending)
+
+    def write(self, pending):
+        """Один UPDATE для всех файлов: последняя дата и прирост счётчика"""
+        from .models import File
+
+        File.objects.filter(pk__in=pending.keys()).update(
+            last_download_date=Case(
+                *[When(pk=pk, then=Value(last_date)) for pk, (last_date, _) in pending.items()],
+                output_field=DateTimeField(),
+            ),
+            download_count=F('download_count') + Case(
+                *[When(pk=pk, then=Value(count)) for pk, (_, count) in pending.items()],
+                default=Value(0),
+                output_field=PositiveIntegerField(),
+            ),
+        )
+        logger.debug("Записана статистика скачиваний для %d файлов", len(pending))
+
+
+download_tracker = DownloadTracker()
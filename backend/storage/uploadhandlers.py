@@ -0,0 +1,83 @@
+import os
+import hashlib
+import tempfile
+import logging
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from .blobs import HASH_BLOCK_SIZE, temp_dir
+
+logger = logging.getLogger(__name__)
+
+
+class HashedUploadedFile(UploadedFile):
+    """
+    Загруженный файл во временном каталоге хранилища содержимого с уже
+    посчитанными SHA-256 и размером. blobs.store_upload переносит его
+    в хранилище переименованием, без повторной записи содержимого.
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        fd, self.path = tempfile.mkstemp(dir=temp_dir())
+        super().__init__(os.fdopen(fd, 'w+b'), name, content_type, 0, charset, content_type_extra)
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.file.write(data)
+        self.size += len(data)
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        """Как у TemporaryUploadedFile: файл, не перенесённый в хранилище
+        к концу запроса, удаляется"""
+        try:
+            return self.file.close()
+        finally:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Обработчик загрузки, который пишет файл из тела запроса сразу на диск
+    хранилища и в том же проходе считает SHA-256 и размер. В отличие от
+    стандартных обработчиков файл не держится в памяти и не копируется
+    второй раз при сохранении в хранилище.
+
+    Обработчик подменяется до разбора тела запроса, поэтому в Django-
+    представлениях проверку CSRF нужно выполнять после этого (csrf_exempt
+    снаружи, csrf_protect внутри).
+    """
+    chunk_size = HASH_BLOCK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = HashedUploadedFile(self.file_name, self.content_type, self.charset,
+                                       self.content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        logger.debug("Принят файл '%s' (%d байт), SHA-256 %s", self.file_name, file_size, self.file.sha256)
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+
+def use_hashing_upload_handler(request):
+    """Загружаемые в запросе файлы принимаются HashingUploadHandler
+    (request - HttpRequest Django или Request DRF)"""
+    request = getattr(request, '_request', request)
+    request.upload_handlers = [HashingUploadHandler(request)]
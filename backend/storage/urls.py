@@ -1,14 +1,21 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'users', views.UserViewSet, basename='users')
 router.register(r'files', views.FileViewSet, basename='files')
 
 urlpatterns = [
+    # Долгие передачи обслуживаются асинхронными представлениями (async_views),
+    # приём частей загрузки перекрывает маршрут действия upload_chunk viewset
+    path('files/<int:pk>/download/', async_views.download_file, name='files-download'),
+    path('files/<int:pk>/view/', async_views.view_file, name='files-view'),
+    path('files/uploads/<uuid:upload_id>/', async_views.upload_chunk, name='files-upload-chunk'),
     path('', include(router.urls)),
     path('auth/login/', views.login_user, name='login'),
     path('auth/register/', views.register_user, name='register'),
-    path('files/download-by-link/<str:special_link>/', views.download_file_by_special_link, name='download-by-link'),
+    path('files/download-by-link/<str:special_link>/', async_views.download_file_by_special_link, name='download-by-link'),
+    path('files/signed/<str:token>/', async_views.download_file_by_signed_url, name='download-signed'),
+    path('jobs/metrics/', views.job_metrics, name='job-metrics'),
 ]
@@ -1,17 +1,34 @@
 import os
 import logging
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
-from django.http import FileResponse, Http404, HttpResponse
-from django.utils.encoding import smart_str, escape_uri_path
+from django.utils.http import content_disposition_header
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, permissions, status
+from rest_framework.filters import OrderingFilter
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.authtoken.models import Token
-from .models import File, CustomUser
+from . import bulk, jobs, thumbnails
+from .archives import stream_zip
+from .filters import FileSearchFilter
+from .models import File, CustomUser, UploadSession
+from .pagination import FileCursorPagination, UserCursorPagination
 from .permissions import IsOwnerOrReadOnly
-from .serializers import UserSerializer, FileSerializer
+from .responses import aiter_in_thread, is_asgi_request
+from .authentication import get_user_for_token
+from .backends import get_storage
+from .delivery import serve_file
+from .exceptions import QuotaExceeded
+from .tracking import download_tracker
+from .uploadhandlers import use_hashing_upload_handler
+from .signing import sign_download, get_client_ip
+from .serializers import UserSerializer, FileSerializer, UploadSessionSerializer
 from django.contrib.auth import authenticate
 
 logger = logging.getLogger(__name__)
@@ -21,6 +38,7 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UserCursorPagination
 
     filterset_fields = ['id',]
     search_fields = ['username', 'email',]
@@ -45,9 +63,9 @@ class UserViewSet(viewsets.ModelViewSet):
     def list_users(self, request):
         """Список всех пользователей (только для админов)"""
         logger.debug("Запрос списка пользователей администратором: %s", request.user.username)
-        users = CustomUser.objects.all()
+        users = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
         serializer = self.get_serializer(users, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
     def list(self, request, *args, **kwargs):
         """Запрет на просмотр списка пользователей для обычных пользователей"""
@@ -81,19 +99,35 @@ class FileViewSet(viewsets.ModelViewSet):
     queryset = File.objects.all()
     serializer_class = FileSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = FileCursorPagination
 
+    filter_backends = [DjangoFilterBackend, FileSearchFilter, OrderingFilter]
     filterset_fields = ['user', 'original_name', 'upload_date', 'last_download_date', 'comment',]
-    search_fields = ['original_name', 'comment']  
     ordering_fields = ['id', 'original_name', 'size', 'upload_date', 'last_download_date',]
 
     def get_queryset(self):
         """Фильтрация файлов по правам доступа"""
         user = self.request.user
     
+        queryset = File.objects.select_related('user')
         if user.is_staff:
-            return File.objects.all()  # Staff видит ВСЕ файлы
+            return queryset.all()  # Staff видит ВСЕ файлы
         else:
-            return File.objects.filter(user=user)  # Обычный пользователь видит только свои файлы
+            return queryset.filter(user=user)  # Обычный пользователь видит только свои файлы
+
+    def check_request_quota(self, request):
+        """Проверка квоты по Content-Length до приёма тела запроса"""
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if not request.user.has_quota_for(content_length):
+            logger.warning("Загрузка %d байт отклонена: превышена квота пользователя %s",
+                           content_length, request.user.username)
+            raise QuotaExceeded()
+
+    def create(self, request, *args, **kwargs):
+        self.check_request_quota(request)
+        # Файл пишется из тела запроса сразу на диск хранилища с подсчётом хеша
+        use_hashing_upload_handler(request)
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """Создание файла с правильной обработкой"""
@@ -107,29 +141,171 @@ class FileViewSet(viewsets.ModelViewSet):
             file_obj = self.request.FILES['file_path']
             original_name = file_obj.name
 
-            serializer.save(
+            if not self.request.user.has_quota_for(file_obj.size):
+                raise QuotaExceeded()
+
+            file = serializer.save(
                 user=self.request.user,
                 original_name=original_name,
                 size=file_obj.size,
                 file_path=file_obj
             )
+            jobs.enqueue('process_upload', file_id=file.pk)
             
             logger.info("Файл '%s' успешно загружен пользователем %s", original_name, self.request.user.username)
             
+        except QuotaExceeded:
+            logger.warning("Превышена квота пользователя %s", self.request.user.username)
+            raise
         except Exception as e:
             logger.error("Ошибка при загрузке файла: %s", str(e))
             raise ValidationError({"detail": f"Ошибка при загрузке файла: {str(e)}"})
 
+    def get_bulk_queryset(self):
+        """Файлы, которые пользователь может изменять: свои, для суперпользователя - все"""
+        queryset = self.get_queryset()
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset
+
+    @action(detail=False, methods=['post'], url_path='bulk/upload', permission_classes=[permissions.IsAuthenticated])
+    def bulk_upload(self, request):
+        """
+        Загрузка многих файлов одним multipart-запросом: поля files
+        (несколько файлов) и comments (комментарии в том же порядке).
+        """
+        self.check_request_quota(request)
+        use_hashing_upload_handler(request)
+        uploads = request.FILES.getlist('files')
+        if not uploads:
+            raise ValidationError({"detail": "Файлы не найдены в запросе"})
+        if not request.user.has_quota_for(sum(upload.size for upload in uploads)):
+            logger.warning("Загрузка %d файлов отклонена: превышена квота пользователя %s",
+                           len(uploads), request.user.username)
+            raise QuotaExceeded()
+
+        results = bulk.create_files(request.user, uploads, request.data.getlist('comments'))
+        created = [file for _, file, _ in results if file is not None]
+        data = dict(zip((file.pk for file in created), self.get_serializer(created, many=True).data))
+        return Response(
+            {'results': [
+                {'index': index, 'status': 'created', 'file': data[file.pk]} if file is not None
+                else {'index': index, 'status': 'error', 'detail': error}
+                for index, file, error in results
+            ]},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=False, methods=['post'], url_path='bulk/delete', permission_classes=[permissions.IsAuthenticated])
+    def bulk_delete(self, request):
+        """Удаление многих файлов по списку ids"""
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(file_id, int) for file_id in ids):
+            raise ValidationError({"detail": "ids должен быть списком идентификаторов файлов"})
+
+        deleted = set(bulk.delete_files(self.get_bulk_queryset().filter(pk__in=ids)))
+        logger.info("Пользователь %s удалил %d файлов из %d запрошенных",
+                    request.user.username, len(deleted), len(ids))
+        return Response({'results': [
+            {'id': file_id, 'status': 'deleted'} if file_id in deleted
+            else {'id': file_id, 'status': 'error', 'detail': "Файл не найден"}
+            for file_id in ids
+        ]})
+
+    @action(detail=False, methods=['patch'], url_path='bulk/update', permission_classes=[permissions.IsAuthenticated])
+    def bulk_update(self, request):
+        """Изменение имени и комментария многих файлов: items = [{id, original_name, comment}]"""
+        items = request.data.get('items')
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValidationError({"detail": "items должен быть списком объектов с id"})
+
+        results = bulk.update_files(self.get_bulk_queryset(), items)
+        return Response({'results': [
+            {'id': file_id, 'status': 'updated', 'file': self.get_serializer(file).data} if file is not None
+            else {'id': file_id, 'status': 'error', 'detail': error}
+            for file_id, file, error in results
+        ]})
+
+    @action(detail=False, methods=['post'], url_path='uploads', permission_classes=[permissions.IsAuthenticated])
+    def upload_init(self, request):
+        """Начало загрузки по частям (endpoint: /api/files/uploads/)"""
+        logger.debug("Начало загрузки по частям пользователем %s", request.user.username)
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not request.user.has_quota_for(serializer.validated_data['size']):
+            raise QuotaExceeded()
+        upload = serializer.save(user=request.user)
+        upload.allocate()
+
+        logger.info("Создана сессия загрузки %s для файла '%s' (%d байт)",
+                    upload.id, upload.original_name, upload.size)
+        return Response(UploadSessionSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'delete'],
+            url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)',
+            permission_classes=[permissions.IsAuthenticated])
+    def upload_chunk(self, request, upload_id=None):
+        """Состояние и отмена загрузки (endpoint: /api/files/uploads/{id}/).
+        Части файла принимает асинхронное async_views.upload_chunk"""
+        upload = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+
+        if request.method == 'GET':
+            return Response(UploadSessionSerializer(upload).data)
+
+        if upload.status == UploadSession.STATUS_ACTIVE:
+            upload.discard()
+        upload.delete()
+        logger.info("Сессия загрузки %s отменена пользователем %s", upload_id, request.user.username)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['post'],
+            url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/finalize',
+            permission_classes=[permissions.IsAuthenticated])
+    def upload_finalize(self, request, upload_id=None):
+        """Завершение загрузки по частям и создание файла"""
+        logger.debug("Завершение загрузки %s пользователем %s", upload_id, request.user.username)
+        with transaction.atomic():
+            upload = get_object_or_404(UploadSession.objects.select_for_update(),
+                                       pk=upload_id, user=request.user)
+
+            if upload.status == UploadSession.STATUS_COMPLETED and upload.file:
+                return Response(self.get_serializer(upload.file).data)
+
+            if not upload.is_complete:
+                return Response({"detail": "Файл загружен не полностью",
+                                 "missing_ranges": upload.missing_ranges()},
+                                status=status.HTTP_409_CONFLICT)
+
+            # Собранный файл получает итоговое имя, а хеш и перенос в хранилище
+            # содержимого выполняются фоновой задачей
+            get_storage().save_file(upload.part_path, upload.target_name)
+            file = File(
+                user=upload.user,
+                original_name=upload.original_name,
+                size=upload.size,
+                comment=upload.comment,
+                file_path=upload.target_name
+            )
+            file.save()
+            upload.status = UploadSession.STATUS_COMPLETED
+            upload.file = file
+            upload.save(update_fields=['status', 'file', 'updated_at'])
+            jobs.enqueue('process_upload', file_id=file.pk)
+
+        logger.info("Файл '%s' загружен по частям пользователем %s", file.original_name, request.user.username)
+        return Response(self.get_serializer(file).data, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def my_files(self, request):
         """Файлы текущего пользователя"""
         logger.debug("Запрос на получение файлов пользователя: %s", request.user.username)
         try:
-            files = File.objects.filter(user=request.user)
+            files = self.paginate_queryset(self.filter_queryset(
+                File.objects.select_related('user').filter(user=request.user)))
             serializer = self.get_serializer(files, many=True)
             logger.info("Файлы пользователя %s успешно получены (%d файлов)", 
-                       request.user.username, files.count())
-            return Response(serializer.data)
+                       request.user.username, len(files))
+            return self.get_paginated_response(serializer.data)
         except Exception as e:
             logger.error("Ошибка при получении файлов: %s", str(e))
             return Response({"detail": "Ошибка при получении файлов"}, 
@@ -193,41 +369,50 @@ class FileViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Ошибка при обновлении комментария"}, 
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
-    def download(self, request, pk=None):     
-        """Скачивание файла"""
-        logger.debug("Запрос на скачивание файла с ID %s", pk)
-        try:
-            file = self.get_object()
-            logger.debug("Найден файл: %s, пользователь: %s", file.original_name, request.user.username)
-            
-            if not file.file_path or not os.path.exists(file.file_path.path):
-                logger.error("Файл с ID %s не найден на диске", pk)
-                return Response({"detail": "Файл не найден"}, 
-                              status=status.HTTP_404_NOT_FOUND)
+    @action(detail=False, methods=['get', 'post'], permission_classes=[permissions.IsAuthenticated])
+    def archive(self, request):
+        """
+        Скачивание нескольких файлов одним ZIP-архивом, собираемым на лету.
 
-            file.last_download_date = timezone.now()
-            file.save(update_fields=['last_download_date'])
-            
-            response = FileResponse(
-                open(file.file_path.path, 'rb'),
-                as_attachment=True,
-                filename=file.original_name
-            )
-            
-            logger.info("Файл с ID %s успешно скачан пользователем %s", pk, request.user.username)
-            return response
-            
-        except Http404:
-            logger.error("Файл с ID %s не найден для пользователя %s", pk, request.user.username)
-            return Response({"detail": "Файл не найден"}, 
-                          status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            logger.error("Ошибка при скачивании файла с ID %s: %s", pk, str(e))
-            import traceback
-            logger.error(traceback.format_exc())
-            return Response({"detail": "Ошибка при скачивании файла"}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        Файлы задаются списком ids (в теле POST или ?ids=1,2,3), без него -
+        теми же фильтрами, что и список файлов. Доступ ограничивается get_queryset.
+        """
+        ids = request.data.get('ids') if request.method == 'POST' else None
+        if ids is None and request.query_params.get('ids'):
+            ids = request.query_params['ids'].split(',')
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if ids is not None:
+            try:
+                ids = [int(file_id) for file_id in ids]
+            except (TypeError, ValueError):
+                raise ValidationError({"detail": "ids должен быть списком идентификаторов файлов"})
+            queryset = queryset.filter(pk__in=ids)
+
+        max_files = settings.STORAGE_ARCHIVE_MAX_FILES
+        files = list(queryset.select_related(None).only(
+            'id', 'original_name', 'file_path', 'upload_date', 'encoding')[:max_files + 1])
+        if not files:
+            return Response({"detail": "Файлы не найдены"}, status=status.HTTP_404_NOT_FOUND)
+        if len(files) > max_files:
+            raise ValidationError({"detail": f"В архив можно добавить не более {max_files} файлов"})
+
+        for file in files:
+            download_tracker.record(file.pk)
+
+        archive_name = f'files_{timezone.localtime():%Y%m%d_%H%M%S}.zip'
+        archive = stream_zip(files)
+        # Синхронный итератор Django под ASGI собрал бы весь архив в памяти
+        if is_asgi_request(request):
+            archive = aiter_in_thread(archive)
+        response = StreamingHttpResponse(archive, content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, archive_name)
+        response['Cache-Control'] = settings.STORAGE_PRIVATE_CACHE_CONTROL
+        # Nginx не должен буферизовать архив целиком перед отдачей клиенту
+        response['X-Accel-Buffering'] = 'no'
+
+        logger.info("Архив из %d файлов отдаётся пользователю %s", len(files), request.user.username)
+        return response
 
     @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
     def get_special_link(self, request, pk=None):
@@ -244,10 +429,21 @@ class FileViewSet(viewsets.ModelViewSet):
             special_link_url = request.build_absolute_uri(
                 f'/api/files/download-by-link/{file.special_link}/'
             )
+
+            # Короткоживущая подписанная ссылка (?ttl=секунды, ?bind_ip=1)
+            try:
+                ttl = int(request.query_params.get('ttl', 0))
+            except ValueError:
+                ttl = 0
+            bind_ip = request.query_params.get('bind_ip') in ('1', 'true')
+            signed_token, expires = sign_download(file, ttl=ttl, ip=get_client_ip(request) if bind_ip else '')
+            signed_link_url = request.build_absolute_uri(f'/api/files/signed/{signed_token}/')
             
             logger.info("Специальная ссылка для файла с ID %s получена пользователем %s", pk, request.user.username)
             return Response({
                 'special_link': special_link_url,
+                'signed_link': signed_link_url,
+                'signed_link_expires': expires,
                 'file_name': file.original_name
             })
             
@@ -263,116 +459,40 @@ class FileViewSet(viewsets.ModelViewSet):
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny])
-    def view(self, request, pk=None):
-        """Просмотр файла в браузере"""
-        logger.debug("Запрос на просмотр файла с ID %s", pk)
-
+    def thumbnail(self, request, pk=None):
+        """Миниатюра изображения, PDF или видео (?size=, ?token= для тега img)"""
         token_key = request.query_params.get('token')
         if token_key:
-            try:
-                from rest_framework.authtoken.models import Token
-                token = Token.objects.get(key=token_key)
-                request.user = token.user
-            except Token.DoesNotExist:
+            user = get_user_for_token(token_key)
+            if user is None:
                 return Response({"detail": "Неверный токен"}, status=status.HTTP_401_UNAUTHORIZED)
+            request.user = user
+        if not request.user.is_authenticated:
+            return Response({"detail": "Требуется авторизация"}, status=status.HTTP_401_UNAUTHORIZED)
 
         try:
-            file = File.objects.get(id=pk)
-        
-            if not file.file_path or not os.path.exists(file.file_path.path):
-                return Response({"detail": "Файл не найден"}, status=status.HTTP_404_NOT_FOUND)
-
-            file.last_download_date = timezone.now()
-            file.save(update_fields=['last_download_date'])
-
-            # Определяем content_type
-            file_extension = os.path.splitext(file.original_name)[1].lower()
-            content_types = {
-                '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
-                '.gif': 'image/gif', '.bmp': 'image/bmp', '.svg': 'image/svg+xml',
-                '.webp': 'image/webp', '.pdf': 'application/pdf',
-                '.txt': 'text/plain', '.html': 'text/html', '.htm': 'text/html',
-                '.css': 'text/css', '.js': 'application/javascript',
-                '.json': 'application/json', '.xml': 'application/xml',
-                '.mp3': 'audio/mpeg', '.mp4': 'video/mp4',
-                '.webm': 'video/webm', '.ogg': 'audio/ogg',
-            }
-            
-            content_type = content_types.get(file_extension, 'application/octet-stream')
-            
-            # Открываем файл
-            with open(file.file_path.path, 'rb') as f:
-                file_content = f.read()
-            
-            # Создаем HttpResponse с правильным кодированием
-            response = HttpResponse(file_content, content_type=content_type)
-            
-            # Определяем, показывать или скачивать
-            show_in_browser = any(content_type.startswith(t) for t in 
-                                 ['image/', 'text/', 'application/pdf', 'audio/', 'video/'])
-            
-            # Правильное кодирование для русских имен
-            filename_encoded = escape_uri_path(file.original_name)
-            
-            if show_in_browser:
-                # Для совместимости со всеми браузерами
-                response['Content-Disposition'] = f'inline; filename="{filename_encoded}"; filename*=UTF-8\'\'{file.original_name}'
-                logger.info("Файл отображается в браузере: %s", file.original_name)
-            else:
-                response['Content-Disposition'] = f'attachment; filename="{filename_encoded}"; filename*=UTF-8\'\'{file.original_name}'
-                logger.info("Файл отправлен на скачивание: %s", file.original_name)
-            
-            return response
-        
-        except File.DoesNotExist:
-            return Response({"detail": "Файл не найден"}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            logger.error("Ошибка при просмотре файла: %s", str(e))
-            return Response({"detail": "Ошибка при просмотре файла"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            size = int(request.query_params.get('size', settings.STORAGE_THUMBNAIL_DEFAULT_SIZE))
+        except ValueError:
+            size = None
+        if size not in settings.STORAGE_THUMBNAIL_SIZES:
+            raise ValidationError({"detail": f"Допустимые размеры миниатюр: {settings.STORAGE_THUMBNAIL_SIZES}"})
+
+        file = get_object_or_404(self.get_queryset(), pk=pk)
+        path = thumbnails.get_thumbnail(file, size)
+        if path is None:
+            return Response({"detail": "Миниатюра для этого файла недоступна"}, status=status.HTTP_404_NOT_FOUND)
+
+        name = f'{os.path.splitext(file.original_name)[0]}_{size}.jpg'
+        return serve_file(request, path, name, content_type=thumbnails.THUMBNAIL_CONTENT_TYPE,
+                          as_attachment=False, etag_key=f'{file.etag_key}-{size}',
+                          cache_control=settings.STORAGE_THUMBNAIL_CACHE_CONTROL)
 
 
 @api_view(['GET'])
-def download_file_by_special_link(request, special_link):
-    """Скачивание файла по специальной ссылке"""
-    logger.debug("Запрос на скачивание файла по специальной ссылке: %s", special_link)
-    try:
-        file_instance = File.objects.get(special_link=special_link)
-        file_path = file_instance.file_path.path
-
-        if not os.path.exists(file_path):
-            logger.warning("Файл не найден на диске по специальной ссылке: %s", special_link)
-            raise Http404("Файл не найден.")
-
-        file_instance.last_download_date = timezone.now()
-        file_instance.save(update_fields=['last_download_date'])
-
-        # Открываем файл в бинарном режиме
-        file_handle = open(file_path, 'rb')
-        
-        # Создаем FileResponse с правильными заголовками
-        response = FileResponse(
-            file_handle,
-            content_type='application/octet-stream',
-            as_attachment=True,
-            filename=file_instance.original_name
-        )
-        
-        # Добавляем дополнительные заголовки для браузеров
-        response['Content-Length'] = os.path.getsize(file_path)
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
-        
-        logger.info("Файл по специальной ссылке '%s' успешно скачан", special_link)
-        return response
-        
-    except File.DoesNotExist:
-        logger.error("Файл с специальной ссылкой '%s' не найден в базе данных", special_link)
-        raise Http404("Файл не найден.")
-    except Exception as e:
-        logger.error("Ошибка при скачивании файла по специальной ссылке '%s': %s", special_link, str(e))
-        return Response({"detail": "Ошибка при скачивании файла"}, 
-                      status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+@permission_classes([permissions.IsAdminUser])
+def job_metrics(request):
+    """Метрики очереди фоновых задач: глубина и задержки"""
+    return Response(jobs.metrics())
 
 
 @api_view(['POST'])
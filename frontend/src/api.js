@@ -10,13 +10,20 @@ export const loginUser = async (credentials) => {
     return await axios.post(`${API_URL}auth/login/`, credentials);
 };
 
-export const fetchFiles = async (token) => {
-    return await axios.get(`${API_URL}files/`, {
+// Списки отдаются постранично (курсор в поле next): запрашивается одна
+// страница, следующая - по ссылке next, когда пользователь её попросит
+const fetchPage = async (url, token) => {
+    const response = await axios.get(url, {
         headers: {
             Authorization: `Token ${token}`,
         },
         withCredentials: true,
     });
+    return { ...response, data: response.data.results, next: response.data.next };
+};
+
+export const fetchFiles = async (token, pageUrl = null) => {
+    return await fetchPage(pageUrl || `${API_URL}files/`, token);
 };
 
 export const uploadFile = async (file, comment, token) => {
@@ -59,22 +66,12 @@ export const deleteFile = async (fileId, token) => {
     });
 };
 
-export const fetchUsers = async (token) => {
-    return await axios.get(`${API_URL}users/list_users/`, {
-        headers: {
-            Authorization: `Token ${token}`,
-        },
-        withCredentials: true,
-    });
+export const fetchUsers = async (token, pageUrl = null) => {
+    return await fetchPage(pageUrl || `${API_URL}users/list_users/`, token);
 };
 
-export const fetchMyFiles = async (token) => {
-    return await axios.get(`${API_URL}files/my_files/`, {
-        headers: {
-            Authorization: `Token ${token}`,
-        },
-        withCredentials: true,
-    });
+export const fetchMyFiles = async (token, pageUrl = null) => {
+    return await fetchPage(pageUrl || `${API_URL}files/my_files/`, token);
 };
 
 export const fetchUserData = async (token) => {
@@ -106,6 +103,16 @@ export const downloadFile = async (fileId, token) => {
     });
 };
 
+export const downloadArchive = async (fileIds, token) => {
+    return await axios.post(`${API_URL}files/archive/`, { ids: fileIds }, {
+        headers: {
+            Authorization: `Token ${token}`,
+        },
+        responseType: 'blob',
+        withCredentials: true,
+    });
+};
+
 export const getShareLink = async (fileId, token) => {
     return await axios.get(`${API_URL}files/${fileId}/get_special_link/`, {
         headers: {
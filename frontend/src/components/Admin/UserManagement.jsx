@@ -5,6 +5,7 @@ import './Admin.module.css';
 
 const UserManagement = () => {
     const [users, setUsers] = useState([]);
+    const [nextUrl, setNextUrl] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
     const [isInitialized, setIsInitialized] = useState(false);
@@ -38,7 +39,9 @@ const UserManagement = () => {
         return () => clearTimeout(timer);
     }, []);
 
-    const fetchUsers = async () => {
+    // pageUrl - ссылка next на следующую страницу: её пользователи
+    // добавляются к уже загруженным
+    const fetchUsers = async (pageUrl = null) => {
         try {
             console.log('UserManagement: Starting fetchUsers...');
             const token = localStorage.getItem('token');
@@ -51,7 +54,7 @@ const UserManagement = () => {
             
             await new Promise(resolve => setTimeout(resolve, 500));
             
-            const response = await fetch('/api/users/list_users/', {
+            const response = await fetch(pageUrl || '/api/users/list_users/', {
                 headers: {
                     'Authorization': `Token ${token}`,
                     'Content-Type': 'application/json'
@@ -78,7 +81,12 @@ const UserManagement = () => {
             const data = await response.json();
             console.log('UserManagement: Users received:', data);
             
-            setUsers(Array.isArray(data) ? data : [data]);
+            const page = data.results ?? data;
+            const pageUsers = Array.isArray(page) ? page : [page];
+            setUsers(prev => pageUrl
+                ? [...prev, ...pageUsers.filter(user => !prev.some(p => p.id === user.id))]
+                : pageUsers);
+            setNextUrl(data.next ?? null);
             setError('');
             
         } catch (err) {
@@ -265,7 +273,7 @@ const UserManagement = () => {
                 <h3>👥 Управление пользователями</h3>
                 <div className="header-actions">
                     <span className="total-users">Всего: {users.length}</span>
-                    <button onClick={fetchUsers} className="refresh-btn">
+                    <button onClick={() => fetchUsers()} className="refresh-btn">
                         🔄 Обновить
                     </button>
                 </div>
@@ -352,6 +360,12 @@ const UserManagement = () => {
                         <p>📭 Пользователи не найдены</p>
                     </div>
                 )}
+                
+                {nextUrl && (
+                    <button onClick={() => fetchUsers(nextUrl)} className="load-more-btn">
+                        Загрузить ещё
+                    </button>
+                )}
             </div>
             
             <div className="user-stats">
@@ -3,7 +3,7 @@ import { useDispatch, useSelector } from 'react-redux';
 import { useNavigate } from 'react-router-dom';
 import { FaSort, FaPlus } from 'react-icons/fa';
 import FileList from '../File/FileList/FileList';
-import { logout, upload, loadFiles, loadUsers } from '../../redux/actions';
+import { logout, upload, loadFiles, loadUsers, loadMoreUsers } from '../../redux/actions';
 import logo from '../../assets/logo.jpg';
 import userLogo from '../../assets/user.png';
 import styles from './Dashboard.module.css';
@@ -135,6 +135,7 @@ export const Dashboard = () => {
 
     // Получаем users из Redux state
     const usersFromRedux = useSelector((state) => state.users);
+    const usersNext = useSelector((state) => state.usersNext);
 
     return (
         <div className={styles.dashboard}>
@@ -181,6 +182,15 @@ export const Dashboard = () => {
                                 ))}
                             </select>
                         )}
+                        {viewMode === 'all' && usersNext && (
+                            <button
+                                onClick={() => dispatch(loadMoreUsers(token))}
+                                className={styles.moreUsers}
+                                title="Загрузить следующих пользователей в список"
+                            >
+                                Ещё пользователи
+                            </button>
+                        )}
                     </div>
                 )}
                 
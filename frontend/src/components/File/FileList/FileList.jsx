@@ -2,9 +2,11 @@ import { useState, useEffect } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { 
     loadFiles, 
+    loadMoreFiles,
     deleteFileAction, 
     viewFile, 
     downloadFile, 
+    downloadArchive,
     getShareLink,
     updateCommentAction,
     updateFileNameAction
@@ -13,6 +15,12 @@ import styles from './FileList.module.css';
 
 const API_URL = import.meta.env.VITE_API_URL;
 
+// Файлы, для которых сервер строит миниатюры
+const PREVIEW_EXTENSIONS = ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'pdf', 'mp4', 'webm'];
+
+const hasPreview = (fileName = '') =>
+    PREVIEW_EXTENSIONS.includes(fileName.split('.').pop().toLowerCase());
+
 const FileList = ({ 
     searchText = '', 
     sortField = 'original_name', 
@@ -27,9 +35,12 @@ const FileList = ({
     const [newComment, setNewComment] = useState('');
     const [newFileName, setNewFileName] = useState('');
     const [localError, setLocalError] = useState(null);
+    const [selectedIds, setSelectedIds] = useState([]);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
     
     const dispatch = useDispatch();
     const reduxFiles = useSelector((state) => state.files);
+    const filesNext = useSelector((state) => state.filesNext);
     const token = localStorage.getItem('token');
 
     // ==== ЗАЩИТА: гарантируем, что files - это массив ====
@@ -189,6 +200,38 @@ const FileList = ({
         dispatch(downloadFile(fileId, token));
     };
 
+    const toggleSelected = (fileId) => {
+        setSelectedIds(prev => prev.includes(fileId)
+            ? prev.filter(id => id !== fileId)
+            : [...prev, fileId]);
+    };
+
+    const toggleSelectAll = () => {
+        const visibleIds = processedFiles.map(file => file.id);
+        const allSelected = visibleIds.every(id => selectedIds.includes(id));
+        setSelectedIds(allSelected ? [] : visibleIds);
+    };
+
+    // Выбранные файлы скачиваются одним ZIP-архивом вместо отдельных запросов
+    const handleDownloadSelected = () => {
+        dispatch(downloadArchive(selectedIds, token))
+            .catch(error => {
+                console.error('Ошибка скачивания архива:', error);
+                alert('Не удалось скачать выбранные файлы');
+            });
+    };
+
+    // Следующая страница списка загружается только по запросу пользователя
+    const handleLoadMore = () => {
+        setIsLoadingMore(true);
+        dispatch(loadMoreFiles(token))
+            .catch(error => {
+                console.error('Ошибка загрузки файлов:', error);
+                alert('Не удалось загрузить следующие файлы');
+            })
+            .finally(() => setIsLoadingMore(false));
+    };
+
     const handleShare = (fileId) => {
         dispatch(getShareLink(fileId, token));
     };
@@ -281,6 +324,15 @@ const FileList = ({
                     {processedFiles.length} {processedFiles.length === 1 ? 'файл' : 
                       processedFiles.length >= 2 && processedFiles.length <= 4 ? 'файла' : 'файлов'}
                 </span>
+                {selectedIds.length > 0 && (
+                    <button 
+                        onClick={handleDownloadSelected}
+                        className={styles.archiveBtn}
+                        title="Скачать выбранные файлы одним архивом"
+                    >
+                        ⬇️ Скачать выбранные ({selectedIds.length})
+                    </button>
+                )}
             </h2>
             
             {processedFiles.length === 0 ? (
@@ -294,6 +346,14 @@ const FileList = ({
                     <table className={styles.table}>
                         <thead>
                             <tr>
+                                <th>
+                                    <input
+                                        type="checkbox"
+                                        checked={processedFiles.length > 0 && processedFiles.every(file => selectedIds.includes(file.id))}
+                                        onChange={toggleSelectAll}
+                                        title="Выбрать все"
+                                    />
+                                </th>
                                 <th>Имя файла</th>
                                 {viewMode === 'all' && <th>Владелец</th>}
                                 <th>Размер</th>
@@ -308,6 +368,13 @@ const FileList = ({
                                     key={file.id || `temp-${index}`} 
                                     className={styles.fileRow}
                                 >
+                                    <td>
+                                        <input
+                                            type="checkbox"
+                                            checked={selectedIds.includes(file.id)}
+                                            onChange={() => toggleSelected(file.id)}
+                                        />
+                                    </td>
                                     {/* Имя файла */}
                                     <td>
                                         {editingFileNameId === file.id ? (
@@ -336,6 +403,16 @@ const FileList = ({
                                             </div>
                                         ) : (
                                             <div className={styles.fileName}>
+                                                {hasPreview(file.original_name) && (
+                                                    <img
+                                                        src={`${API_URL}files/${file.id}/thumbnail/?size=64&token=${token}`}
+                                                        alt=""
+                                                        loading="lazy"
+                                                        className={styles.thumbnail}
+                                                        onClick={() => handleView(file.id)}
+                                                        onError={(e) => { e.currentTarget.style.display = 'none'; }}
+                                                    />
+                                                )}
                                                 <span 
                                                     className={styles.fileNameText}
                                                     onClick={() => startEditFileName(file)}
@@ -450,6 +527,16 @@ const FileList = ({
                     </table>
                 </div>
             )}
+
+            {filesNext && (
+                <button
+                    onClick={handleLoadMore}
+                    className={styles.loadMoreBtn}
+                    disabled={isLoadingMore}
+                >
+                    {isLoadingMore ? 'Загрузка...' : 'Загрузить ещё'}
+                </button>
+            )}
         </div>
     );
 };
@@ -1,7 +1,8 @@
 import { 
     registerUser, loginUser, fetchFiles, uploadFile, deleteFile, 
     fetchUsers, fetchUserData, updateComment, updateFileName,
-    viewFile as viewFileAPI, downloadFile as downloadFileAPI, getShareLink as getShareLinkAPI 
+    viewFile as viewFileAPI, downloadFile as downloadFileAPI, getShareLink as getShareLinkAPI,
+    downloadArchive as downloadArchiveAPI 
 } from '../api';
 
 export const setUser = (user) => ({
@@ -14,6 +15,16 @@ export const setFiles = (files) => ({
     payload: files,
 });
 
+export const appendFiles = (files) => ({
+    type: 'APPEND_FILES',
+    payload: files,
+});
+
+export const setFilesNext = (next) => ({
+    type: 'SET_FILES_NEXT',
+    payload: next,
+});
+
 export const addFile = (file) => ({
     type: 'ADD_FILE',
     payload: file,
@@ -29,6 +40,16 @@ export const setUsers = (users) => ({
     payload: users,
 });
 
+export const appendUsers = (users) => ({
+    type: 'APPEND_USERS',
+    payload: users,
+});
+
+export const setUsersNext = (next) => ({
+    type: 'SET_USERS_NEXT',
+    payload: next,
+});
+
 export const updateCommentSuccess = (file) => ({
     type: 'UPDATE_COMMENT_SUCCESS',
     payload: { file },
@@ -127,6 +148,16 @@ export const logout = () => async (dispatch) => {
 export const loadFiles = (token) => async (dispatch) => {
     const response = await fetchFiles(token);
     dispatch(setFiles(response.data));
+    dispatch(setFilesNext(response.next));
+};
+
+// Следующая страница списка файлов по курсору из предыдущего ответа
+export const loadMoreFiles = (token) => async (dispatch, getState) => {
+    const next = getState().filesNext;
+    if (!next) return;
+    const response = await fetchFiles(token, next);
+    dispatch(appendFiles(response.data));
+    dispatch(setFilesNext(response.next));
 };
 
 export const upload = (file, comment, token) => async (dispatch) => {
@@ -173,6 +204,7 @@ export const loadUsers = (token) => async (dispatch) => {
     try {
         const response = await fetchUsers(token);
         dispatch(setUsers(response.data));
+        dispatch(setUsersNext(response.next));
     } catch (error) {
         if (error.response && error.response.status === 403) {
             console.error("Доступ запрещен: вы не являетесь администратором.");
@@ -182,6 +214,18 @@ export const loadUsers = (token) => async (dispatch) => {
     }
 };
 
+export const loadMoreUsers = (token) => async (dispatch, getState) => {
+    const next = getState().usersNext;
+    if (!next) return;
+    try {
+        const response = await fetchUsers(token, next);
+        dispatch(appendUsers(response.data));
+        dispatch(setUsersNext(response.next));
+    } catch (error) {
+        console.error("Ошибка при загрузке пользователей:", error);
+    }
+};
+
 export const checkAuth = () => async (dispatch) => {
     const token = localStorage.getItem('token');
     console.log("checkAuth: Token from localStorage:", token ? "Exists" : "Missing");
@@ -273,6 +317,36 @@ export const downloadFile = (fileId, token) => async (dispatch) => {
     }
 };
 
+export const downloadArchive = (fileIds, token) => async (dispatch) => {
+    try {
+        const response = await downloadArchiveAPI(fileIds, token);
+
+        const url = window.URL.createObjectURL(new Blob([response.data]));
+        const link = document.createElement('a');
+        link.href = url;
+
+        const contentDisposition = response.headers['content-disposition'];
+        let fileName = 'files.zip';
+
+        if (contentDisposition) {
+            const fileNameMatch = contentDisposition.match(/filename="(.+)"/);
+            if (fileNameMatch && fileNameMatch[1]) {
+                fileName = fileNameMatch[1];
+            }
+        }
+
+        link.setAttribute('download', fileName);
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+        window.URL.revokeObjectURL(url);
+
+    } catch (error) {
+        console.error("Ошибка при скачивании архива:", error);
+        throw new Error("Не удалось скачать архив");
+    }
+};
+
 export const getShareLink = (fileId, token) => async (dispatch) => {
     try {
         const response = await getShareLinkAPI(fileId, token);
@@ -2,6 +2,16 @@ const initialState = {
     user: null,
     files: [],
     users: [],
+    // Ссылки на следующие страницы списков (null - загружено всё)
+    filesNext: null,
+    usersNext: null,
+};
+
+// Новая страница добавляется без записей, которые уже есть в списке
+// (например, загруженного после открытия списка файла)
+const appendUnique = (items, page) => {
+    const ids = new Set(items.map(item => item.id));
+    return [...items, ...page.filter(item => !ids.has(item.id))];
 };
 
 export const rootReducer = (state = initialState, action) => {
@@ -16,12 +26,20 @@ export const rootReducer = (state = initialState, action) => {
             return { ...state, user: action.payload };
         case 'SET_FILES':
             return { ...state, files: action.payload };
+        case 'APPEND_FILES':
+            return { ...state, files: appendUnique(state.files, action.payload) };
+        case 'SET_FILES_NEXT':
+            return { ...state, filesNext: action.payload };
         case 'ADD_FILE':
             return { ...state, files: [...state.files, action.payload] };
         case 'REMOVE_FILE':
             return { ...state, files: state.files.filter(file => file.id !== action.payload) };
         case 'SET_USERS':
             return { ...state, users: action.payload };
+        case 'APPEND_USERS':
+            return { ...state, users: appendUnique(state.users, action.payload) };
+        case 'SET_USERS_NEXT':
+            return { ...state, usersNext: action.payload };
         case 'UPDATE_COMMENT_SUCCESS':
             return {
                 ...state,